@@ -5,12 +5,18 @@ from mysql.connector import Error
 import os
 from datetime import datetime, date, timedelta
 import pandas as pd
-from utils.power_nasa_utils import get_data as get_meteo_data
-from utils.fire_index_utils import get_data_with_fire_indexes
-from utils.maryland_fuoco_utils import get_daily_burned_area_data
-from utils.gfed_utils import get_gfed_emissions_data_for_range as get_emissions_data
+from utils.meteo_utils import get_meteo_data
+from utils.fire_index_utils import get_data_with_fire_indexes, get_fire_indexes_state
+from utils.maryland_fuoco_utils import get_daily_burned_area_window
+from utils.gfed_utils import get_gfed_emissions_window
+from utils.grid_utils import GFED_GRID, join_window_cubes
+from utils.database_utils import DatabasePool, DATABASE_POOL_SIZE
+from utils.custom_exceptions import DatabaseURLException
 import numpy as np
 import concurrent.futures
+import threading
+import queue
+import time
 import logging
 from typing import Literal
 
@@ -20,27 +26,57 @@ logging.getLogger().setLevel(logging.CRITICAL)
 WILFIRES_DATA_INSERT_QUERY = open('sql/wildfires_data_insert.sql').read()
 DATASETS_INSERT_QUERY = open('sql/datasets_insert.sql').read()
 DATASETS_UPDATE_QUERY = open('sql/datasets_update.sql').read()
+DATASETS_EXTEND_QUERY = open('sql/datasets_extend.sql').read()
+FWI_STATE_INSERT_QUERY = open('sql/fwi_state_insert.sql').read()
+FWI_STATE_QUERY = open('sql/fwi_state_query.sql').read()
+STAGING_CREATE_QUERY = open('sql/wildfires_data_staging_create.sql').read()
+STAGING_INSERT_QUERY = open('sql/wildfires_data_staging_insert.sql').read()
+STAGING_MERGE_QUERY = open('sql/wildfires_data_staging_merge.sql').read()
+STAGING_CLEAR_QUERY = open('sql/wildfires_data_staging_clear.sql').read()
+
+ROW_MEMORY_SIZE = 2048 # Estimated peak memory in bytes used by a row of data through the loading pipeline
+BULK_BATCH_SIZE = 10000 # Number of rows inserted and committed at once by the bulk loader
+WRITER_QUEUE_SIZE = 2 # Maximum number of generated chunks waiting to be inserted by the database writer
+
+database_pool = None # Pool of connections shared by the steps of the script, created on first use
+database_pool_lock = threading.Lock()
+
+def get_database_pool(pool_size=DATABASE_POOL_SIZE) -> DatabasePool:
+    """
+    Gets the pool of connections shared by the script, created from the DATABASE_URL environment variable 
+    (the same as the Flask app) the first time it's needed.
+
+    Parameters
+    ----------
+    pool_size : int
+        number of connections of the pool if it's created. Default is 4.
+
+    Returns
+    -------
+    out : DatabasePool
+        the shared pool.
+    """
+    global database_pool
+    with database_pool_lock:
+        if database_pool == None:
+            database_pool = DatabasePool(os.environ['DATABASE_URL'], pool_size=pool_size)
+    return database_pool
 
 # Connect to database
 def connect_to_database():
     """
-    Connect to the database and returns a connection instance if the connexion was successfull. 
-    Otherwise it returns None.
+    Takes a connection from the shared pool and returns it if the connexion was successfull. 
+    Otherwise it returns None. Closing the connection gives it back to the pool.
     
     Returns
     -------
-    connection : PooledMySQLConnection | MySQLConnectionAbstract | None
-        the created connection.
+    connection : PooledMySQLConnection | None
+        the connection.
     """
     connection = None
     try:
-        connection = mysql.connector.connect(
-            host=os.environ['DATABASE_HOST'],
-            user=os.environ['DATABASE_USERNAME'],
-            passwd=os.environ['DATABASE_PASSWORD'],
-            database=os.environ['DATABASE_NAME']
-        )
-    except Error as err:
+        connection = get_database_pool().get_connection()
+    except (Error, DatabaseURLException) as err:
         print(f"Error: '{err}'")
     return connection
 
@@ -109,10 +145,214 @@ def execute_dml_query(connection:mysql.connector.connection.MySQLConnection, que
     cursor.close()
     return res
 
-def load_dataframe_to_db(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, 
-                         dataset_id:int=None, date_interval_size:int=None, show_progress=Literal['none', 'all', 'meteo']):
+def bulk_insert_dataframe(connection:mysql.connector.connection.MySQLConnection, df:pd.DataFrame, dataset_id:int=None, 
+                          batch_size=BULK_BATCH_SIZE) -> dict:
+    """
+    Inserts a dataframe into wildfires_data by batches. Each batch is inserted with multi-row INSERTs into a temporary 
+    staging table, then merged into wildfires_data with a single INSERT IGNORE ... SELECT and committed, so an error 
+    only loses its batch. Rows of the dataframe must be in the order of the columns of WILFIRES_DATA_INSERT_QUERY 
+    (without dataset_id).
+
+    Parameters
+    ----------
+    connection : MySQLConnection
+        the specific MySQL connection.
+    df : pandas.DataFrame
+        the rows to insert.
+    dataset_id : int
+        id of the dataset to link rows to. Default is None.
+    batch_size : int
+        number of rows inserted and committed at once. Default is 10000.
+
+    Returns
+    -------
+    out : dict
+        number of rows 'inserted', 'skipped' (already in the table) and 'failed' (in batches that couldn't be inserted).
+    """
+    stats = {'inserted': 0, 'skipped': 0, 'failed': 0}
+    cursor = connection.cursor()
+    try:
+        cursor.execute(STAGING_CREATE_QUERY)
+    except Error as err:
+        print(f"Error: '{err}'")
+        cursor.close()
+        stats['failed'] = df.shape[0]
+        return stats
+
+    values = df.values
+    for start in range(0, values.shape[0], batch_size):
+        # Rows are only turned into tuples one batch at a time
+        batch = [(*row, dataset_id) for row in values[start:start + batch_size]]
+        try:
+            cursor.execute(STAGING_CLEAR_QUERY)
+            cursor.executemany(STAGING_INSERT_QUERY, batch)
+            # Rows whose key already exists are ignored by the merge
+            cursor.execute(STAGING_MERGE_QUERY)
+            inserted = cursor.rowcount
+            cursor.execute(STAGING_CLEAR_QUERY)
+            connection.commit()
+            stats['inserted'] += inserted
+            stats['skipped'] += len(batch) - inserted
+        except Error as err:
+            print(f"Error: '{err}'")
+            connection.rollback()
+            stats['failed'] += len(batch)
+
+    cursor.close()
+    return stats
+
+def insert_chunk(connection:mysql.connector.connection.MySQLConnection, df:pd.DataFrame, fwi_state_df:pd.DataFrame=None, 
+                 dataset_id:int=None, insert_batch_size:int=BULK_BATCH_SIZE) -> dict:
+    """
+    Inserts the data of a chunk into wildfires_data, and saves the moisture codes of its last day if fwi_state_df is given.
+
+    Parameters
+    ----------
+    connection : MySQLConnection
+        the specific MySQL connection.
+    df : pandas.DataFrame
+        the rows to insert, as returned by get_chunk_data.
+    fwi_state_df : pandas.DataFrame
+        moisture codes to save in the fwi_state table. Default is None (nothing is saved).
+    dataset_id : int
+        id of the dataset to link rows to. Default is None.
+    insert_batch_size : int
+        number of rows inserted and committed at once through a staging table (see bulk_insert_dataframe). 
+        If None, the chunk is inserted with a single INSERT IGNORE. Default is 10000.
+
+    Returns
+    -------
+    out : dict
+        number of rows 'inserted', 'skipped' (already in the table) and 'failed'.
+    """
+    if connection == None:
+        return {'inserted': 0, 'skipped': 0, 'failed': df.shape[0]}
+
+    if insert_batch_size != None:
+        stats = bulk_insert_dataframe(connection, df, dataset_id, batch_size=insert_batch_size)
+    else:
+        insert_values = [(*row, dataset_id) for row in df.values]
+        res = execute_dml_query(connection, WILFIRES_DATA_INSERT_QUERY, insert_values, many=True)
+        del insert_values
+        if res != None:
+            stats = {'inserted': res[1], 'skipped': df.shape[0] - res[1], 'failed': 0}
+        else:
+            stats = {'inserted': 0, 'skipped': 0, 'failed': df.shape[0]}
+
+    if fwi_state_df is not None:
+        state_values = [(float(row[0]), float(row[1]), datetime.date(row[2]), float(row[3]), float(row[4]), float(row[5])) for row in fwi_state_df.values]
+        execute_dml_query(connection, FWI_STATE_INSERT_QUERY, state_values, many=True)
+
+    return stats
+
+class DatabaseWriter:
     """
-    Loads data into database for a specific geographical and time range.
+    Write-behind stage of the loading pipeline. Generated chunks are put in a bounded queue and inserted by a 
+    dedicated thread, so the next chunks are generated while the previous ones are inserted. The writer takes a 
+    connection of the pool for each chunk and gives it back once the chunk is inserted, so it never holds a 
+    connection other steps are waiting for between chunks. When the queue is full, put blocks until the writer 
+    catches up, which bounds the memory used by chunks waiting to be inserted.
+
+    Parameters
+    ----------
+    queue_size : int
+        maximum number of chunks waiting in the queue. Default is 2.
+    insert_batch_size : int
+        number of rows inserted and committed at once (see insert_chunk). Default is 10000.
+    show_progress : bool
+        if set to True, prints the statistics of each chunk inserted. Default is False.
+    """
+
+    def __init__(self, queue_size=WRITER_QUEUE_SIZE, insert_batch_size:int=BULK_BATCH_SIZE, show_progress=False):
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.insert_batch_size = insert_batch_size
+        self.show_progress = show_progress
+        self.lock = threading.Lock()
+        self.stats = {'queued': 0, 'chunks': 0, 'inserted': 0, 'skipped': 0, 'failed': 0, 'max_queue_depth': 0, 'queue_depth_sum': 0,
+                      'put_wait_time': 0.0, 'write_time': 0.0}
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, df:pd.DataFrame, fwi_state_df:pd.DataFrame=None, dataset_id:int=None):
+        """Queues a chunk to insert (see insert_chunk), blocks while the queue is full."""
+        start = time.perf_counter()
+        self.queue.put((df, fwi_state_df, dataset_id))
+        with self.lock:
+            depth = self.queue.qsize()
+            self.stats['queued'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], depth)
+            self.stats['queue_depth_sum'] += depth
+            self.stats['put_wait_time'] += time.perf_counter() - start
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item == None:
+                break
+            df, fwi_state_df, dataset_id = item
+            start = time.perf_counter()
+            connection = None
+            try:
+                # A lost connection is reconnected when it's taken from the pool
+                connection = connect_to_database()
+                chunk_stats = insert_chunk(connection, df, fwi_state_df, dataset_id, self.insert_batch_size)
+            except Exception as err:
+                # The writer must keep consuming the queue, or producers would wait forever
+                print(f"Error: '{err}'")
+                chunk_stats = {'inserted': 0, 'skipped': 0, 'failed': df.shape[0]}
+            if connection != None:
+                self.close_connection(connection)
+
+            with self.lock:
+                self.stats['chunks'] += 1
+                self.stats['write_time'] += time.perf_counter() - start
+                for key in ('inserted', 'skipped', 'failed'):
+                    self.stats[key] += chunk_stats[key]
+            if self.show_progress:
+                print(f"Chunk inserted: {chunk_stats}, {self.queue.qsize()} chunk(s) waiting")
+            del df, fwi_state_df, item
+
+    def close_connection(self, connection:mysql.connector.connection.MySQLConnection):
+        """Gives a connection back to the pool, a connection that was lost can fail to close."""
+        try:
+            connection.close()
+        except Error as err:
+            print(f"Error: '{err}'")
+
+    def get_stats(self) -> dict:
+        """
+        Gets the statistics of the writer.
+
+        Returns
+        -------
+        out : dict
+            number of chunks 'queued' and written ('chunks'), of rows 'inserted', 'skipped' and 'failed', 'max_queue_depth' and 'mean_queue_depth' 
+            seen by producers after putting a chunk, 'put_wait_time' spent by producers blocked on a full queue, 'write_time' 
+            spent inserting, 'elapsed_time' since the writer started and throughput in 'rows_per_second' of write time, in seconds.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        depth_sum = stats.pop('queue_depth_sum')
+        stats['mean_queue_depth'] = depth_sum / stats['queued'] if stats['queued'] > 0 else 0.0
+        stats['elapsed_time'] = time.perf_counter() - self.start_time
+        stats['rows_per_second'] = (stats['inserted'] + stats['skipped']) / stats['write_time'] if stats['write_time'] > 0 else 0.0
+        return stats
+
+    def close(self) -> dict:
+        """Waits for the queued chunks to be inserted, stops the writer and returns its statistics (see get_stats)."""
+        self.queue.put(None)
+        self.thread.join()
+        return self.get_stats()
+
+def split_in_chunks(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, max_rows:int=None,
+                    date_interval_size:int=None):
+    """
+    Splits a geographical and time range into (cell block x day block) chunks of at most max_rows rows (cells x days). 
+    Cell blocks are made of whole rows of latitude of the grid, days are split only when a single row of cells over 
+    the whole time range exceeds max_rows, and a row is split into blocks of longitudes only when it exceeds max_rows 
+    for a single day block. The day blocks of a cell block are generated in chronological order, so fire weather 
+    indexes can continue from one to the next.
 
     Parameters
     ----------
@@ -128,49 +368,112 @@ def load_dataframe_to_db(start_date:date, end_date:date, lat_min:float, lat_max:
         minimum bound of the longitude for the geographical range.
     lng_max : float
         maximum bound of the longitude for the geographical range.
-    dataset_id : int
-        id of the dataset to link retrived data to. Default is None.
+    max_rows : int
+        maximum number of rows of a chunk. Default is None (the whole range is a single chunk).
     date_interval_size : int
-        a date interval size in days to calculate fire weather indexes for. 
-        This parameter is intended to accelerate the calculation time in detriment to results quality. 
-        Default is None.
-    show_progress : str
-        if set to shows progress of the loading pipeline. Can take a value from the 
-        specific set ('none', 'all', 'meteo'). Default is none.
-    
+        date interval size in days used to calculate fire weather indexes. Day blocks are made of whole date 
+        intervals, a chunk has at least one cell over one date interval even if it exceeds max_rows. 
+        Default is None (day blocks of any size).
+
     Returns
     -------
-    out : pandas.DataFrame
-        the generated dataframe.
+    out : Generator[tuple]
+        (start_date, end_date, lat_min, lat_max, lng_min, lng_max) of each chunk.
+    """
+    y_min, y_max, x_min, x_max = GFED_GRID.bbox_to_indexes(lat_min, lat_max, lng_min, lng_max)
+    nb_days = (end_date - start_date).days + 1
+    nb_cols = x_max - x_min + 1
+    if max_rows == None or (y_max - y_min + 1) * nb_cols * nb_days <= max_rows:
+        yield start_date, end_date, lat_min, lat_max, lng_min, lng_max
+        return
+
+    if nb_cols * nb_days <= max_rows:
+        rows_by_block, cols_by_block, days_by_block = max_rows // (nb_cols * nb_days), nb_cols, nb_days
+    else:
+        # Day blocks are a multiple of the date interval size, so that chunks have the date intervals of the whole range
+        interval_size = min(date_interval_size if date_interval_size != None else 1, nb_days)
+        days_by_block = max(interval_size, (max_rows // nb_cols) // interval_size * interval_size)
+        rows_by_block, cols_by_block = 1, min(nb_cols, max(1, max_rows // days_by_block))
+
+    for y in range(y_min, y_max + 1, rows_by_block):
+        # Bounds of the block are the centers of its first and last cells
+        block_lat_min = GFED_GRID.latitudes[y]
+        block_lat_max = GFED_GRID.latitudes[min(y + rows_by_block - 1, y_max)]
+        for x in range(x_min, x_max + 1, cols_by_block):
+            block_lng_min, block_lng_max = lng_min, lng_max
+            if cols_by_block < nb_cols:
+                block_lng_min = GFED_GRID.longitudes[x]
+                block_lng_max = GFED_GRID.longitudes[min(x + cols_by_block - 1, x_max)]
+            for day in range(0, nb_days, days_by_block):
+                block_start = start_date + timedelta(days=day)
+                block_end = start_date + timedelta(days=min(day + days_by_block, nb_days) - 1)
+                yield block_start, block_end, block_lat_min, block_lat_max, block_lng_min, block_lng_max
+
+def get_saved_fwi_state(start_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> pd.DataFrame:
+    """Gets the moisture codes saved in the database for the day before start_date, None if they can't be queried."""
+    connection = connect_to_database()
+    if connection == None:
+        return None
+    res = execute_dql_query(connection, FWI_STATE_QUERY, (lat_min - 0.25, lat_max + 0.25, lng_min - 0.25, lng_max + 0.25,
+                                                          (start_date - timedelta(days=1)).isoformat()))
+    connection.close()
+    if res == None:
+        return None
+    return pd.DataFrame(res, columns=['latitude', 'longitude', 'ffmc', 'dmc', 'dc'])
+
+def get_chunk_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, initial_state:pd.DataFrame=None,
+                   spin_up_start:date=None, date_interval_size:int=None, show_progress=Literal['none', 'all', 'meteo'], spin_up_size:int=None, fwi_max_workers:int=None,
+                   meteo_max_workers=1, meteo_mode:Literal['point', 'regional']='point', meteo_provider:Literal['power', 'open_meteo']='power',
+                   gfed_remote=False, fuoco_cube=False, fuoco_max_workers:int=None) -> tuple:
+    """
+    Generates the data of a chunk (a geographical and time range): meteo data with fire weather indexes, burned area and 
+    emissions, joined on cells and days. Parameters are the ones of load_dataframe_to_db, initial_state being the moisture 
+    codes to continue from and spin_up_start the first day of meteo data before start_date used by the spin-up of 
+    the first date interval.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        the generated dataframe, ready to be inserted.
+    fwi_state_df : pandas.DataFrame
+        the moisture codes of the last day of each cell.
     """
-    # The generated dataframe
-    df: pd.DataFrame = None
     # Get meteo data
-    meteo_df = get_meteo_data(start_date, end_date, lat_min, lat_max, lng_min, lng_max, 
-                              show_progress=(show_progress=='meteo' or show_progress=='all'))
-    
+    meteo_options = {'cache_folder': "data/power", 'mode': meteo_mode} if meteo_provider == 'power' else {}
+    meteo_start = spin_up_start if spin_up_start != None else start_date
+    meteo_df = get_meteo_data(meteo_provider, meteo_start, end_date, lat_min, lat_max, lng_min, lng_max, 
+                              show_progress=(show_progress=='meteo' or show_progress=='all'),
+                              max_workers=meteo_max_workers,
+                              **meteo_options)
+
     # Get data with fire indexes
-    fire_indexes_df = get_data_with_fire_indexes(meteo_df, start_date, end_date, temp_meteo_folder="data/meteo", 
+    fire_indexes_df = get_data_with_fire_indexes(meteo_df, start_date, end_date,
                                                  date_interval_size=date_interval_size,
-                                                 show_progress=(show_progress == 'all'))
+                                                 show_progress=(show_progress == 'all'),
+                                                 initial_state=initial_state,
+                                                 spin_up_size=spin_up_size,
+                                                 max_workers=fwi_max_workers)
+    # Keep the moisture codes of the last day to be able to extend data later
+    fwi_state_df = get_fire_indexes_state(fire_indexes_df)
     del meteo_df # Delete meteo dataframe from memory as we don't need it anymore
     
-    # Get data from burned area
-    burned_area_df = get_daily_burned_area_data(start_date, end_date, lat_min, lat_max, lng_min, lng_max,
-                                                 daily_burned_area_folder="data/fuoco", 
-                                                 show_progress=(show_progress=='all'))
-
-    # Get emissions data
-    emissions_df = get_emissions_data(start_date, end_date, lat_min, lat_max, lng_min, lng_max,
-                                       gfed_files_folder="data/gfed", 
-                                       show_progress=(show_progress=='all'))
-    # Join all data
-    meteo_burned_area_df = pd.merge(fire_indexes_df, burned_area_df, how="left", on=['latitude', 'longitude', 'date']) # Do the first join
+    # Get the (day x latitude x longitude) window of burned area
+    burned_area = get_daily_burned_area_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max,
+                                               daily_burned_area_folder="data/fuoco", 
+                                               show_progress=(show_progress=='all'),
+                                               cube_folder="data/fuoco" if fuoco_cube else None,
+                                               max_workers=fuoco_max_workers)
+
+    # Get the (day x latitude x longitude) window of emissions
+    emissions = get_gfed_emissions_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max,
+                                          gfed_files_folder="data/gfed", 
+                                          show_progress=(show_progress=='all'),
+                                          remote=gfed_remote)
+    # Gather the values of the windows at the (day, cell) of each row
+    df = join_window_cubes(fire_indexes_df, {'burned_area': burned_area, 'fire_carbon_emission': emissions},
+                           lat_min, lat_max, lng_min, lng_max)
     del fire_indexes_df # Delete the meteo dataframe with fire indexes from memory as we don't need it anymore
-    del burned_area_df # Delete the burned area dataframe from memory as we don't need it anymore
-    df = pd.merge(meteo_burned_area_df, emissions_df, how="left", on=['latitude', 'longitude', 'date']) # Do the second and final merge
-    del meteo_burned_area_df # Delete the first merge dataframe from memory as we don't need it anymore
-    del emissions_df # Delete the emissions dataframe from memory as we don't need it anymore
+    del burned_area, emissions # Delete the windows from memory as we don't need them anymore
 
     # Add a last column to specify in the location was burnt or not (boolean)
     df['burnt'] = (df['burned_area'] > 0).astype(int)
@@ -181,34 +484,155 @@ def load_dataframe_to_db(start_date:date, end_date:date, lat_min:float, lat_max:
     # Replace Nan values with None
     df.replace(np.nan, None, inplace=True)
 
-    # Connect to database
-    if show_progress == 'all':
-        print("Connecting to Database ...")
-    connection = connect_to_database()
+    return df, fwi_state_df
 
-    # Insert the generated dataframe to the database
-    if show_progress == 'all':
-        print("Inserting into Database ...")
-    
-    insert_values = [(*row, dataset_id) for row in df.values]
-    res = execute_dml_query(connection, WILFIRES_DATA_INSERT_QUERY, insert_values, many=True)
+def generate_chunks_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, max_rows:int=None,
+                         resume_fwi=False, **options):
+    """
+    Generates the data of the chunks of a geographical and time range one after another (see split_in_chunks). A chunk 
+    is only generated when the previous one has been consumed, which bounds the memory used by the pipeline. Fire weather 
+    indexes of a day block continue from the moisture codes of the previous day block of the same cells. With date 
+    intervals, a day block starts a new date interval instead, from default codes after its spin-up days.
+
+    Returns
+    -------
+    out : Generator[tuple]
+        (end_date, df, fwi_state_df) of each chunk, with df and fwi_state_df returned by get_chunk_data.
+    """
+    date_interval_size = options.get('date_interval_size')
+    spin_up_size = options.get('spin_up_size')
+    fwi_state_df = None
+    for chunk in split_in_chunks(start_date, end_date, lat_min, lat_max, lng_min, lng_max, max_rows=max_rows, 
+                                 date_interval_size=date_interval_size):
+        chunk_start, chunk_end, chunk_lat_min, chunk_lat_max, chunk_lng_min, chunk_lng_max = chunk
+        # Moisture codes to continue from
+        initial_state = fwi_state_df if chunk_start > start_date and date_interval_size == None else None
+        if chunk_start == start_date and resume_fwi:
+            initial_state = get_saved_fwi_state(start_date, chunk_lat_min, chunk_lat_max, chunk_lng_min, chunk_lng_max)
+        # Spin-up days of the first date interval of the chunk, within the whole time range
+        spin_up_start = None
+        if chunk_start > start_date and date_interval_size != None and spin_up_size != None:
+            spin_up_start = max(start_date, chunk_start - timedelta(days=spin_up_size))
+
+        df, fwi_state_df = get_chunk_data(chunk_start, chunk_end, chunk_lat_min, chunk_lat_max, chunk_lng_min, chunk_lng_max,
+                                          initial_state=initial_state, spin_up_start=spin_up_start, **options)
+        yield chunk_end, df, fwi_state_df
+
+def load_dataframe_to_db(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, 
+                         dataset_id:int=None, date_interval_size:int=None, show_progress=Literal['none', 'all', 'meteo'],
+                         resume_fwi=False, spin_up_size:int=None, fwi_max_workers:int=None, meteo_max_workers=1,
+                         meteo_mode:Literal['point', 'regional']='point', meteo_provider:Literal['power', 'open_meteo']='power',
+                         gfed_remote=False, fuoco_cube=False, fuoco_max_workers:int=None, memory_budget:int=None,
+                         insert_batch_size:int=BULK_BATCH_SIZE, writer:DatabaseWriter=None):
+    """
+    Loads data into database for a specific geographical and time range. Data is generated by chunks that fit in 
+    a memory budget, each chunk is inserted by a database writer while the next one is generated.
+
+    Parameters
+    ----------
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    lat_min : float
+        minimum bound of the latitude for the geographical range.
+    lat_max : float
+        maximum bound of the latitude for the geographical range.
+    lng_min : float
+        minimum bound of the longitude for the geographical range.
+    lng_max : float
+        maximum bound of the longitude for the geographical range.
+    dataset_id : int
+        id of the dataset to link retrived data to. Default is None.
+    date_interval_size : int
+        a date interval size in days to calculate fire weather indexes for. 
+        This parameter is intended to accelerate the calculation time in detriment to results quality. 
+        Default is None.
+    show_progress : str
+        if set to shows progress of the loading pipeline. Can take a value from the 
+        specific set ('none', 'all', 'meteo'). Default is none.
+    resume_fwi : bool
+        if set to True, fire weather indexes continue from the moisture codes saved for the day before 
+        start_date, instead of starting from default codes. Default is False.
+    spin_up_size : int
+        used with date_interval_size, number of days before each date interval to start the calculation 
+        of fire weather indexes from. Default is None.
+    fwi_max_workers : int
+        used with date_interval_size, number of processes to calculate date intervals in parallel. 
+        Default is None (no parallelism).
+    meteo_max_workers : int
+        maximum number of concurrent requests to fetch meteo data. Default is 1.
+    meteo_mode : str
+        'point' fetches meteo data of each cell with its own request, 'regional' fetches all cells with as 
+        few regional requests as possible. Only used by the 'power' meteo provider. Default is 'point'.
+    meteo_provider : str
+        provider of meteo data, 'power' (NASA POWER) or 'open_meteo' (Open-Meteo archive). Default is 'power'.
+    gfed_remote : bool
+        if set to True, GFED files that aren't available locally are read remotely with HTTP range requests 
+        instead of being downloaded. Default is False.
+    fuoco_cube : bool
+        if set to True, daily burned area files are packed once into memory-mapped cubes of years and 
+        burned area is read from the cubes. Default is False.
+    fuoco_max_workers : int
+        number of processes reading daily burned area files in parallel. Default is None (no parallelism).
+    memory_budget : int
+        approximate memory in bytes the pipeline can use, the range is loaded by chunks of 
+        memory_budget / ROW_MEMORY_SIZE rows. Default is None (the whole range is loaded at once).
+    insert_batch_size : int
+        number of rows inserted and committed at once through a staging table (see bulk_insert_dataframe). 
+        If None, each chunk is inserted with a single INSERT IGNORE. Default is 10000.
+    writer : DatabaseWriter
+        writer shared with other ranges to queue chunks to. Default is None (a writer is started for the range 
+        and stopped once all its chunks are inserted).
     
-    # Number of rows inserted
-    nbr_rows = 0
-    if res != None:
-        # Get row count
-        nbr_rows = res[1]
-        # Print a final message
+    Returns
+    -------
+    out : int
+        the number of rows inserted, or the number of rows queued if a writer is given.
+    """
+    max_rows = max(1, memory_budget // ROW_MEMORY_SIZE) if memory_budget != None else None
+    chunks = generate_chunks_data(start_date, end_date, lat_min, lat_max, lng_min, lng_max, max_rows=max_rows, resume_fwi=resume_fwi,
+                                  date_interval_size=date_interval_size, show_progress=show_progress, spin_up_size=spin_up_size,
+                                  fwi_max_workers=fwi_max_workers, meteo_max_workers=meteo_max_workers, meteo_mode=meteo_mode,
+                                  meteo_provider=meteo_provider, gfed_remote=gfed_remote, fuoco_cube=fuoco_cube,
+                                  fuoco_max_workers=fuoco_max_workers)
+
+    # Chunks are inserted by a writer while the next ones are generated
+    own_writer = writer == None
+    if own_writer:
         if show_progress == 'all':
+            print("Connecting to Database ...")
+        writer = DatabaseWriter(insert_batch_size=insert_batch_size, show_progress=show_progress == 'all')
+
+    # Number of rows queued
+    nbr_rows = 0
+    try:
+        for chunk_end, df, fwi_state_df in chunks:
+            if show_progress == 'all':
+                print("Inserting into Database ...")
+            # Save the moisture codes of the last day of the range
+            writer.put(df, fwi_state_df if chunk_end == end_date else None, dataset_id)
+            nbr_rows += df.shape[0]
+
+            # Delete the generated data before the next chunk is generated
+            del df, fwi_state_df
+    finally:
+        # Stop the writer even if a chunk couldn't be generated, the chunks already queued are inserted
+        if own_writer:
+            stats = writer.close()
+
+    if not own_writer:
+        return nbr_rows
+
+    nbr_rows = stats['inserted']
+
+    # Print a final message
+    if show_progress == 'all':
+        if stats['failed'] == 0:
             print("\nDatabase has been populated successfully !")
-    else:
-        if show_progress == 'all':
-            print('\nAn error occured when executing the INSERT SQL query, check logs for more details.')
-    
-    # Close connection
-    connection.close()
-    # Delete the generated dataframe
-    del df
+        else:
+            print(f"\nAn error occured when executing the INSERT SQL queries of {stats['failed']} rows, check logs for more details.")
+        print(f"Rows inserted: {nbr_rows}, rows skipped (already in the database): {stats['skipped']}")
 
     return nbr_rows
 
@@ -228,6 +652,20 @@ if __name__ == "__main__":
     parser.add_argument("--nb_checkpoints_lng", help="Divides the geographical longitude range into the number of checkpoints specified and loads data to database at the end of each checkpoint")
     parser.add_argument("--date_interval_size", help="Specifies a date interval size in days to calculate fire weather indexes for. This parameter is intended to accelerate the calculation time in detriment to results quality.")
     parser.add_argument("--parallel", help="If set to 1, the process will be divided on the maximum number of threads available.")
+    parser.add_argument("--spin_up_size", help="Used with date_interval_size, specifies a number of days before each date interval to start calculating fire weather indexes from. Spin-up days improve results quality and are discarded.")
+    parser.add_argument("--fwi_workers", help="Used with date_interval_size, specifies a number of processes to calculate date intervals of fire weather indexes in parallel.")
+    parser.add_argument("--meteo_workers", help="Specifies a maximum number of concurrent requests to fetch meteo data. Default is 1.")
+    parser.add_argument("--meteo_mode", help="Set to 'regional' to fetch meteo data with as few regional requests as possible instead of one request per cell ('point'). Default is 'point'.")
+    parser.add_argument("--meteo_provider", help="Specifies the provider of meteo data: 'power' (NASA POWER) or 'open_meteo' (Open-Meteo archive). Default is 'power'.")
+    parser.add_argument("--dataset_id", help="Id of an existing dataset to extend with the data loaded instead of creating a new dataset")
+    parser.add_argument("--gfed_remote", help="If set to 1, GFED files that aren't available locally are read remotely (only the needed parts) instead of being downloaded.")
+    parser.add_argument("--fuoco_cube", help="If set to 1, daily burned area files are packed once into memory-mapped cubes of years, later queries read only the needed parts of the cubes.")
+    parser.add_argument("--fuoco_workers", help="Specifies a number of processes to read daily burned area files in parallel.")
+    parser.add_argument("--memory_budget", help="Approximate memory in MB a checkpoint can use, checkpoints are loaded by chunks of cells and days that fit in it. Default is no limit.")
+    parser.add_argument("--insert_batch_size", help="Number of rows inserted and committed at once through a staging table. Set to 0 to insert each chunk with a single query. Default is 10000.")
+    parser.add_argument("--writer_queue_size", help="Maximum number of generated chunks waiting to be inserted by the database writer. Default is 2.")
+    parser.add_argument("--pool_size", help="Number of database connections shared by the steps of the script (at most 32). Default is 4.")
+    parser.add_argument("--resume_fwi", help="If set to 1, fire weather indexes continue from the moisture codes saved for the day before the start date instead of recomputing the history.")
 
     args=vars(parser.parse_args())
 
@@ -243,17 +681,45 @@ if __name__ == "__main__":
     nb_checkpoints_lng = int(args['nb_checkpoints_lng']) if args['nb_checkpoints_lng'] != None else 1
     date_interval_size  = int(args['date_interval_size']) if args['date_interval_size'] != None else None
     parallel = bool(int(args["parallel"])) if args["parallel"] else False
+    spin_up_size = int(args['spin_up_size']) if args['spin_up_size'] != None else None
+    fwi_workers = int(args['fwi_workers']) if args['fwi_workers'] != None else None
+    meteo_workers = int(args['meteo_workers']) if args['meteo_workers'] != None else 1
+    meteo_mode = args['meteo_mode'] if args['meteo_mode'] != None else 'point'
+    meteo_provider = args['meteo_provider'] if args['meteo_provider'] != None else 'power'
+    dataset_id = int(args['dataset_id']) if args['dataset_id'] != None else None
+    resume_fwi = bool(int(args["resume_fwi"])) if args["resume_fwi"] else False
+    gfed_remote = bool(int(args["gfed_remote"])) if args["gfed_remote"] else False
+    fuoco_cube = bool(int(args["fuoco_cube"])) if args["fuoco_cube"] else False
+    fuoco_workers = int(args['fuoco_workers']) if args['fuoco_workers'] != None else None
+    memory_budget = int(float(args['memory_budget']) * 2**20) if args['memory_budget'] != None else None
+    insert_batch_size = int(args['insert_batch_size']) if args['insert_batch_size'] != None else BULK_BATCH_SIZE
+    insert_batch_size = insert_batch_size if insert_batch_size > 0 else None
+    writer_queue_size = int(args['writer_queue_size']) if args['writer_queue_size'] != None else WRITER_QUEUE_SIZE
+    pool_size = int(args['pool_size']) if args['pool_size'] != None else DATABASE_POOL_SIZE
 
     # Load env variables
     load_dotenv()
 
-    # Connect to database and create a dataset
-    connection = connect_to_database()
+    # Check the pool of connections shared by all steps before generating data
+    try:
+        health = get_database_pool(pool_size).check_health()
+    except (Error, DatabaseURLException) as err:
+        health = {'healthy': False, 'latency': None, 'error': str(err)}
+
+    # Connect to database and create a dataset (if no existing dataset is extended)
     nbr_rows = 0
-    fwi_backtrack_size = date_interval_size if date_interval_size != None else (end_date-start_date).days
-    created_at = datetime.now()
-    res = execute_dml_query(connection, DATASETS_INSERT_QUERY, (dataset_name, nbr_rows, fwi_backtrack_size, created_at.isoformat()))
-    connection.close()
+    res = (dataset_id, 0)
+    if not health['healthy']:
+        print(f"Error: '{health['error']}'")
+        res = None
+    elif dataset_id == None:
+        connection = connect_to_database()
+        fwi_backtrack_size = date_interval_size if date_interval_size != None else (end_date-start_date).days
+        if date_interval_size != None and spin_up_size != None:
+            fwi_backtrack_size += spin_up_size
+        created_at = datetime.now()
+        res = execute_dml_query(connection, DATASETS_INSERT_QUERY, (dataset_name, nbr_rows, fwi_backtrack_size, created_at.isoformat()))
+        connection.close()
 
     # If the dataset is created successfully
     if res != None:
@@ -263,47 +729,93 @@ if __name__ == "__main__":
         lat_step = (lat_max - lat_min) / nb_checkpoints_lat
         lng_step = (lng_max - lng_min) / nb_checkpoints_lng
 
-        if parallel:
-            cpt = 0 # Number of checkpoints passed (completed)
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = [] # Array to store future objects
-                print(f"INFO: Running on {executor._max_workers} threads.")
+        # Checkpoints queue their chunks to a single writer inserting them while the next ones are generated
+        writer = DatabaseWriter(queue_size=writer_queue_size, insert_batch_size=insert_batch_size, show_progress=not parallel)
+
+        try:
+            if parallel:
+                cpt = 0 # Number of checkpoints passed (completed)
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    futures = [] # Array to store future objects
+                    print(f"INFO: Running on {executor._max_workers} threads.")
+                    for i in range(nb_checkpoints_lat * nb_checkpoints_lng):
+                        lat_index = i // nb_checkpoints_lat
+                        lng_index = i % nb_checkpoints_lat
+                        futures.append(executor.submit(load_dataframe_to_db, start_date, 
+                                                        end_date, lat_min + lat_index * lat_step,
+                                                        lat_min + (lat_index + 1) * lat_step,
+                                                        lng_min + lng_index * lng_step, 
+                                                        lng_min + (lng_index + 1) * lng_step,
+                                                        dataset_id,
+                                                        date_interval_size,
+                                                        'meteo',
+                                                        resume_fwi,
+                                                        spin_up_size,
+                                                        fwi_workers,
+                                                        meteo_workers,
+                                                        meteo_mode,
+                                                        meteo_provider,
+                                                        gfed_remote,
+                                                        fuoco_cube,
+                                                        fuoco_workers,
+                                                        memory_budget,
+                                                        insert_batch_size,
+                                                        writer))
+                
+                    for future in concurrent.futures.as_completed(futures):
+                        cpt += 1
+                        future.result()
+                        print(f"Total Progress : {cpt*100/(nb_checkpoints_lat * nb_checkpoints_lng)} %")
+            else:
                 for i in range(nb_checkpoints_lat * nb_checkpoints_lng):
+                    print(f"\n============= CheckPoint {i+1} ===============\n")
                     lat_index = i // nb_checkpoints_lat
                     lng_index = i % nb_checkpoints_lat
-                    futures.append(executor.submit(load_dataframe_to_db, start_date, 
-                                                    end_date, lat_min + lat_index * lat_step,
-                                                    lat_min + (lat_index + 1) * lat_step,
-                                                    lng_min + lng_index * lng_step, 
-                                                    lng_min + (lng_index + 1) * lng_step,
-                                                    dataset_id,
-                                                    date_interval_size,
-                                                    'meteo'))
+                    load_dataframe_to_db(start_date, end_date, 
+                                            lat_min + lat_index * lat_step,
+                                            lat_min + (lat_index + 1) * lat_step,
+                                            lng_min + lng_index * lng_step, 
+                                            lng_min + (lng_index + 1) * lng_step,
+                                            dataset_id=dataset_id,
+                                            date_interval_size=date_interval_size,
+                                            show_progress='all',
+                                            resume_fwi=resume_fwi,
+                                            spin_up_size=spin_up_size,
+                                            fwi_max_workers=fwi_workers,
+                                            meteo_max_workers=meteo_workers,
+                                            meteo_mode=meteo_mode,
+                                            meteo_provider=meteo_provider,
+                                            gfed_remote=gfed_remote,
+                                            fuoco_cube=fuoco_cube,
+                                            fuoco_max_workers=fuoco_workers,
+                                            memory_budget=memory_budget,
+                                            insert_batch_size=insert_batch_size,
+                                            writer=writer)
                 
-                for future in concurrent.futures.as_completed(futures):
-                    cpt += 1
-                    nbr_rows += future.result()
-                    print(f"Total Progress : {cpt*100/(nb_checkpoints_lat * nb_checkpoints_lng)} %")
+                    print(f"Total Progress : {(i+1)*100/(nb_checkpoints_lat * nb_checkpoints_lng)} %")
+        finally:
+            # Wait for the last chunks to be inserted, even if a checkpoint failed
+            stats = writer.close()
+        nbr_rows = stats['inserted']
+        if stats['failed'] == 0:
+            print("\nDatabase has been populated successfully !")
         else:
-            for i in range(nb_checkpoints_lat * nb_checkpoints_lng):
-                print(f"\n============= CheckPoint {i+1} ===============\n")
-                lat_index = i // nb_checkpoints_lat
-                lng_index = i % nb_checkpoints_lat
-                nbr_rows += load_dataframe_to_db(start_date, end_date, 
-                                        lat_min + lat_index * lat_step,
-                                        lat_min + (lat_index + 1) * lat_step,
-                                        lng_min + lng_index * lng_step, 
-                                        lng_min + (lng_index + 1) * lng_step,
-                                        dataset_id=dataset_id,
-                                        date_interval_size=date_interval_size,
-                                        show_progress='all')
-                
-                print(f"Total Progress : {(i+1)*100/(nb_checkpoints_lat * nb_checkpoints_lng)} %")
+            print(f"\nAn error occured when executing the INSERT SQL queries of {stats['failed']} rows, check logs for more details.")
+        print(f"Rows inserted: {nbr_rows}, rows skipped (already in the database): {stats['skipped']}")
+        print(f"Writer: {stats['chunks']} chunks in {stats['write_time']:.1f}s of {stats['elapsed_time']:.1f}s ({stats['rows_per_second']:.0f} rows/s), "
+              f"queue depth mean {stats['mean_queue_depth']:.1f} max {stats['max_queue_depth']}, "
+              f"generation blocked {stats['put_wait_time']:.1f}s on a full queue")
 
         connection = connect_to_database()
         created_at = datetime.now()
-        execute_dml_query(connection, DATASETS_UPDATE_QUERY, (nbr_rows, created_at.isoformat(), dataset_id))
+        update_query = DATASETS_UPDATE_QUERY if args['dataset_id'] == None else DATASETS_EXTEND_QUERY
+        execute_dml_query(connection, update_query, (nbr_rows, created_at.isoformat(), dataset_id))
         connection.close()
+
+        pool_stats = get_database_pool().get_stats()
+        print(f"Database pool: {pool_stats['checkouts']} checkouts, {pool_stats['max_in_use']}/{pool_stats['pool_size']} connections used at most, "
+              f"{pool_stats['wait_time']:.1f}s waiting for a connection (max {pool_stats['max_wait_time']:.1f}s), "
+              f"{pool_stats['timeouts']} timeouts, {pool_stats['errors']} errors")
     
     else:
         print("The dataset could not be created !")
\ No newline at end of file
@@ -0,0 +1 @@
+UPDATE datasets SET nbr_rows=nbr_rows+%s, created_at=%s WHERE id=%s;
\ No newline at end of file
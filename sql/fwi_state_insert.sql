@@ -0,0 +1,4 @@
+INSERT INTO fwi_state 
+(latitude, longitude, date, ffmc, dmc, dc) 
+VALUES (%s, %s, %s, %s, %s, %s) 
+ON DUPLICATE KEY UPDATE ffmc=VALUES(ffmc), dmc=VALUES(dmc), dc=VALUES(dc);
\ No newline at end of file
@@ -0,0 +1,4 @@
+SELECT latitude, longitude, ffmc, dmc, dc FROM fwi_state WHERE 
+(latitude BETWEEN %s AND %s) 
+AND (longitude BETWEEN %s AND %s) 
+AND (date = %s);
\ No newline at end of file
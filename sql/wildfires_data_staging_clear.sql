@@ -0,0 +1 @@
+DELETE FROM wildfires_data_staging;
\ No newline at end of file
@@ -0,0 +1 @@
+CREATE TEMPORARY TABLE IF NOT EXISTS wildfires_data_staging LIKE wildfires_data;
\ No newline at end of file
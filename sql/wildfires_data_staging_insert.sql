@@ -0,0 +1,5 @@
+INSERT INTO wildfires_data_staging 
+(latitude, longitude, date, temperature, precipitation, air_humidity, wind_speed, ffmc, dmc, 
+dc, isi, bui, fwi, burned_area, emissions, burnt, dataset_id) 
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 
+%s, %s, %s, %s, %s, %s, %s, %s);
\ No newline at end of file
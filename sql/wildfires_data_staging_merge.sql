@@ -0,0 +1,6 @@
+INSERT IGNORE INTO wildfires_data 
+(latitude, longitude, date, temperature, precipitation, air_humidity, wind_speed, ffmc, dmc, 
+dc, isi, bui, fwi, burned_area, emissions, burnt, dataset_id) 
+SELECT latitude, longitude, date, temperature, precipitation, air_humidity, wind_speed, ffmc, dmc, 
+dc, isi, bui, fwi, burned_area, emissions, burnt, dataset_id 
+FROM wildfires_data_staging;
\ No newline at end of file
@@ -61,6 +61,21 @@ CREATE TABLE `wildfires_data` (
   `burnt` tinyint(1) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `fwi_state`
+--
+
+CREATE TABLE `fwi_state` (
+  `latitude` float NOT NULL,
+  `longitude` float NOT NULL,
+  `date` date NOT NULL,
+  `ffmc` float NOT NULL,
+  `dmc` float NOT NULL,
+  `dc` float NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
 --
 -- Indexes for dumped tables
 --
@@ -78,6 +93,12 @@ ALTER TABLE `wildfires_data`
   ADD PRIMARY KEY (`latitude`,`longitude`,`date`),
   ADD KEY `dataset_parent` (`dataset_id`);
 
+--
+-- Indexes for table `fwi_state`
+--
+ALTER TABLE `fwi_state`
+  ADD PRIMARY KEY (`latitude`,`longitude`,`date`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
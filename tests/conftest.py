@@ -0,0 +1,22 @@
+import http.server
+import threading
+import pytest
+
+@pytest.fixture
+def stub_server():
+    """
+    Starts stub HTTP servers on free local ports. The fixture is a function taking a request handler class and
+    returning the base URL of a server using it, every server started is shut down at the end of the test.
+    """
+    servers = []
+
+    def start(handler:type) -> str:
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}/'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -1,8 +1,21 @@
-from utils.fire_index_utils import get_data_with_fire_indexes
+from utils.fire_index_utils import get_data_with_fire_indexes, get_fire_indexes_state, get_fire_indexes_accuracy, calc_canadian_fwi
 import pandas as pd
 import numpy as np
+import concurrent.futures
 from datetime import date
 
+def get_two_cells_data():
+    """Meteo data of the same five days for two cells."""
+    return pd.DataFrame({
+        'date': list(pd.date_range('2020-10-01', '2020-10-05')) * 2,
+        'latitude': [36.125] * 5 + [36.375] * 5,
+        'longitude': [1] * 10,
+        'temperature': [21.48, 20.30, 16.98, 16.39, 18.90] * 2,
+        'precipitation': [0.00, 0.64, 0.55, 0.22, 0.18] * 2,
+        'air_humidity': [63.44, 57.00, 62.00, 57.81, 62.06] * 2,
+        'wind_speed': [4.44, 9.07, 5.80, 4.73, 3.88] * 2
+    })
+
 def test_fire_index():
     data = pd.DataFrame({
         'date': [pd.Timestamp('2020-10-01 00:00:00'),
@@ -62,4 +75,108 @@ def test_fire_index_splitted():
     assert(np.allclose(new_data['dc'].to_numpy(), np.array([19.57040023803711, 23.92840003967285, 18.760400772094727, 22.414600372314453, 19.106000900268555], dtype=np.float32), atol=tolerence, rtol=0))
     assert(np.allclose(new_data['isi'].to_numpy(), np.array([4.887529373168945, 11.763452529907227, 5.707616806030273, 5.144996643066406, 4.333328723907471], dtype=np.float32), atol=tolerence, rtol=0))
     assert(np.allclose(new_data['bui'].to_numpy(), np.array([7.528445720672607, 9.08469295501709, 7.265207290649414, 8.543453216552734, 7.387862682342529], dtype=np.float32), atol=tolerence, rtol=0))
-    assert(np.allclose(new_data['fwi'].to_numpy(), np.array([4.554872512817383, 11.108752250671387, 5.244157791137695, 5.129981994628906, 3.9604170322418213], dtype=np.float32), atol=tolerence, rtol=0))
\ No newline at end of file
+    assert(np.allclose(new_data['fwi'].to_numpy(), np.array([4.554872512817383, 11.108752250671387, 5.244157791137695, 5.129981994628906, 3.9604170322418213], dtype=np.float32), atol=tolerence, rtol=0))
+
+def test_fire_index_engine():
+    # Two cells with the same meteo data but a different order of days for the second one
+    temp = np.array([[21.48, 20.30, 16.98, 16.39, 18.90], [18.90, 16.39, 16.98, 20.30, 21.48]])
+    precip = np.array([[0.00, 0.64, 0.55, 0.22, 0.18], [0.18, 0.22, 0.55, 0.64, 0.00]])
+    hum = np.array([[63.44, 57.00, 62.00, 57.81, 62.06], [62.06, 57.81, 62.00, 57.00, 63.44]])
+    wind = np.array([[4.44, 9.07, 5.80, 4.73, 3.88], [3.88, 4.73, 5.80, 9.07, 4.44]])
+    months = np.array([10, 10, 10, 10, 10])
+
+    indexes = calc_canadian_fwi(temp, precip, hum, wind, months)
+
+    # Check for shapes
+    for k in ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']:
+        assert(indexes[k].shape == (2, 5))
+
+    # Check for indices of the first cell
+    tolerence = 10**-5
+    assert(np.allclose(indexes['ffmc'][0], np.array([85.260025, 85.536819, 84.728874, 85.287865, 85.335670], dtype=np.float32), atol=tolerence, rtol=0))
+    assert(np.allclose(indexes['dmc'][0], np.array([7.250835, 8.645123, 9.686125, 10.804196, 11.953930], dtype=np.float32), atol=tolerence, rtol=0))
+    assert(np.allclose(indexes['dc'][0], np.array([19.570400, 23.928400, 27.688801, 31.343000, 35.449001], dtype=np.float32), atol=tolerence, rtol=0))
+    assert(np.allclose(indexes['isi'][0], np.array([4.8875294, 11.763453, 5.814761, 5.1714153, 4.4618955], dtype=np.float32), atol=tolerence, rtol=0))
+    assert(np.allclose(indexes['bui'][0], np.array([7.5284457, 9.084693, 10.334332, 11.606363, 12.971990], dtype=np.float32), atol=tolerence, rtol=0))
+    assert(np.allclose(indexes['fwi'][0], np.array([4.5548725, 11.108752, 6.377234, 6.064647, 5.5898585], dtype=np.float32), atol=tolerence, rtol=0))
+
+    # The second cell has to be calculated independently from the first one
+    second_cell = calc_canadian_fwi(temp[1:], precip[1:], hum[1:], wind[1:], months)
+    for k in ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']:
+        assert(np.allclose(indexes[k][1], second_cell[k][0], atol=tolerence, rtol=0))
+
+
+def test_fire_index_threads():
+    data = get_two_cells_data()
+
+    expected = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5))
+
+    # Calls from many threads at once must not interfere with each other
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(get_data_with_fire_indexes, data, date(2020, 10, 1), date(2020, 10, 5)) for _ in range(16)]
+        for future in concurrent.futures.as_completed(futures):
+            assert(future.result().equals(expected))
+
+
+def test_fire_index_state():
+    data = get_two_cells_data()
+
+    expected = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5))
+
+    # Calculate the first three days then extend them by two days from the saved state
+    first_days = get_data_with_fire_indexes(data[data['date'] <= '2020-10-03'], date(2020, 10, 1), date(2020, 10, 3))
+    state = get_fire_indexes_state(first_days)
+    assert(state.shape[0] == 2)
+    assert((state['date'] == pd.Timestamp('2020-10-03')).all())
+
+    last_days = get_data_with_fire_indexes(data[data['date'] > '2020-10-03'], date(2020, 10, 4), date(2020, 10, 5), initial_state=state)
+    
+    # Check for indices
+    tolerence = 10**-5
+    expected_last_days = expected[expected['date'] > '2020-10-03'].reset_index(drop=True)
+    for c in ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']:
+        assert(np.allclose(last_days[c].to_numpy(), expected_last_days[c].to_numpy(), atol=tolerence, rtol=0))
+
+
+def test_fire_index_spin_up():
+    data = get_two_cells_data()
+
+    expected = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5))
+    splitted = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5), date_interval_size=2)
+
+    # Spin-up days covering the whole history give the same values as the full calculation
+    spin_up = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5), date_interval_size=2, spin_up_size=4)
+    assert(spin_up.shape == expected.shape)
+    assert(np.allclose(spin_up[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(), 
+                       expected[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(), atol=10**-5, rtol=0))
+
+    # Intervals calculated on a pool of processes are stitched in the same order as the serial calculation
+    parallel = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5), date_interval_size=2, max_workers=2)
+    assert(parallel.equals(splitted))
+
+    # Errors of the splitted calculation are reported, and bounded by spin-up days
+    report = get_fire_indexes_accuracy(data, date(2020, 10, 1), date(2020, 10, 5), 2)
+    assert(list(report.index) == ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi'])
+    assert((report['max_error'] > 0).all())
+    report = get_fire_indexes_accuracy(data, date(2020, 10, 1), date(2020, 10, 5), 2, spin_up_size=1, max_workers=2)
+    assert((report['max_error'] < get_fire_indexes_accuracy(data, date(2020, 10, 1), date(2020, 10, 5), 2)['max_error']).all())
+
+    # Days of the dataset outside of the time range are not compared
+    report = get_fire_indexes_accuracy(data, date(2020, 10, 2), date(2020, 10, 5), 2)
+    assert(np.isfinite(report.to_numpy()).all())
+
+
+def test_fire_index_missing_days():
+    data = get_two_cells_data()
+    # The second cell misses a day and its rows are shuffled
+    data = data.drop(index=7).sample(frac=1, random_state=0)
+
+    new_data = get_data_with_fire_indexes(data, date(2020, 10, 1), date(2020, 10, 5))
+    first_cell = get_data_with_fire_indexes(data[data['latitude'] == 36.125], date(2020, 10, 1), date(2020, 10, 5))
+    second_cell = get_data_with_fire_indexes(data[data['latitude'] == 36.375], date(2020, 10, 1), date(2020, 10, 5))
+
+    # Each cell is calculated on its own days, sorted by date
+    assert(new_data.shape[0] == 9)
+    assert(new_data[new_data['latitude'] == 36.125].reset_index(drop=True).equals(first_cell))
+    assert(new_data[new_data['latitude'] == 36.375].reset_index(drop=True).equals(second_cell))
+    assert(second_cell['date'].is_monotonic_increasing)
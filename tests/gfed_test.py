@@ -1,6 +1,8 @@
 from utils.gfed_utils import *
 from datetime import date
 import numpy as np
+import h5py
+import http.server
 
 def test_gfed_emissions():
     actual = get_gfed_emissions_data_for_range(date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25,
@@ -15,4 +17,143 @@ def test_gfed_emissions():
        [-7.125, 12.875, pd.Timestamp('2015-07-13 00:00:00'),
         0.468868613243103]])
     
-    assert((actual == expected).all())
\ No newline at end of file
+    assert((actual == expected).all())
+
+def make_gfed_file(path, year, days):
+    """Writes a synthetic GFED file with emissions of the specified days (list of dates)."""
+    rows, cols = np.meshgrid(np.arange(720), np.arange(1440), indexing='ij')
+    with h5py.File(path, 'w') as f:
+        for d in days:
+            month = str(d.month).zfill(2)
+            if f"emissions/{month}/C" not in f:
+                f.create_dataset(f"emissions/{month}/C", data=(rows * 1440 + cols + d.month).astype(np.float32), chunks=(90, 180))
+            f.create_dataset(f"emissions/{month}/daily_fraction/day_{d.day}", data=np.full((720, 1440), d.day / 100, dtype=np.float32), 
+                             chunks=(90, 180))
+
+def test_gfed_emissions_synthetic(tmp_path):
+    make_gfed_file(tmp_path / 'gfed_data_2015.hdf5', 2015, [date(2015, 12, 30), date(2015, 12, 31)])
+    make_gfed_file(tmp_path / 'gfed_data_2016.hdf5', 2016, [date(2016, 1, 1), date(2016, 1, 2)])
+
+    actual = get_gfed_emissions_data_for_range(date(2015, 12, 30), date(2016, 1, 2), -7.25, -7.0, 12.875, 13.125, 
+                                               gfed_files_folder=str(tmp_path))
+
+    # 2 x 2 cells for each day of the range (each day once, even over two years)
+    assert(actual.shape == (16, 4))
+    assert(list(actual['date'].drop_duplicates()) == list(pd.date_range('2015-12-30', '2016-01-02')))
+    # Emissions of a cell are its daily fraction by the total carbon of its month
+    row = 719 - np.floor((actual['latitude'].to_numpy() + 90) * 4)
+    col = np.floor((actual['longitude'].to_numpy() + 180) * 4)
+    carbon = np.float32(row * 1440 + col + actual['date'].dt.month.to_numpy())
+    fraction = (actual['date'].dt.day.to_numpy() / 100).astype(np.float32)
+    assert(np.allclose(actual['fire_carbon_emission'].to_numpy(dtype=np.float64), fraction * carbon))
+
+class StubGFEDHandler(http.server.BaseHTTPRequestHandler):
+    """Stub of the GFED server supporting range requests, the first download is cut in the middle of the file."""
+    content = b''
+    ranges = []
+
+    def do_GET(self):
+        start = 0
+        if 'Range' in self.headers:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+        StubGFEDHandler.ranges.append(start)
+        body = StubGFEDHandler.content[start:]
+        self.send_response(206 if start > 0 else 200)
+        if start > 0:
+            self.send_header('Content-Range', f"bytes {start}-{len(StubGFEDHandler.content) - 1}/{len(StubGFEDHandler.content)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if len(StubGFEDHandler.ranges) == 1: # Connection lost in the middle of the first download
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def test_gfed_download_resumed(tmp_path, monkeypatch, stub_server):
+    make_gfed_file(tmp_path / 'remote.hdf5', 2015, [date(2015, 7, 10)])
+    StubGFEDHandler.content = (tmp_path / 'remote.hdf5').read_bytes()
+    folder = tmp_path / 'gfed'
+    folder.mkdir()
+    monkeypatch.setattr('utils.gfed_utils.BASE_URL', stub_server(StubGFEDHandler))
+
+    fetch_gfed_data_for_year(2015, gfed_files_folder=str(folder))
+
+    # The second request resumed the download where the first one was cut
+    assert(StubGFEDHandler.ranges[0] == 0 and StubGFEDHandler.ranges[1] > 0)
+    assert((folder / 'gfed_data_2015.hdf5').read_bytes() == StubGFEDHandler.content)
+    assert(os.listdir(folder) == ['gfed_data_2015.hdf5'])
+
+class StubRangeHandler(http.server.BaseHTTPRequestHandler):
+    """Stub of a server supporting range requests, counting the bytes sent."""
+    content = b''
+    bytes_sent = 0
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(StubRangeHandler.content)))
+        self.end_headers()
+
+    def do_GET(self):
+        start, end = [int(v) for v in self.headers['Range'].split('=')[1].split('-')]
+        body = StubRangeHandler.content[start:end + 1]
+        StubRangeHandler.bytes_sent += len(body)
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{end}/{len(StubRangeHandler.content)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def test_gfed_emissions_remote(tmp_path, monkeypatch, stub_server):
+    days = [date(2015, 7, d) for d in range(1, 11)]
+    make_gfed_file(tmp_path / 'gfed_data_2015.hdf5', 2015, days)
+    StubRangeHandler.content = (tmp_path / 'gfed_data_2015.hdf5').read_bytes()
+    folder = tmp_path / 'gfed'
+    folder.mkdir()
+    monkeypatch.setattr('utils.gfed_utils.BASE_URL', stub_server(StubRangeHandler))
+
+    actual = get_gfed_emissions_data_for_range(date(2015, 7, 2), date(2015, 7, 4), -7.25, -7.0, 12.875, 13.125, 
+                                               gfed_files_folder=str(folder), remote=True)
+    expected = get_gfed_emissions_data_for_range(date(2015, 7, 2), date(2015, 7, 4), -7.25, -7.0, 12.875, 13.125, 
+                                                 gfed_files_folder=str(tmp_path))
+    assert(actual.equals(expected))
+    # Only a small part of the file was fetched and nothing was downloaded
+    assert(StubRangeHandler.bytes_sent < len(StubRangeHandler.content) / 4)
+    assert(os.listdir(folder) == [])
+
+def test_http_range_file_cached_blocks(stub_server):
+    StubRangeHandler.content = bytes(range(256)) * 64
+
+    remote_file = HTTPRangeFile(stub_server(StubRangeHandler) + 'file', block_size=1024)
+    remote_file.seek(2048)
+    assert(remote_file.read(1024) == StubRangeHandler.content[2048:3072])
+    StubRangeHandler.bytes_sent = 0
+    # Blocks on each side of the cached block are fetched by two requests
+    remote_file.seek(0)
+    assert(remote_file.read(5 * 1024) == StubRangeHandler.content[:5 * 1024])
+
+    assert(remote_file.nb_requests == 3)
+    assert(StubRangeHandler.bytes_sent == 4 * 1024)
+
+def test_http_range_file_close(stub_server, monkeypatch):
+    StubRangeHandler.content = bytes(range(256))
+    closed_sessions = []
+    class Session(requests.Session):
+        def close(self):
+            closed_sessions.append(self)
+            super().close()
+    monkeypatch.setattr('requests.Session', Session)
+    url = stub_server(StubRangeHandler) + 'file'
+
+    own_session_file = HTTPRangeFile(url)
+    shared_session = Session()
+    shared_session_file = HTTPRangeFile(url, session=shared_session)
+    own_session_file.close()
+    shared_session_file.close()
+
+    # Only the session opened by the file is closed with it
+    assert(own_session_file.closed and shared_session_file.closed)
+    assert(closed_sessions == [own_session_file.session])
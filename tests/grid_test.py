@@ -0,0 +1,60 @@
+from utils.grid_utils import GridSpec, GFED_GRID, cube_to_dataframe, join_window_cubes
+from utils.gfed_utils import coordinates_selecter
+from datetime import date
+import numpy as np
+import pandas as pd
+
+def test_grid_window():
+   earth_map = np.arange(720 * 1440).reshape(720, 1440)
+
+   assert(GFED_GRID.bbox_to_indexes(-7.25, -7.0, 12.875, 13.125) == (331, 332, 771, 772))
+   # Rows of the window are sorted by ascending latitude
+   assert((GFED_GRID.window(earth_map, -7.25, -7.0, 12.875, 13.125) == np.array([[388 * 1440 + 771, 388 * 1440 + 772],
+                                                                                [387 * 1440 + 771, 387 * 1440 + 772]])).all())
+   # Leading dimensions are kept
+   assert(GFED_GRID.window(np.stack([earth_map] * 3), -7.25, -7.0, 12.875, 13.125).shape == (3, 2, 2))
+
+   latitudes, longitudes = GFED_GRID.window_coordinates(-7.25, -7.0, 12.875, 13.125)
+   assert((latitudes == [-7.125, -6.875]).all() and (longitudes == [12.875, 13.125]).all())
+   assert((coordinates_selecter(-7.25, -7.0, 12.875, 13.125) == [[-7.125, 12.875], [-7.125, 13.125], 
+                                                                 [-6.875, 12.875], [-6.875, 13.125]]).all())
+
+def test_grid_spec():
+   # Regional grid of 8 x 6 cells of 0.5°, from (-10, 10) to (-6, 13)
+   grid = GridSpec(resolution=0.5, lat_origin=-10, lng_origin=10, nb_rows=8, nb_cols=6)
+   earth_map = np.arange(8 * 6).reshape(8, 6)
+
+   assert(grid.bbox_to_indexes(-9, -8.1, 11, 11.9) == (2, 3, 2, 3))
+   assert((grid.window(earth_map, -9, -8.1, 11, 11.9) == np.array([[5 * 6 + 2, 5 * 6 + 3], [4 * 6 + 2, 4 * 6 + 3]])).all())
+   latitudes, longitudes = grid.window_coordinates(-9, -8.1, 11, 11.9)
+   assert((latitudes == [-8.75, -8.25]).all() and (longitudes == [11.25, 11.75]).all())
+   assert(grid.latitudes[-1] == -6.25 and grid.longitudes[-1] == 12.75)
+
+def test_join_window_cubes():
+   start_date, end_date = date(2015, 7, 10), date(2015, 7, 13)
+   coordinates = coordinates_selecter(-7.25, -6.5, 12.875, 13.5)
+   latitudes, longitudes = GFED_GRID.window_coordinates(-7.25, -6.5, 12.875, 13.5)
+   dates = pd.date_range(start_date, end_date)
+   # Cell-major left rows, as produced by the fire indexes, with a cell outside of the window
+   left = pd.DataFrame({
+      'latitude': np.repeat(np.append(coordinates[:, 0], 30.125), len(dates)),
+      'longitude': np.repeat(np.append(coordinates[:, 1], 1.125), len(dates)),
+      'date': np.tile(dates.to_numpy(), len(coordinates) + 1),
+      'fwi': np.arange((len(coordinates) + 1) * len(dates), dtype=np.float64)
+   })
+   # Burned area of some days only, emissions of every day but the last one
+   burned_area_dates = dates.to_numpy().astype('datetime64[D]')[[0, 2]]
+   burned_area = np.arange(2 * len(coordinates), dtype=np.int32).reshape(2, len(latitudes), len(longitudes))
+   emissions_dates = dates.to_numpy().astype('datetime64[D]')[:-1]
+   emissions = (np.arange(3 * len(coordinates), dtype=np.float32) / 10).reshape(3, len(latitudes), len(longitudes))
+
+   actual = join_window_cubes(left, {'burned_area': (burned_area_dates, burned_area), 'fire_carbon_emission': (emissions_dates, emissions),
+                                     'missing': (np.array([], dtype='datetime64[D]'), None)}, -7.25, -6.5, 12.875, 13.5)
+   expected = pd.merge(pd.merge(left, cube_to_dataframe(burned_area, burned_area_dates, latitudes, longitudes, 'burned_area'), 
+                                how='left', on=['latitude', 'longitude', 'date']), 
+                       cube_to_dataframe(emissions, emissions_dates, latitudes, longitudes, 'fire_carbon_emission'), 
+                       how='left', on=['latitude', 'longitude', 'date'])
+
+   assert(actual.drop(columns='missing').equals(expected.astype({'burned_area': np.float64})))
+   assert(actual['fire_carbon_emission'].dtype == np.float32)
+   assert(actual['missing'].isna().all())
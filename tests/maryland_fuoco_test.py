@@ -1,6 +1,11 @@
 from utils.maryland_fuoco_utils import *
 import pandas as pd
 import numpy as np
+import paramiko
+import socket
+import threading
+import json
+import multiprocessing
 
 def test_maryland_fuoco():
     actual = get_daily_burned_area_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25,
@@ -11,4 +16,213 @@ def test_maryland_fuoco():
        [-7.125, 12.875, pd.Timestamp('2015-07-12 00:00:00'), 6431],
        [-7.125, 12.875, pd.Timestamp('2015-07-13 00:00:00'), 45016]])
     
-    assert((actual == expected).all())
\ No newline at end of file
+    assert((actual == expected).all())
+class StubSFTPServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+class StubSFTPInterface(paramiko.SFTPServerInterface):
+    """Stand-in of the Fuoco server serving files of a local folder, counting the requests received."""
+    root = '.'
+    requests = []
+
+    def to_local(self, path):
+        return os.path.join(StubSFTPInterface.root, self.canonicalize(path).lstrip('/'))
+
+    def list_folder(self, path):
+        StubSFTPInterface.requests.append(('list', path))
+        try:
+            attributes = []
+            for name in os.listdir(self.to_local(path)):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(self.to_local(path), name)))
+                attr.filename = name
+                attributes.append(attr)
+            return attributes
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        StubSFTPInterface.requests.append(('stat', path))
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.to_local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        StubSFTPInterface.requests.append(('open', path))
+        try:
+            handle = paramiko.SFTPHandle(flags)
+            handle.readfile = open(self.to_local(path), 'rb')
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+def start_stub_sftp_server(root):
+    """Starts an SFTP server serving the files of root on a local port, returns the port."""
+    StubSFTPInterface.root = str(root)
+    StubSFTPInterface.requests = []
+    host_key = paramiko.RSAKey.generate(2048)
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(('127.0.0.1', 0))
+    server_socket.listen()
+
+    def serve():
+        while True:
+            client, _ = server_socket.accept()
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StubSFTPInterface)
+            transport.start_server(server=StubSFTPServer())
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server_socket.getsockname()[1]
+
+def test_maryland_fuoco_parallel_fetch(tmp_path, monkeypatch):
+    remote_days = [date(2015, 12, 30), date(2016, 1, 1), date(2016, 1, 3), date(2016, 1, 4)]
+    for d in remote_days:
+        os.makedirs(tmp_path / 'remote' / get_remote_folder(d.year), exist_ok=True)
+        (tmp_path / 'remote' / get_remote_folder(d.year) / get_remote_file_name(d)).write_bytes(d.isoformat().encode() * 1000)
+    local_folder = tmp_path / 'local'
+    local_folder.mkdir()
+    monkeypatch.setattr('utils.maryland_fuoco_utils.HOST', '127.0.0.1')
+    monkeypatch.setattr('utils.maryland_fuoco_utils.PORT', start_stub_sftp_server(tmp_path / 'remote'))
+    monkeypatch.setattr('utils.maryland_fuoco_utils.remote_listings', {})
+
+    fetch_daily_files(date(2015, 12, 29), date(2016, 1, 3), str(local_folder), max_connections=3)
+    fetch_daily_files(date(2016, 1, 2), date(2016, 1, 4), str(local_folder), max_connections=3)
+
+    # Each file of the range is downloaded once
+    assert(sorted(os.listdir(local_folder)) == sorted(f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf' for d in remote_days))
+    for d in remote_days:
+        assert((local_folder / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf').read_bytes() == d.isoformat().encode() * 1000)
+    # The folder of a year is listed again only when a day is missing from its listing in memory
+    assert(sorted(path for request, path in StubSFTPInterface.requests if request == 'list') == 
+           [get_remote_folder(2015), get_remote_folder(2016), get_remote_folder(2016)])
+    assert(len([path for request, path in StubSFTPInterface.requests if request == 'open']) == len(remote_days))
+
+    # A file published since the last listing is downloaded
+    published = date(2016, 1, 2)
+    (tmp_path / 'remote' / get_remote_folder(2016) / get_remote_file_name(published)).write_bytes(b'published')
+    fetch_daily_files(date(2016, 1, 2), date(2016, 1, 4), str(local_folder), max_connections=3)
+    assert((local_folder / 'daily_burned_area_2_1_2016.hdf').read_bytes() == b'published')
+
+def make_daily_file(path, d, distributions=False):
+    """
+    Writes a synthetic Fuoco daily file whose burned area of a cell is its row * 1440 + column + day, and
+    if distributions is set, whose burned area of a tree cover or land cover bin is the bin * 100 + day.
+    """
+    local_file = SD(str(path), SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    database = local_file.create('BurnedArea', SDC.INT32, (720, 1440))
+    database[:] = (np.arange(720 * 1440).reshape(720, 1440) + d.day).astype(np.int32)
+    database.endaccess()
+    if distributions:
+        for layer, nb_bins in [('TreeCoverDist', 20), ('LandCoverDist', 18)]:
+            database = local_file.create(layer, SDC.INT16, (nb_bins, 720, 1440))
+            database[:] = np.broadcast_to((np.arange(nb_bins) * 100 + d.day).astype(np.int16)[:, None, None], (nb_bins, 720, 1440))
+            database.endaccess()
+    local_file.end()
+
+def test_maryland_fuoco_cube(tmp_path, monkeypatch):
+    days = [date(2015, 12, 30), date(2016, 1, 1), date(2016, 1, 2)]
+    for d in days:
+        make_daily_file(tmp_path / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf', d)
+    monkeypatch.setattr('utils.maryland_fuoco_utils.fetch_daily_files', lambda *args, **kwargs: None)
+    reads = []
+    read_layer = read_daily_layer
+    monkeypatch.setattr('utils.maryland_fuoco_utils.read_daily_layer', lambda path, layer: reads.append(path) or read_layer(path, layer))
+
+    expected = get_daily_burned_area_data(date(2015, 12, 29), date(2016, 1, 3), -7.25, -7.0, 12.875, 13.125, str(tmp_path))
+    actual = get_daily_burned_area_data(date(2015, 12, 29), date(2016, 1, 3), -7.25, -7.0, 12.875, 13.125, str(tmp_path), 
+                                        cube_folder=str(tmp_path))
+    assert(actual.equals(expected))
+    assert(len(reads) == len(days))
+    assert(json.load(open(tmp_path / 'burned_area_2016.json'))['days'] == [0, 1])
+
+    # A new day is added to the existing cube, other days aren't read again
+    make_daily_file(tmp_path / 'daily_burned_area_3_1_2016.hdf', date(2016, 1, 3))
+    actual = get_daily_burned_area_data(date(2016, 1, 2), date(2016, 1, 3), -7.25, -7.0, 12.875, 13.125, str(tmp_path), 
+                                        cube_folder=str(tmp_path))
+    assert(len(reads) == len(days) + 1)
+    assert(list(actual['date'].drop_duplicates()) == [pd.Timestamp('2016-01-02'), pd.Timestamp('2016-01-03')])
+    assert((actual['burned_area'] == (719 - np.floor((actual['latitude'] + 90) * 4)) * 1440 + 
+            np.floor((actual['longitude'] + 180) * 4) + actual['date'].dt.day).all())
+
+def update_cube_days(folder):
+    """Updates the 2016 cube of a folder in a worker process, returns only its days (not the whole cube)."""
+    return update_burned_area_cube(2016, folder, folder)[1]['days']
+
+def test_maryland_fuoco_cube_processes(tmp_path):
+    days = [date(2016, 1, d) for d in range(1, 5)]
+    for d in days:
+        make_daily_file(tmp_path / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf', d)
+
+    # Processes updating the same cube at once wait for each other
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(update_cube_days, str(tmp_path)) for _ in range(2)]
+        results = [future.result() for future in futures]
+
+    assert(results == [[0, 1, 2, 3]] * 2)
+    cube, metadata = update_burned_area_cube(2016, str(tmp_path), str(tmp_path))
+    assert(metadata['days'] == [0, 1, 2, 3])
+    assert((cube[:4, 0, 0] == [1, 2, 3, 4]).all())
+    assert(not os.path.exists(tmp_path / 'burned_area_2016.npy.part'))
+
+def test_maryland_fuoco_distributions(tmp_path, monkeypatch):
+    for d in [date(2015, 7, 10), date(2015, 7, 12)]:
+        make_daily_file(tmp_path / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf', d, distributions=True)
+    monkeypatch.setattr('utils.maryland_fuoco_utils.fetch_daily_files', lambda *args, **kwargs: None)
+
+    tree_cover = get_tree_cover_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path))
+    land_cover = get_land_cover_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path))
+    wide_land_cover = get_land_cover_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path), wide=True)
+
+    # A row by day, bin and cell
+    assert(tree_cover.shape == (2 * 20 * 4, 5) and land_cover.shape == (2 * 18 * 4, 5))
+    assert(list(tree_cover['tree_cover_fraction'].cat.categories) == get_tree_cover_labels(20))
+    assert(tree_cover['tree_cover_fraction'].iloc[-1] == '95% - 100%')
+    assert((tree_cover['burned_area'] == tree_cover['tree_cover_fraction'].cat.codes.astype(int) * 100 + tree_cover['date'].dt.day).all())
+    # Bins of unused land classes have no label
+    assert(land_cover['land_class'].isna().sum() == 2 * 3 * 4)
+    # A row by day and cell with a column by land class
+    assert(wide_land_cover.shape == (2 * 4, 3 + 15))
+    assert((wide_land_cover['croplands'] == 12 * 100 + wide_land_cover['date'].dt.day).all())
+
+def test_maryland_fuoco_single_pass(tmp_path, monkeypatch):
+    for d in [date(2015, 7, 10), date(2015, 7, 12)]:
+        make_daily_file(tmp_path / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf', d, distributions=True)
+    fetches = []
+    monkeypatch.setattr('utils.maryland_fuoco_utils.fetch_daily_files', lambda *args, **kwargs: fetches.append(args))
+    opened = []
+    monkeypatch.setattr('utils.maryland_fuoco_utils.SD', lambda path, mode: opened.append(path) or SD(path, mode))
+
+    actual = get_fuoco_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, daily_burned_area_folder=str(tmp_path))
+
+    # Files are fetched and opened once for all layers
+    assert(len(fetches) == 1 and len(opened) == 2)
+    assert(actual['BurnedArea'].equals(get_daily_burned_area_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path))))
+    assert(actual['TreeCoverDist'].equals(get_tree_cover_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path))))
+    assert(actual['LandCoverDist'].equals(get_land_cover_data(date(2015, 7, 10), date(2015, 7, 12), -7.25, -7.0, 12.875, 13.125, str(tmp_path))))
+
+def test_maryland_fuoco_workers(tmp_path):
+    days = [date(2015, 7, 10), date(2015, 7, 11), date(2015, 7, 13), date(2015, 7, 14)]
+    for d in days:
+        make_daily_file(tmp_path / f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf', d, distributions=True)
+
+    expected_dates, expected = read_daily_layers(date(2015, 7, 10), date(2015, 7, 14), -7.25, -7.0, 12.875, 13.125, 
+                                                 daily_burned_area_folder=str(tmp_path))
+    actual_dates, actual = read_daily_layers(date(2015, 7, 10), date(2015, 7, 14), -7.25, -7.0, 12.875, 13.125, 
+                                             daily_burned_area_folder=str(tmp_path), max_workers=2)
+
+    # Windows are stored by day index whatever the order files are read in
+    assert(actual_dates == expected_dates == days)
+    for layer in FUOCO_LAYERS:
+        assert(actual[layer].dtype == expected[layer].dtype and (actual[layer] == expected[layer]).all())
+    assert(actual['TreeCoverDist'].shape == (4, 20, 2, 2))
@@ -0,0 +1,70 @@
+from utils.open_meteo_utils import *
+from utils.meteo_utils import get_meteo_data
+from utils.custom_exceptions import MeteoProviderNotAvailableException
+import numpy as np
+import pandas as pd
+import http.server
+import urllib.parse
+import json
+import pytest
+
+class StubOpenMeteoHandler(http.server.BaseHTTPRequestHandler):
+   """Stub of the Open-Meteo archive API answering with values made from the requested points."""
+   nb_requests = 0
+
+   def do_GET(self):
+      StubOpenMeteoHandler.nb_requests += 1
+      query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+      latitudes = [float(v) for v in query['latitude'][0].split(',')]
+      longitudes = [float(v) for v in query['longitude'][0].split(',')]
+      days = pd.date_range(query['start_date'][0], query['end_date'][0])
+      data = [{
+         # Open-Meteo answers with the coordinates of its own grid
+         'latitude': lat + 0.01,
+         'longitude': lng - 0.01,
+         'daily': {
+            'time': [d.strftime('%Y-%m-%d') for d in days],
+            'temperature_2m_max': [lat + d.day for d in days],
+            'precipitation_sum': [float(d.day) for d in days],
+            'wind_speed_10m_max': [lng for d in days]
+         },
+         'hourly': {
+            'time': [h.strftime('%Y-%m-%dT%H:%M') for h in pd.date_range(days[0], periods=24 * len(days), freq='H')],
+            'relative_humidity_2m': [50 + d.day + h for d in days for h in range(24)]
+         }
+      } for lat, lng in zip(latitudes, longitudes)]
+      body = json.dumps(data if len(data) > 1 else data[0]).encode()
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+   def log_message(self, format, *args):
+      pass
+
+def test_open_meteo(monkeypatch, stub_server):
+   monkeypatch.setattr('utils.open_meteo_utils.OPEN_METEO_URL', stub_server(StubOpenMeteoHandler))
+
+   single = get_meteo_data('open_meteo', date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25, 12.875, 12.875)
+   StubOpenMeteoHandler.nb_requests = 0
+   # 3 x 3 cells split into small batches
+   actual = get_meteo_data('open_meteo', date(2015, 7, 10), date(2015, 7, 13), -7.25, -6.75, 12.875, 13.375,
+                           max_workers=2, max_url_length=60)
+
+   assert(list(single.columns) == ['date', 'latitude', 'longitude', 'temperature', 'precipitation', 'air_humidity', 'wind_speed'])
+   assert((single.to_numpy() == np.array([[pd.Timestamp('2015-07-10'), -7.125, 12.875, -7.125 + 10, 10.0, 50 + 10 + 11.5, 12.875],
+                                          [pd.Timestamp('2015-07-11'), -7.125, 12.875, -7.125 + 11, 11.0, 50 + 11 + 11.5, 12.875],
+                                          [pd.Timestamp('2015-07-12'), -7.125, 12.875, -7.125 + 12, 12.0, 50 + 12 + 11.5, 12.875],
+                                          [pd.Timestamp('2015-07-13'), -7.125, 12.875, -7.125 + 13, 13.0, 50 + 13 + 11.5, 12.875]], dtype=object)).all())
+
+   assert(StubOpenMeteoHandler.nb_requests > 1)
+   assert(actual.shape == (36, 7))
+   # Cells keep their coordinates on the 0.25° grid, in the order they were selected
+   assert((actual[['latitude', 'longitude']].drop_duplicates().to_numpy() == coordinates_selecter(-7.25, -6.75, 12.875, 13.375)).all())
+   assert((actual['temperature'] == actual['latitude'] + actual['date'].dt.day).all())
+   assert((actual['air_humidity'] == 50 + actual['date'].dt.day + 11.5).all())
+
+def test_meteo_provider_not_available():
+   with pytest.raises(MeteoProviderNotAvailableException):
+      get_meteo_data('unknown', date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25, 12.875, 12.875)
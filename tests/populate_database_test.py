@@ -0,0 +1,197 @@
+from populate_database import *
+from utils.gfed_utils import coordinates_selecter
+
+def get_synthetic_meteo_data(provider, start_date, end_date, lat_min, lat_max, lng_min, lng_max, show_progress=False, **kwargs):
+   """Meteo data of each cell and day made from its coordinates and date."""
+   coordinates = coordinates_selecter(lat_min, lat_max, lng_min, lng_max)
+   dates = pd.date_range(start_date, end_date)
+   day_of_year = np.tile(dates.dayofyear.to_numpy(), len(coordinates))
+   latitudes = np.repeat(coordinates[:, 0], len(dates))
+   return pd.DataFrame({
+      'date': np.tile(dates.to_numpy(), len(coordinates)),
+      'latitude': latitudes,
+      'longitude': np.repeat(coordinates[:, 1], len(dates)),
+      'temperature': 20 + 10 * np.sin(day_of_year / 7 + latitudes),
+      'precipitation': np.where(day_of_year % 5 == 0, 8.0, 0.0),
+      'air_humidity': 50 + 20 * np.cos(day_of_year / 3),
+      'wind_speed': 3 + (day_of_year % 4)
+   })
+
+def get_synthetic_burned_area_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max, **kwargs):
+   """Burned area of every other day."""
+   latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+   dates = pd.date_range(start_date, end_date)
+   dates = dates[dates.day % 2 == 0].to_numpy().astype('datetime64[D]')
+   days = pd.to_datetime(dates).day.to_numpy()
+   window = (latitudes[None, :, None] * 10 + days[:, None, None] + 0 * longitudes[None, None, :]).astype(np.int32)
+   return dates, window
+
+def get_synthetic_emissions_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max, **kwargs):
+   latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+   dates = pd.date_range(start_date, end_date).to_numpy().astype('datetime64[D]')
+   days = pd.to_datetime(dates).day.to_numpy()
+   window = (longitudes[None, None, :] + days[:, None, None] + 0 * latitudes[None, :, None]).astype(np.float32)
+   return dates, window
+
+def test_split_in_chunks():
+   # 3 x 3 cells over 10 days
+   assert(list(split_in_chunks(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375)) == 
+          [(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375)])
+   # Whole rows of cells over the whole time range
+   assert(list(split_in_chunks(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375, max_rows=60)) == 
+          [(date(2015, 7, 1), date(2015, 7, 10), -7.125, -6.875, 12.875, 13.375), 
+           (date(2015, 7, 1), date(2015, 7, 10), -6.625, -6.625, 12.875, 13.375)])
+   # A row of cells over blocks of days
+   chunks = list(split_in_chunks(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375, max_rows=12))
+   assert(len(chunks) == 3 * 3)
+   assert(chunks[:3] == [(date(2015, 7, 1), date(2015, 7, 4), -7.125, -7.125, 12.875, 13.375),
+                         (date(2015, 7, 5), date(2015, 7, 8), -7.125, -7.125, 12.875, 13.375),
+                         (date(2015, 7, 9), date(2015, 7, 10), -7.125, -7.125, 12.875, 13.375)])
+   # Blocks of longitudes of a row of cells over blocks of whole date intervals
+   chunks = list(split_in_chunks(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375, max_rows=12, date_interval_size=5))
+   assert(len(chunks) == 3 * 2 * 2)
+   assert(chunks[:4] == [(date(2015, 7, 1), date(2015, 7, 5), -7.125, -7.125, 12.875, 13.125),
+                         (date(2015, 7, 6), date(2015, 7, 10), -7.125, -7.125, 12.875, 13.125),
+                         (date(2015, 7, 1), date(2015, 7, 5), -7.125, -7.125, 13.375, 13.375),
+                         (date(2015, 7, 6), date(2015, 7, 10), -7.125, -7.125, 13.375, 13.375)])
+   # A single cell over a day when a row of cells doesn't fit
+   chunks = list(split_in_chunks(date(2015, 7, 1), date(2015, 7, 10), -7.25, -6.75, 12.875, 13.375, max_rows=1))
+   assert(len(chunks) == 3 * 3 * 10)
+   assert(chunks[10] == (date(2015, 7, 1), date(2015, 7, 1), -7.125, -7.125, 13.125, 13.125))
+
+def test_generate_chunks_data(monkeypatch):
+   monkeypatch.setattr('populate_database.get_meteo_data', get_synthetic_meteo_data)
+   monkeypatch.setattr('populate_database.get_daily_burned_area_window', get_synthetic_burned_area_window)
+   monkeypatch.setattr('populate_database.get_gfed_emissions_window', get_synthetic_emissions_window)
+   bounds = (date(2015, 7, 1), date(2015, 7, 20), -7.25, -6.75, 12.875, 13.375)
+
+   [(_, expected, expected_state)] = list(generate_chunks_data(*bounds, show_progress='none'))
+   chunks = list(generate_chunks_data(*bounds, max_rows=12, show_progress='none'))
+   actual = pd.concat([df for _, df, _ in chunks], ignore_index=True)
+
+   # Chunks have the same rows as the whole range, fire weather indexes continue from a day block to the next
+   assert(max(len(df) for _, df, _ in chunks) <= 12)
+   actual = actual.sort_values(['latitude', 'longitude', 'date']).reset_index(drop=True)
+   assert(actual.drop(columns=['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']).equals(expected.drop(columns=['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi'])))
+   assert(np.allclose(actual[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(dtype=np.float64), 
+                      expected[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(dtype=np.float64)))
+   # The moisture codes of the last day of each cell are in the last day block of its cells
+   last_states = pd.concat([state for chunk_end, _, state in chunks if chunk_end == bounds[1]], ignore_index=True)
+   assert(np.allclose(last_states.sort_values(['latitude', 'longitude'])[['ffmc', 'dmc', 'dc']].to_numpy(), 
+                      expected_state[['ffmc', 'dmc', 'dc']].to_numpy()))
+
+def test_generate_chunks_data_intervals(monkeypatch):
+   monkeypatch.setattr('populate_database.get_meteo_data', get_synthetic_meteo_data)
+   monkeypatch.setattr('populate_database.get_daily_burned_area_window', get_synthetic_burned_area_window)
+   monkeypatch.setattr('populate_database.get_gfed_emissions_window', get_synthetic_emissions_window)
+   bounds = (date(2015, 7, 1), date(2015, 7, 20), -7.25, -6.75, 12.875, 13.375)
+   options = {'date_interval_size': 3, 'spin_up_size': 4, 'show_progress': 'none'}
+
+   [(_, expected, _)] = list(generate_chunks_data(*bounds, **options))
+   chunks = list(generate_chunks_data(*bounds, max_rows=21, **options))
+   actual = pd.concat([df for _, df, _ in chunks], ignore_index=True)
+
+   # Day blocks are made of the date intervals of the whole range, with the same spin-up days
+   assert(len(chunks) > 3)
+   assert(max(len(df) for _, df, _ in chunks) <= 21)
+   actual = actual.sort_values(['latitude', 'longitude', 'date']).reset_index(drop=True)
+   assert(actual.drop(columns=['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']).equals(expected.drop(columns=['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi'])))
+   assert(np.allclose(actual[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(dtype=np.float64), 
+                      expected[['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']].to_numpy(dtype=np.float64)))
+
+class FakeCursor:
+   """Cursor of a fake connection keeping the primary keys of wildfires_data in a set."""
+   def __init__(self, connection):
+      self.connection = connection
+      self.rowcount = 0
+
+   def execute(self, query, params=None):
+      if query == STAGING_CLEAR_QUERY:
+         self.connection.staging = []
+      elif query == STAGING_MERGE_QUERY:
+         keys = {(row[0], row[1], row[2]) for row in self.connection.staging} - self.connection.keys
+         self.connection.pending |= keys
+         self.rowcount = len(keys)
+
+   def executemany(self, query, params):
+      if any(row[0] < 0 for row in params):
+         raise Error('Out of range value for column latitude')
+      self.connection.staging += params
+
+   def close(self):
+      pass
+
+class FakeConnection:
+   def __init__(self, keys):
+      self.keys, self.pending, self.staging = set(keys), set(), []
+      self.nb_commits = 0
+
+   def cursor(self):
+      return FakeCursor(self)
+
+   def commit(self):
+      self.keys |= self.pending
+      self.pending = set()
+      self.nb_commits += 1
+
+   def rollback(self):
+      self.pending = set()
+
+   def close(self):
+      pass
+
+def test_bulk_insert_dataframe():
+   df = pd.DataFrame({'latitude': [float(i) for i in range(10)], 'longitude': 1.0, 'date': '2015-07-10'})
+   # Third batch fails
+   df.loc[5, 'latitude'] = -1.0
+   connection = FakeConnection({(0.0, 1.0, '2015-07-10'), (3.0, 1.0, '2015-07-10')})
+
+   stats = bulk_insert_dataframe(connection, df, 1, batch_size=2)
+
+   assert(stats == {'inserted': 6, 'skipped': 2, 'failed': 2})
+   assert(connection.nb_commits == 4)
+   assert(len(connection.keys) == 8)
+
+def test_database_writer(monkeypatch):
+   connection = FakeConnection(set())
+   monkeypatch.setattr('populate_database.connect_to_database', lambda: connection)
+   # Chunks of 5 cells computed faster than they are written
+   original_execute = FakeCursor.execute
+   def slow_execute(self, query, params=None):
+      if query == STAGING_MERGE_QUERY:
+         time.sleep(0.05)
+      original_execute(self, query, params)
+   monkeypatch.setattr(FakeCursor, 'execute', slow_execute)
+
+   writer = DatabaseWriter(queue_size=2, insert_batch_size=2)
+   for i in range(6):
+      df = pd.DataFrame({'latitude': [float(i)] * 5, 'longitude': [float(j) for j in range(5)], 'date': '2015-07-10'})
+      writer.put(df, None, 1)
+   stats = writer.close()
+
+   assert(stats['queued'] == stats['chunks'] == 6)
+   assert((stats['inserted'], stats['skipped'], stats['failed']) == (30, 0, 0))
+   assert(len(connection.keys) == 30)
+   # Producers waited for the writer instead of queuing every chunk
+   assert(stats['max_queue_depth'] <= 2)
+   assert(stats['put_wait_time'] > 0)
+   assert(stats['rows_per_second'] > 0)
+
+def test_database_writer_connections(monkeypatch):
+   connections = []
+   def connect_to_database():
+      connections.append(FakeConnection(set()))
+      return connections[-1]
+   monkeypatch.setattr('populate_database.connect_to_database', connect_to_database)
+   monkeypatch.setattr(FakeConnection, 'close', lambda self: setattr(self, 'closed', True))
+
+   writer = DatabaseWriter(insert_batch_size=10)
+   # The second chunk fails, the next chunks are inserted with connections taken again from the pool
+   for latitude in [1.0, -1.0, 2.0, 3.0]:
+      writer.put(pd.DataFrame({'latitude': [latitude], 'longitude': [1.0], 'date': '2015-07-10'}), None, 1)
+   stats = writer.close()
+
+   assert((stats['inserted'], stats['failed']) == (3, 1))
+   # A connection is given back after each chunk
+   assert(len(connections) == 4)
+   assert(all(connection.closed for connection in connections))
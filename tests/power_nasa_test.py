@@ -1,6 +1,11 @@
 from utils.power_nasa_utils import *
 import numpy as np
 import pandas as pd
+import http.server
+import threading
+import urllib.parse
+import json
+import os
 
 def test_power_nasa():
    actual = get_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25,
@@ -11,4 +16,139 @@ def test_power_nasa():
       [pd.Timestamp('2015-07-12 00:00:00'), -7.125, 12.875, 23.9, 0.0, 76.5, 2.79],
       [pd.Timestamp('2015-07-13 00:00:00'), -7.125, 12.875, 23.61, 0.0, 76.31, 2.99]])
    
-   assert((actual == expected).all())
\ No newline at end of file
+   assert((actual == expected).all())
+
+class StubPowerHandler(http.server.BaseHTTPRequestHandler):
+   """Stub of the POWER API answering with values made from the requested point, 
+   the first request of each point fails to check retries."""
+   failed_points = set()
+   requested_ranges = []
+   unpublished_days = set() # Days answered with fill values
+   lock = threading.Lock()
+
+   def do_GET(self):
+      query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+      latitude, longitude = float(query['latitude'][0]), float(query['longitude'][0])
+      with StubPowerHandler.lock:
+         first_request = (latitude, longitude) not in StubPowerHandler.failed_points
+         StubPowerHandler.failed_points.add((latitude, longitude))
+      if first_request:
+         self.send_response(503)
+         self.end_headers()
+         return
+
+      with StubPowerHandler.lock:
+         StubPowerHandler.requested_ranges.append((query['start'][0], query['end'][0]))
+      days = [d.strftime('%Y%m%d') for d in pd.date_range(query['start'][0], query['end'][0])]
+      body = json.dumps({
+         'geometry': {'coordinates': [longitude, latitude, 100.0]},
+         'properties': {'parameter': {
+            'T2M': {d: -999 if d in StubPowerHandler.unpublished_days else latitude + int(d[-2:]) for d in days},
+            'PRECIPITATIONCAL': {d: float(d[-2:]) for d in days},
+            'RH2M': {d: longitude + int(d[-2:]) for d in days},
+            'WS10M': {d: latitude * longitude for d in days}
+         }}
+      }).encode()
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+   def log_message(self, format, *args):
+      pass
+
+def test_power_nasa_concurrent(monkeypatch, stub_server):
+   monkeypatch.setattr('utils.power_nasa_utils.POWER_URL', stub_server(StubPowerHandler))
+
+   expected = get_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -6.75, 12.875, 13.375, max_workers=1, retries=1)
+   actual = get_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -6.75, 12.875, 13.375, max_workers=4, retries=1)
+
+   # 3 x 3 cells of 4 days, in the same order as the serial fetch
+   assert(actual.shape == (36, 7))
+   assert(actual.equals(expected))
+   assert((actual['temperature'] == actual['latitude'] + actual['date'].dt.day).all())
+
+def test_power_nasa_cache(monkeypatch, tmp_path, stub_server):
+   monkeypatch.setattr('utils.power_nasa_utils.POWER_URL', stub_server(StubPowerHandler))
+   
+   get_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -7.25, 12.875, 12.875, retries=1, cache_folder=str(tmp_path))
+   StubPowerHandler.requested_ranges.clear()
+   # Only days missing from the cache are fetched
+   actual = get_data(date(2015, 7, 12), date(2015, 7, 15), -7.25, -7.25, 12.875, 12.875, retries=1, cache_folder=str(tmp_path))
+   assert(StubPowerHandler.requested_ranges == [('20150714', '20150715')])
+   expected = get_data(date(2015, 7, 12), date(2015, 7, 15), -7.25, -7.25, 12.875, 12.875, retries=1)
+   assert(actual.equals(expected))
+
+   # Cached days are served without any request
+   StubPowerHandler.requested_ranges.clear()
+   actual = get_data(date(2015, 7, 11), date(2015, 7, 14), -7.25, -7.25, 12.875, 12.875, retries=1, cache_folder=str(tmp_path))
+   assert(StubPowerHandler.requested_ranges == [])
+   assert(actual.shape == (4, 7))
+
+   # Least recently used points are evicted over the size limit
+   cache_size = sum(f.stat().st_size for f in tmp_path.iterdir())
+   get_data(date(2015, 7, 10), date(2015, 7, 15), -7.25, -7.25, 13.125, 13.125, retries=1, cache_folder=str(tmp_path), 
+            max_cache_size=cache_size)
+   assert([f.name for f in tmp_path.iterdir()] == [os.path.basename(get_cache_path(str(tmp_path), -7.125, 13.125))])
+
+   # Days that are not published yet are not cached
+   StubPowerHandler.unpublished_days.add('20150716')
+   StubPowerHandler.requested_ranges.clear()
+   for _ in range(2):
+      actual = get_data(date(2015, 7, 14), date(2015, 7, 16), -7.25, -7.25, 13.125, 13.125, retries=1, cache_folder=str(tmp_path))
+   assert(StubPowerHandler.requested_ranges == [('20150716', '20150716')] * 2)
+   assert(actual['temperature'].iloc[-1] == -999)
+   StubPowerHandler.unpublished_days.clear()
+   actual = get_data(date(2015, 7, 14), date(2015, 7, 16), -7.25, -7.25, 13.125, 13.125, retries=1, cache_folder=str(tmp_path))
+   assert(actual['temperature'].iloc[-1] == -7.125 + 16)
+
+class StubPowerRegionalHandler(http.server.BaseHTTPRequestHandler):
+   """Stub of the regional POWER API answering with points of a 0.5° x 0.625° grid within the requested range."""
+   requested_parameters = []
+
+   def do_GET(self):
+      query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+      StubPowerRegionalHandler.requested_parameters.append(query['parameters'][0])
+      days = [d.strftime('%Y%m%d') for d in pd.date_range(query['start'][0], query['end'][0])]
+      latitudes = np.arange(-90, 90.5, 0.5)
+      latitudes = latitudes[(latitudes >= float(query['latitude-min'][0])) & (latitudes <= float(query['latitude-max'][0]))]
+      longitudes = np.arange(-180, 180, 0.625)
+      longitudes = longitudes[(longitudes >= float(query['longitude-min'][0])) & (longitudes <= float(query['longitude-max'][0]))]
+      values = {
+         'T2M': lambda lat, lng, d: lat + int(d[-2:]),
+         'PRECIPITATIONCAL': lambda lat, lng, d: float(d[-2:]),
+         'RH2M': lambda lat, lng, d: lng + int(d[-2:]),
+         'WS10M': lambda lat, lng, d: lat * lng
+      }
+      body = json.dumps({
+         'type': 'FeatureCollection',
+         'features': [{
+            'geometry': {'coordinates': [lng, lat, 100.0]},
+            'properties': {'parameter': {p: {d: values[p](lat, lng, d) for d in days} for p in query['parameters'][0].split(',')}}
+         } for lat in latitudes.tolist() for lng in longitudes.tolist()]
+      }).encode()
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+   def log_message(self, format, *args):
+      pass
+
+def test_power_nasa_regional(monkeypatch, stub_server):
+   monkeypatch.setattr('utils.power_nasa_utils.POWER_REGIONAL_URL', stub_server(StubPowerRegionalHandler))
+
+   actual = get_data(date(2015, 7, 10), date(2015, 7, 13), -7.25, -6.0, 12.875, 14.0, max_workers=4, mode='regional')
+
+   # One request per parameter covers the 6 x 6 cells
+   assert(sorted(StubPowerRegionalHandler.requested_parameters) == sorted(PARAMETERS.split(',')))
+   assert(actual.shape == (144, 7))
+   # Cells keep their coordinates on the 0.25° grid and take values of the nearest point of the POWER grid
+   expected_cells = coordinates_selecter(-7.25, -6.0, 12.875, 14.0)
+   assert((actual[['latitude', 'longitude']].drop_duplicates().to_numpy() == expected_cells).all())
+   nearest_latitude = np.round(actual['latitude'] * 2) / 2
+   nearest_longitude = np.round(actual['longitude'] / 0.625) * 0.625
+   assert((actual['temperature'] == nearest_latitude + actual['date'].dt.day).all())
+   assert((actual['air_humidity'] == nearest_longitude + actual['date'].dt.day).all())
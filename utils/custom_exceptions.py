@@ -5,4 +5,16 @@ class GFED_YearNotAvailableException(Exception):
 class GFED_RequestException(Exception):
     def __init__(self, message, status_code):
         super().__init__(message)
-        self.status_code = status_code
\ No newline at end of file
+        self.status_code = status_code
+
+class GFED_DownloadException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+class MeteoProviderNotAvailableException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+class DatabaseURLException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
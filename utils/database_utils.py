@@ -0,0 +1,148 @@
+import threading
+import time
+import urllib.parse
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
+from mysql.connector.errors import PoolError, Error
+from utils.custom_exceptions import DatabaseURLException
+
+DATABASE_POOL_NAME = 'wildfires_pool'
+DATABASE_POOL_SIZE = 4 # Number of connections of the pool (at most 32)
+DATABASE_POOL_TIMEOUT = 60 # Maximum time in seconds to wait for a free connection of the pool
+
+def parse_database_url(url:str) -> dict:
+    """
+    Transforms a database URL in the format of the Flask app (mysql+mysqlconnector://<user>:<password>@<host>:<port>/<database_name>)
+    into arguments of mysql.connector.connect. Query parameters of the URL are passed as arguments too (ex: ?charset=utf8mb4).
+
+    Parameters
+    ----------
+    url : str
+        the database URL.
+
+    Returns
+    -------
+    out : dict
+        the connection arguments (host, port, user, password, database, ...).
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme.split('+')[0] != 'mysql' or parts.hostname == None or parts.path.strip('/') == '':
+        raise DatabaseURLException("Invalid database URL, expected mysql+mysqlconnector://<user>:<password>@<host>:<port>/<database_name>")
+
+    config = {
+        'host': parts.hostname,
+        'port': parts.port if parts.port != None else 3306,
+        'user': urllib.parse.unquote(parts.username) if parts.username != None else '',
+        'password': urllib.parse.unquote(parts.password) if parts.password != None else '',
+        'database': urllib.parse.unquote(parts.path.strip('/'))
+    }
+    config.update(dict(urllib.parse.parse_qsl(parts.query)))
+    return config
+
+class DatabasePool(MySQLConnectionPool):
+    """
+    Pool of MySQL connections shared by the threads of a process. Unlike MySQLConnectionPool, get_connection waits for a
+    connection to be returned when all of them are in use instead of failing. Connections are checked (and reconnected if
+    needed) when they are taken from the pool, and close() gives them back to the pool.
+
+    Parameters
+    ----------
+    url : str
+        database URL (see parse_database_url).
+    pool_size : int
+        number of connections of the pool, they are all opened when the pool is created. Default is 4.
+    pool_name : str
+        name of the pool. Default is 'wildfires_pool'.
+    timeout : float
+        maximum time in seconds to wait for a free connection. Default is 60.
+    """
+
+    def __init__(self, url:str, pool_size=DATABASE_POOL_SIZE, pool_name=DATABASE_POOL_NAME, timeout:float=DATABASE_POOL_TIMEOUT):
+        self.timeout = timeout
+        self.free_connections = threading.Semaphore(pool_size)
+        self.stats_lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'in_use': 0, 'max_in_use': 0, 'wait_time': 0.0, 'max_wait_time': 0.0, 'timeouts': 0, 'errors': 0}
+        super().__init__(pool_size=pool_size, pool_name=pool_name, **parse_database_url(url))
+
+    def get_connection(self, timeout:float=None) -> PooledMySQLConnection:
+        """
+        Takes a connection from the pool, waiting for one to be returned if all of them are in use.
+
+        Parameters
+        ----------
+        timeout : float
+            maximum time in seconds to wait for a free connection. Default is None (the timeout of the pool).
+
+        Returns
+        -------
+        out : PooledMySQLConnection
+            the connection, its close() method gives it back to the pool.
+        """
+        timeout = timeout if timeout != None else self.timeout
+        start = time.perf_counter()
+        if not self.free_connections.acquire(timeout=timeout):
+            with self.stats_lock:
+                self.stats['timeouts'] += 1
+            raise PoolError(f"No connection of the pool '{self.pool_name}' was returned after {timeout}s")
+        wait_time = time.perf_counter() - start
+
+        try:
+            connection = super().get_connection()
+        except Error:
+            self.free_connections.release()
+            with self.stats_lock:
+                self.stats['errors'] += 1
+            raise
+
+        with self.stats_lock:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            self.stats['max_in_use'] = max(self.stats['max_in_use'], self.stats['in_use'])
+            self.stats['wait_time'] += wait_time
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'], wait_time)
+        return connection
+
+    def add_connection(self, cnx=None):
+        super().add_connection(cnx)
+        # A connection given back to the pool
+        if cnx != None:
+            with self.stats_lock:
+                self.stats['in_use'] -= 1
+            self.free_connections.release()
+
+    def check_health(self, timeout:float=None) -> dict:
+        """
+        Checks that a connection of the pool can run a query.
+
+        Returns
+        -------
+        out : dict
+            'healthy' (bool), 'latency' of a round trip in seconds and 'error' message if the check failed.
+        """
+        start = time.perf_counter()
+        try:
+            connection = self.get_connection(timeout=timeout)
+            try:
+                cursor = connection.cursor()
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+                cursor.close()
+            finally:
+                connection.close()
+        except Error as err:
+            return {'healthy': False, 'latency': time.perf_counter() - start, 'error': str(err)}
+        return {'healthy': True, 'latency': time.perf_counter() - start, 'error': None}
+
+    def get_stats(self) -> dict:
+        """
+        Gets the usage statistics of the pool.
+
+        Returns
+        -------
+        out : dict
+            'pool_size', number of 'checkouts', connections 'in_use' and 'max_in_use', 'wait_time' (total) and 'max_wait_time'
+            in seconds spent waiting for a free connection, number of 'timeouts' and of 'errors' (failed reconnections).
+        """
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['pool_size'] = self.pool_size
+        return stats
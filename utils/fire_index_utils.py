@@ -1,11 +1,21 @@
-from firedanger import firedanger
 import pandas as pd
-import os
 from datetime import date, timedelta, datetime
 import warnings
 import pandas as pd
 from tqdm import tqdm
 import math
+import numpy as np
+import concurrent.futures
+import multiprocessing
+
+# Effective day lengths (hours) used by the Duff Moisture Code, one value per month
+DMC_DAY_LENGTHS = np.array([6.5, 7.5, 9.0, 12.8, 13.9, 13.9, 12.4, 10.9, 9.4, 8.0, 7.0, 6.0])
+# Day length adjustment factors used by the Drought Code, one value per month
+DC_DAY_LENGTH_FACTORS = np.array([-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, 6.4, 5.0, 2.4, 0.4, -1.6, -1.6])
+# Default start-up values of the moisture codes (Van Wagner, 1987)
+FFMC_START = 85.0
+DMC_START = 6.0
+DC_START = 15.0
 
 def convert_to_datetime(d:date):
     """Converts a date to datetime.
@@ -22,10 +32,225 @@ def convert_to_datetime(d:date):
     """
     return datetime(d.year, d.month, d.day)
 
+def calc_ffmc(ffmc0:np.ndarray, temp:np.ndarray, precip:np.ndarray, hum:np.ndarray, wind:np.ndarray) -> np.ndarray:
+    """Calculates the Fine Fuel Moisture Code of a day for many cells at once.
+
+    Parameters
+    ----------
+    ffmc0 : numpy.ndarray
+        FFMC of the previous day.
+    temp : numpy.ndarray
+        air temperature (°C).
+    precip : numpy.ndarray
+        precipitation (mm).
+    hum : numpy.ndarray
+        air humidity (%).
+    wind : numpy.ndarray
+        wind speed (km/h).
+
+    Returns
+    -------
+    out : numpy.ndarray
+        FFMC of the day.
+    """
+    mo = 147.2 * (101.0 - ffmc0) / (59.5 + ffmc0)
+
+    # Rain phase
+    rf = precip - 0.5
+    rain_mo = mo + 42.5 * rf * np.exp(-100.0 / (251.0 - mo)) * (1.0 - np.exp(-6.93 / rf))
+    rain_mo = np.where(mo > 150.0, rain_mo + 0.0015 * (mo - 150.0)**2 * np.sqrt(np.maximum(rf, 0)), rain_mo)
+    mo = np.where(precip > 0.5, np.minimum(rain_mo, 250.0), mo)
+
+    # Drying phase (equilibrium moisture content for drying)
+    ed = 0.942 * hum**0.679 + 11.0 * np.exp((hum - 100.0) / 10.0) + 0.18 * (21.1 - temp) * (1.0 - np.exp(-0.115 * hum))
+    ko = 0.424 * (1.0 - (hum / 100.0)**1.7) + 0.0694 * np.sqrt(wind) * (1.0 - (hum / 100.0)**8)
+    m_dry = ed + (mo - ed) * 10.0**(-ko * 0.581 * np.exp(0.0365 * temp))
+
+    # Wetting phase (equilibrium moisture content for wetting)
+    ew = 0.618 * hum**0.753 + 10.0 * np.exp((hum - 100.0) / 10.0) + 0.18 * (21.1 - temp) * (1.0 - np.exp(-0.115 * hum))
+    k1 = 0.424 * (1.0 - ((100.0 - hum) / 100.0)**1.7) + 0.0694 * np.sqrt(wind) * (1.0 - ((100.0 - hum) / 100.0)**8)
+    m_wet = ew - (ew - mo) * 10.0**(-k1 * 0.581 * np.exp(0.0365 * temp))
+
+    m = np.where(mo > ed, m_dry, np.where(mo < ew, m_wet, mo))
+    return np.clip(59.5 * (250.0 - m) / (147.2 + m), 0.0, 101.0)
+
+def calc_dmc(dmc0:np.ndarray, temp:np.ndarray, precip:np.ndarray, hum:np.ndarray, month:int) -> np.ndarray:
+    """Calculates the Duff Moisture Code of a day for many cells at once.
+
+    Parameters
+    ----------
+    dmc0 : numpy.ndarray
+        DMC of the previous day.
+    temp : numpy.ndarray
+        air temperature (°C).
+    precip : numpy.ndarray
+        precipitation (mm).
+    hum : numpy.ndarray
+        air humidity (%).
+    month : int
+        month of the day (1 to 12).
+
+    Returns
+    -------
+    out : numpy.ndarray
+        DMC of the day.
+    """
+    # Rain phase
+    re = 0.92 * precip - 1.27
+    mo = 20.0 + np.exp(5.6348 - dmc0 / 43.43)
+    b = np.where(dmc0 <= 33.0, 100.0 / (0.5 + 0.3 * dmc0),
+                 np.where(dmc0 <= 65.0, 14.0 - 1.3 * np.log(dmc0), 6.2 * np.log(dmc0) - 17.2))
+    mr = mo + 1000.0 * re / (48.77 + b * re)
+    pr = np.where(precip > 1.5, np.maximum(244.72 - 43.43 * np.log(mr - 20.0), 0.0), dmc0)
+
+    # Drying phase
+    rk = 1.894 * (np.maximum(temp, -1.1) + 1.1) * (100.0 - hum) * DMC_DAY_LENGTHS[month - 1] * 1e-6
+    return np.maximum(pr + 100.0 * rk, 0.0)
+
+def calc_dc(dc0:np.ndarray, temp:np.ndarray, precip:np.ndarray, month:int) -> np.ndarray:
+    """Calculates the Drought Code of a day for many cells at once.
+
+    Parameters
+    ----------
+    dc0 : numpy.ndarray
+        DC of the previous day.
+    temp : numpy.ndarray
+        air temperature (°C).
+    precip : numpy.ndarray
+        precipitation (mm).
+    month : int
+        month of the day (1 to 12).
+
+    Returns
+    -------
+    out : numpy.ndarray
+        DC of the day.
+    """
+    # Rain phase
+    rd = 0.83 * precip - 1.27
+    qr = 800.0 * np.exp(-dc0 / 400.0) + 3.937 * rd
+    dr = np.where(precip > 2.8, np.maximum(400.0 * np.log(800.0 / qr), 0.0), dc0)
+
+    # Drying phase
+    v = np.maximum(0.36 * (np.maximum(temp, -2.8) + 2.8) + DC_DAY_LENGTH_FACTORS[month - 1], 0.0)
+    return dr + 0.5 * v
+
+def calc_isi(ffmc:np.ndarray, wind:np.ndarray) -> np.ndarray:
+    """Calculates the Initial Spread Index from the FFMC and the wind speed (km/h)."""
+    m = 147.2 * (101.0 - ffmc) / (59.5 + ffmc)
+    ff = 91.9 * np.exp(-0.1386 * m) * (1.0 + m**5.31 / 4.93e7)
+    return 0.208 * np.exp(0.05039 * wind) * ff
+
+def calc_bui(dmc:np.ndarray, dc:np.ndarray) -> np.ndarray:
+    """Calculates the Buildup Index from the DMC and the DC."""
+    denominator = dmc + 0.4 * dc
+    bui = np.where(dmc <= 0.4 * dc, 0.8 * dmc * dc / denominator,
+                   dmc - (1.0 - 0.8 * dc / denominator) * (0.92 + (0.0114 * dmc)**1.7))
+    return np.where(denominator > 0, np.maximum(bui, 0.0), 0.0)
+
+def calc_fwi(isi:np.ndarray, bui:np.ndarray) -> np.ndarray:
+    """Calculates the Fire Weather Index from the ISI and the BUI."""
+    fd = np.where(bui <= 80.0, 0.626 * bui**0.809 + 2.0, 1000.0 / (25.0 + 108.64 * np.exp(-0.023 * bui)))
+    b = 0.1 * isi * fd
+    return np.where(b > 1.0, np.exp(2.72 * (0.434 * np.log(b))**0.647), b)
+
+def calc_canadian_fwi(temp:np.ndarray, precip:np.ndarray, hum:np.ndarray, wind:np.ndarray, months:np.ndarray,
+                      ffmc0=FFMC_START, dmc0=DMC_START, dc0=DC_START) -> dict:
+    """
+    Calculates fire indexes (ffmc, dmc, dc, isi, bui and fwi) of the Canadian Forest Fire Weather Index System
+    for many cells at once. Meteo arrays are of shape (cells, days): the calculation steps through the days
+    once and updates all cells together.
+
+    Parameters
+    ----------
+    temp : numpy.ndarray
+        air temperature (°C) of shape (cells, days).
+    precip : numpy.ndarray
+        precipitation (mm) of shape (cells, days).
+    hum : numpy.ndarray
+        air humidity (%) of shape (cells, days).
+    wind : numpy.ndarray
+        wind speed (m/s) of shape (cells, days).
+    months : numpy.ndarray
+        month (1 to 12) of each day, of shape (days,).
+    ffmc0 : float | numpy.ndarray
+        FFMC of the day before the first day, for all cells or for each cell. Default is 85.
+    dmc0 : float | numpy.ndarray
+        DMC of the day before the first day, for all cells or for each cell. Default is 6.
+    dc0 : float | numpy.ndarray
+        DC of the day before the first day, for all cells or for each cell. Default is 15.
+
+    Returns
+    -------
+    out : dict
+        arrays of shape (cells, days) for each index, with keys "ffmc", "dmc", "dc", "isi", "bui" and "fwi".
+    """
+    temp = np.atleast_2d(np.asarray(temp, dtype=np.float64))
+    precip = np.atleast_2d(np.asarray(precip, dtype=np.float64))
+    hum = np.atleast_2d(np.asarray(hum, dtype=np.float64))
+    wind = np.atleast_2d(np.asarray(wind, dtype=np.float64)) * 3.6 # Convert wind speed to km/h
+    months = np.asarray(months, dtype=np.int64)
+    nb_cells, nb_days = temp.shape
+
+    ffmc = np.empty((nb_cells, nb_days))
+    dmc = np.empty((nb_cells, nb_days))
+    dc = np.empty((nb_cells, nb_days))
+
+    previous_ffmc = np.broadcast_to(np.asarray(ffmc0, dtype=np.float64), (nb_cells,))
+    previous_dmc = np.broadcast_to(np.asarray(dmc0, dtype=np.float64), (nb_cells,))
+    previous_dc = np.broadcast_to(np.asarray(dc0, dtype=np.float64), (nb_cells,))
+
+    # Rain and drying branches are evaluated for every cell, so silence warnings of the unused ones
+    with np.errstate(all="ignore"):
+        for day in range(nb_days):
+            previous_ffmc = ffmc[:, day] = calc_ffmc(previous_ffmc, temp[:, day], precip[:, day], hum[:, day], wind[:, day])
+            previous_dmc = dmc[:, day] = calc_dmc(previous_dmc, temp[:, day], precip[:, day], hum[:, day], months[day])
+            previous_dc = dc[:, day] = calc_dc(previous_dc, temp[:, day], precip[:, day], months[day])
+
+        isi = calc_isi(ffmc, wind)
+        bui = calc_bui(dmc, dc)
+        fwi = calc_fwi(isi, bui)
+
+    return {'ffmc': ffmc, 'dmc': dmc, 'dc': dc, 'isi': isi, 'bui': bui, 'fwi': fwi}
+
+def get_interval_bounds(start_date:date, end_date:date, date_index:int, date_interval_size:int, spin_up_size:int=None):
+    """Gets the bounds of a date interval used to calculate fire weather indexes.
+    
+    Parameters
+    ----------
+    start_date : date
+        start date of the whole time range.
+    end_date : date
+        end date of the whole time range.
+    date_index : int
+        index of the date interval in the time range.
+    date_interval_size : int
+        size in days of the date intervals.
+    spin_up_size : int
+        number of days before the interval to calculate fire weather indexes for without keeping them. 
+        Default is None (no spin-up days).
+
+    Returns
+    -------
+    spin_up_start : date
+        first day to calculate fire weather indexes for. It can be before start_date, the days of the dataset 
+        before start_date (if any) are then used as spin-up days.
+    interval_start : date
+        first day of the interval.
+    interval_end : date
+        last day of the interval.
+    """
+    interval_start = start_date + timedelta(days=date_index*date_interval_size)
+    temp_end_interval = start_date + timedelta(days=((date_index + 1)*date_interval_size) - 1)
+    interval_end = end_date if end_date <= temp_end_interval else temp_end_interval
+    spin_up_start = interval_start - timedelta(days=spin_up_size if spin_up_size != None else 0)
+    return spin_up_start, interval_start, interval_end
+
 def get_data_with_fire_indexes(ds:pd.DataFrame, start_date:date, end_date:date, time_name="date", time_format="%Y%m%d", temp_name="temperature",
                                   precip_name="precipitation", hum_name="air_humidity", wind_name="wind_speed", 
                                   temp_meteo_folder=".", date_interval_size:int=None, show_progress=False,
-                                   warnings_action="ignore") -> pd.DataFrame:
+                                   warnings_action="ignore", initial_state:pd.DataFrame=None, spin_up_size:int=None,
+                                   max_workers:int=None) -> pd.DataFrame:
     """
     Adds fire indexes (ffmc, dmc, dc, isi, bui and fwi) to a specified dataset that has to include 
     for each row: the day of the observation (time), the air temperature (°C), precipitation (mm), air humidity (%)
@@ -43,7 +268,7 @@ def get_data_with_fire_indexes(ds:pd.DataFrame, start_date:date, end_date:date,
     time_name : str
         name of the column referring to the time (day) of each observation. Default is "time".
     time_format : str
-        format used for the day of the observation. Default is "%Y%m%d".
+        not used anymore as days are read as datetimes. Kept for backward compatibility.
     temp_name : str
         name of the column referring to the temperature (°C) of each observation. Default is "T".
     precip_name : str
@@ -53,7 +278,7 @@ def get_data_with_fire_indexes(ds:pd.DataFrame, start_date:date, end_date:date,
     wind_name : str
         name of the column referring to the wind speed (m/s) of each observation. Default is "U".
     temp_meteo_folder : str
-        path of the folder where to store temporary files made from meteo data
+        not used anymore as meteo data is not written to temporary files. Kept for backward compatibility.
     date_interval_size : int
         a date interval size in days to calculate fire weather indexes for. 
         This parameter is intended to accelerate the calculation time in detriment to results quality. 
@@ -63,6 +288,17 @@ def get_data_with_fire_indexes(ds:pd.DataFrame, start_date:date, end_date:date,
     warnings_action : str
         decides what action to do if there is warnings displaying. Default is "ignore". Set to None, if 
         the warnings should be displayed. 
+    initial_state : pandas.DataFrame
+        moisture codes (ffmc, dmc and dc) of the day before start_date for each cell (latitude, longitude), 
+        as returned by get_fire_indexes_state. Cells that are not in it start from default codes. 
+        Default is None.
+    spin_up_size : int
+        used with date_interval_size, each date interval starts its calculation this number of days before 
+        its first day. Spin-up days are discarded from the result, they only improve the quality of the 
+        starting codes of the interval. Default is None (no spin-up days).
+    max_workers : int
+        used with date_interval_size, calculates date intervals in parallel on a pool of this number of 
+        processes. Default is None (no parallelism).
 
     Returns
     -------
@@ -70,71 +306,249 @@ def get_data_with_fire_indexes(ds:pd.DataFrame, start_date:date, end_date:date,
         the generated dataframe
     """
 
+    if date_interval_size != None and max_workers != None:
+        return get_data_with_fire_indexes_in_parallel(ds, start_date, end_date, time_name=time_name, temp_name=temp_name, 
+                                                      precip_name=precip_name, hum_name=hum_name, wind_name=wind_name, 
+                                                      date_interval_size=date_interval_size, show_progress=show_progress, 
+                                                      warnings_action=warnings_action, initial_state=initial_state, 
+                                                      spin_up_size=spin_up_size, max_workers=max_workers)
 
-    first_time = True
-    df = pd.DataFrame({
-        'latitude': [],
-        'longitude': [],
-        time_name: [],
-        temp_name: [],
-        precip_name: [],
-        hum_name: [],
-        wind_name: [],
-        'ffmc': [],
-        'dmc': [],
-        'dc': [],
-        'isi': [],
-        'bui': [],
-        'fwi': []
-    })
+    columns = ['latitude', 'longitude', time_name, temp_name, precip_name, hum_name, wind_name]
+    fire_indexes = ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
+    if ds.shape[0] == 0:
+        return pd.DataFrame({c: [] for c in columns + fire_indexes})
 
-    with warnings.catch_warnings(action=warnings_action):
-        # Create a unique name for a temporary file
-        temp_file_name = os.path.join(temp_meteo_folder, f"temp_{datetime.now().isoformat().replace(':','_')}.csv")
-        # Save the dataset to a the temporary file
-        unique_coords = ds[["latitude","longitude"]].drop_duplicates()
+    # Index data once: rows are sorted by cell (in order of appearance) then by date, so that 
+    # the rows of a cell are a contiguous slice between two offsets
+    cell_ids = ds.groupby(['latitude', 'longitude'], sort=False).ngroup().to_numpy()
+    days = ds[time_name].to_numpy(dtype='datetime64[ns]')
+    order = np.lexsort((days, cell_ids))
+    sorted_ds = ds[columns].iloc[order].reset_index(drop=True)
+    days = days[order]
+    counts = np.bincount(cell_ids)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    nb_cells = counts.shape[0]
+
+    # When every cell has the same days, all cells are calculated together as one (cell x day) block, 
+    # otherwise each cell is a block of its own
+    same_days = (counts == counts[0]).all() and (days.reshape(nb_cells, counts[0]) == days[:counts[0]]).all()
+    blocks = [(0, nb_cells)] if same_days else [(c, c + 1) for c in range(nb_cells)]
+
+    # Moisture codes to start from for each cell
+    ffmc_start = np.full(nb_cells, FFMC_START)
+    dmc_start = np.full(nb_cells, DMC_START)
+    dc_start = np.full(nb_cells, DC_START)
+    if initial_state is not None:
+        cells = sorted_ds.iloc[offsets[:-1], [0, 1]]
+        cells_state = cells.merge(initial_state[['latitude', 'longitude', 'ffmc', 'dmc', 'dc']], how='left', on=['latitude', 'longitude'])
+        ffmc_start = cells_state['ffmc'].fillna(FFMC_START).to_numpy()
+        dmc_start = cells_state['dmc'].fillna(DMC_START).to_numpy()
+        dc_start = cells_state['dc'].fillna(DC_START).to_numpy()
+
+    meteo = {c: sorted_ds[c].to_numpy(dtype=np.float64) for c in [temp_name, precip_name, hum_name, wind_name]}
+    months = pd.DatetimeIndex(days).month.to_numpy()
+    indexes = {k: np.full(sorted_ds.shape[0], np.nan) for k in fire_indexes}
+    keep = np.full(sorted_ds.shape[0], date_interval_size == None)
 
+    with warnings.catch_warnings(action=warnings_action):
         # Creating a range for the loop
         nb_intervals = math.ceil(((end_date - start_date).days + 1) / date_interval_size) if date_interval_size != None else 1
-        rng = range(unique_coords.shape[0] * nb_intervals)
+        rng = range(len(blocks) * nb_intervals)
         if show_progress:
-            rng = tqdm(range(unique_coords.shape[0] * nb_intervals), desc='Calculating Fire Weather Indexes')
+            rng = tqdm(range(len(blocks) * nb_intervals), desc='Calculating Fire Weather Indexes')
 
         for i in rng:
-            row_index = i // nb_intervals
-            lat_condition = ds["latitude"]==unique_coords.iloc[row_index, 0]
-            lng_condition = ds["longitude"]==unique_coords.iloc[row_index, 1]
+            first_cell, last_cell = blocks[i // nb_intervals]
+            date_index = i % nb_intervals
+            rows = slice(offsets[first_cell], offsets[last_cell])
+            shape = (last_cell - first_cell, counts[first_cell])
+            block_days = days[offsets[first_cell]:offsets[first_cell] + counts[first_cell]]
 
-            date_condition_gt = [True] * ds.shape[0]
-            date_condition_lt = date_condition_gt
+            date_condition = np.full(shape[1], True)
+            kept_days = date_condition
             if date_interval_size != None:
-                date_index = i % nb_intervals
-                temp_end_interval = start_date + timedelta(days=((date_index + 1)*date_interval_size) - 1)
-                end_interval = end_date if end_date <= temp_end_interval else temp_end_interval
-                date_condition_gt = ds["date"] >= convert_to_datetime(start_date + timedelta(days=date_index*date_interval_size))
-                date_condition_lt = ds["date"] <= convert_to_datetime(end_interval)
-
-            local_ds = ds[lat_condition & lng_condition & date_condition_gt & date_condition_lt]
-            local_ds['date'] = local_ds['date'].dt.strftime(time_format)
-            local_ds.to_csv(temp_file_name)
-            # Create a firedanger instance
-            fire = firedanger(temp_file_name, time_name=time_name, time_format=time_format)
-            # Calculate fire indexes (ffmc, dmc, dc, isi, bui and fwi)
-            fire.calc_canadian_fwi(temp=temp_name, precip=precip_name, hum=hum_name, wind=wind_name)
-            
-            # Return the dataset enriched with the new indexes added to it
-            local_df:pd.DataFrame = fire.to_dataframe()
-            # Insert date as column and remove it from index
-            local_df.insert(3, 'date', local_df.index)
-            local_df.set_index('Unnamed: 0', inplace=True, drop=True)
-            
-            if first_time:
-                first_time = False
-                df = local_df
-            else:
-                df = pd.concat([df, local_df], ignore_index=True)
-    
-    # Delete the temporary file
-    os.remove(temp_file_name)
+                start_spin_up, start_interval, end_interval = get_interval_bounds(start_date, end_date, date_index, 
+                                                                                  date_interval_size, spin_up_size)
+                date_condition = (block_days >= np.datetime64(start_spin_up)) & (block_days <= np.datetime64(end_interval))
+                kept_days = (block_days >= np.datetime64(start_interval)) & (block_days <= np.datetime64(end_interval))
+
+            # Only the first interval continues from the initial state, the next ones start from default codes
+            ffmc0, dmc0, dc0 = FFMC_START, DMC_START, DC_START
+            if date_index == 0:
+                ffmc0, dmc0, dc0 = ffmc_start[first_cell:last_cell], dmc_start[first_cell:last_cell], dc_start[first_cell:last_cell]
+            # Calculate fire indexes (ffmc, dmc, dc, isi, bui and fwi) directly from the meteo arrays
+            local_indexes = calc_canadian_fwi(meteo[temp_name][rows].reshape(shape)[:, date_condition], 
+                                              meteo[precip_name][rows].reshape(shape)[:, date_condition],
+                                              meteo[hum_name][rows].reshape(shape)[:, date_condition], 
+                                              meteo[wind_name][rows].reshape(shape)[:, date_condition],
+                                              months[rows].reshape(shape)[0, date_condition],
+                                              ffmc0=ffmc0, dmc0=dmc0, dc0=dc0)
+
+            # Store indexes of kept days (spin-up days are discarded)
+            kept_local_days = kept_days[date_condition]
+            for k in fire_indexes:
+                block_indexes = indexes[k][rows].reshape(shape)
+                block_indexes[:, kept_days] = local_indexes[k][:, kept_local_days]
+            keep[rows] |= np.tile(kept_days, shape[0])
+
+    # Return the dataset enriched with the new indexes added to it
+    for k in fire_indexes:
+        sorted_ds[k] = indexes[k]
+    df = sorted_ds[keep].reset_index(drop=True)
+
+    return df
+
+def get_data_with_fire_indexes_in_parallel(ds:pd.DataFrame, start_date:date, end_date:date, date_interval_size:int, 
+                                           time_name="date", temp_name="temperature", precip_name="precipitation", 
+                                           hum_name="air_humidity", wind_name="wind_speed", show_progress=False, 
+                                           warnings_action="ignore", initial_state:pd.DataFrame=None, 
+                                           spin_up_size:int=None, max_workers:int=None) -> pd.DataFrame:
+    """
+    Adds fire indexes (ffmc, dmc, dc, isi, bui and fwi) to a specified dataset by calculating its date intervals 
+    in parallel on a pool of processes. Each date interval starts its calculation spin_up_size days before its 
+    first day and spin-up days are discarded when stitching intervals together. The result has the same rows 
+    order as get_data_with_fire_indexes.
+
+    Parameters
+    ----------
+    ds : pandas.DataFrame
+        dataset specified to work on. It has to include all required attributes to be able to calculate 
+        fire indexes.
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    date_interval_size : int
+        a date interval size in days to calculate fire weather indexes for.
+    time_name : str
+        name of the column referring to the time (day) of each observation. Default is "date".
+    temp_name : str
+        name of the column referring to the temperature (°C) of each observation. Default is "temperature".
+    precip_name : str
+        name of the column referring to the precipitation (mm) of each observation. Default is "precipitation".
+    hum_name : str
+        name of the column referring to the air humidity (%) of each observation. Default is "air_humidity".
+    wind_name : str
+        name of the column referring to the wind speed (m/s) of each observation. Default is "wind_speed".
+    show_progress: bool
+        if set to True shows a progress bar. Default is False.
+    warnings_action : str
+        decides what action to do if there is warnings displaying. Default is "ignore". Set to None, if 
+        the warnings should be displayed. 
+    initial_state : pandas.DataFrame
+        moisture codes (ffmc, dmc and dc) of the day before start_date for each cell, used by the first 
+        date interval. Default is None.
+    spin_up_size : int
+        number of spin-up days of each date interval. Default is None (no spin-up days).
+    max_workers : int
+        maximum number of processes. Default is None (number of processors of the machine).
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        the generated dataframe
+    """
+    nb_intervals = math.ceil(((end_date - start_date).days + 1) / date_interval_size)
+
+    # Processes are spawned instead of forked, this can be called from threads of the loading pipeline
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [] # Array to store future objects
+        interval_starts = [] # First day of each interval, used to discard spin-up days
+        for date_index in range(nb_intervals):
+            start_spin_up, start_interval, end_interval = get_interval_bounds(start_date, end_date, date_index, 
+                                                                              date_interval_size, spin_up_size)
+            local_ds = ds[(ds[time_name] >= convert_to_datetime(start_spin_up)) & (ds[time_name] <= convert_to_datetime(end_interval))]
+            futures.append(executor.submit(get_data_with_fire_indexes, local_ds, start_spin_up, end_interval, 
+                                           time_name=time_name, temp_name=temp_name, precip_name=precip_name, 
+                                           hum_name=hum_name, wind_name=wind_name, warnings_action=warnings_action,
+                                           initial_state=initial_state if date_index == 0 else None))
+            interval_starts.append(start_interval)
+
+        rng = concurrent.futures.as_completed(futures)
+        if show_progress:
+            rng = tqdm(rng, total=nb_intervals, desc='Calculating Fire Weather Indexes')
+        for _ in rng:
+            pass
+
+    # Stitch intervals together without their spin-up days
+    local_dfs = []
+    for future, start_interval in zip(futures, interval_starts):
+        local_df = future.result()
+        local_dfs.append(local_df[local_df[time_name] >= convert_to_datetime(start_interval)])
+    df = pd.concat(local_dfs, ignore_index=True)
+
+    # Order rows by cell (in order of appearance) then by date, as done by the serial calculation
+    cell_order = df.groupby(['latitude', 'longitude'], sort=False).ngroup()
+    df = df.iloc[np.lexsort((df[time_name].to_numpy(), cell_order.to_numpy()))].reset_index(drop=True)
+
+    return df
+
+def get_fire_indexes_state(df:pd.DataFrame, time_name="date") -> pd.DataFrame:
+    """
+    Gets the state of the moisture codes (ffmc, dmc and dc) at the last day of each cell of a dataset 
+    with fire indexes. This state can be saved then given as initial_state to get_data_with_fire_indexes 
+    to extend the dataset with new days without recomputing its history.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        dataset with fire indexes, as returned by get_data_with_fire_indexes.
+    time_name : str
+        name of the column referring to the time (day) of each observation. Default is "date".
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        a dataframe with the columns latitude, longitude, date, ffmc, dmc and dc with one row per cell.
+    """
+    state = df.sort_values(time_name).groupby(['latitude', 'longitude'], sort=False).tail(1)
+    state = state[['latitude', 'longitude', time_name, 'ffmc', 'dmc', 'dc']].rename(columns={time_name: 'date'})
+    return state.sort_values(['latitude', 'longitude']).reset_index(drop=True)
+
+def get_fire_indexes_accuracy(ds:pd.DataFrame, start_date:date, end_date:date, date_interval_size:int, 
+                              spin_up_size:int=None, max_workers:int=None, time_name="date") -> pd.DataFrame:
+    """
+    Compares fire indexes calculated by date intervals (with spin-up days) to the ones of the full serial 
+    calculation, to choose a date interval size and a number of spin-up days with a bounded error.
+
+    Parameters
+    ----------
+    ds : pandas.DataFrame
+        dataset specified to work on, with the default column names of get_data_with_fire_indexes.
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    date_interval_size : int
+        a date interval size in days to calculate fire weather indexes for.
+    spin_up_size : int
+        number of spin-up days of each date interval. Default is None (no spin-up days).
+    max_workers : int
+        if specified, date intervals are calculated in parallel on a pool of this number of processes. 
+        Default is None.
+    time_name : str
+        name of the column referring to the time (day) of each observation. Default is "date".
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        a dataframe indexed by fire index (ffmc, dmc, dc, isi, bui and fwi) with the maximum absolute error 
+        (max_error), the mean absolute error (mean_error) and the mean absolute error relative to the mean 
+        of the serial values (relative_error).
+    """
+    expected = get_data_with_fire_indexes(ds, start_date, end_date, time_name=time_name)
+    actual = get_data_with_fire_indexes(ds, start_date, end_date, time_name=time_name, date_interval_size=date_interval_size, 
+                                        spin_up_size=spin_up_size, max_workers=max_workers)
+
+    report = {'max_error': [], 'mean_error': [], 'relative_error': []}
+    fire_indexes = ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
+    # The serial calculation keeps the days of ds outside of the time range, rows are compared by cell and day
+    keys = ['latitude', 'longitude', time_name]
+    aligned = actual[keys + fire_indexes].merge(expected[keys + fire_indexes], on=keys, how='inner', suffixes=('_actual', '_expected'))
+    for k in fire_indexes:
+        error = np.abs(aligned[f'{k}_actual'].to_numpy() - aligned[f'{k}_expected'].to_numpy())
+        report['max_error'].append(error.max())
+        report['mean_error'].append(error.mean())
+        report['relative_error'].append(error.mean() / np.abs(aligned[f'{k}_expected'].to_numpy()).mean())
 
-    return df
\ No newline at end of file
+    return pd.DataFrame(report, index=pd.Index(fire_indexes, name='index'))
@@ -1,9 +1,12 @@
 from .custom_exceptions import GFED_YearNotAvailableException
 from .custom_exceptions import GFED_RequestException
+from .custom_exceptions import GFED_DownloadException
 import requests
+import threading
+from .http_range_file import HTTPRangeFile, HTTP_BLOCK_SIZE, HTTP_CACHE_SIZE
+from .grid_utils import GFED_GRID, cube_to_dataframe
 import pandas as pd
 import numpy as np
-import math
 import h5py
 import os
 from datetime import date, timedelta
@@ -12,6 +15,12 @@ from tqdm import tqdm
 BASE_URL = "https://www.geo.vu.nl/~gwerf/GFED/GFED4/"
 MAX_YEAR = 2016  # the max year allowed in the API
 MIN_YEAR = 1997  # the min year allowed in the API
+DOWNLOAD_CHUNK_SIZE = 2**20  # size in bytes of the chunks written while downloading a file
+DOWNLOAD_RETRIES = 5  # number of times an interrupted download is resumed
+
+# Locks preventing threads from downloading the same file at the same time
+download_locks = {}
+download_locks_lock = threading.Lock()
 
 def year_not_available(year:int):
     return year < MIN_YEAR or year > MAX_YEAR
@@ -21,11 +30,67 @@ def make_remote_GFED_file_url(year:int):
     result = BASE_URL + remote_file_name
     return result
 
-def fetch_gfed_data_for_year(year:int, gfed_files_folder="."):
+def is_valid_gfed_file(path:str) -> bool:
+    """Checks that a GFED file exists and can be opened as a complete HDF5 file."""
+    if not os.path.isfile(path):
+        return False
+    try:
+        with h5py.File(path, 'r'):
+            return True
+    except OSError: # Truncated or corrupted file
+        return False
+
+def download_part(url:str, part_path:str, timeout:float=None):
+    """
+    Downloads a remote file into a partial file by chunks, resuming from the size of the partial file 
+    if it already exists.
+
+    Parameters
+    ----------
+    url : str
+        url of the remote file.
+    part_path : str
+        path of the partial file.
+    timeout : float
+        timeout in seconds of the connection and of each read. Default is None.
+
+    Returns
+    -------
+    size : int
+        size of the partial file after the download.
+    total_size : int | None
+        size of the remote file if known.
+    """
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as request:
+        if request.status_code == 416: # Nothing left to download
+            total_size = request.headers.get('Content-Range', '*/').split('/')[-1]
+            return offset, int(total_size) if total_size.isdigit() else None
+        if request.status_code == 206: # Resume the download
+            mode = 'ab'
+            total_size = int(request.headers['Content-Range'].split('/')[-1])
+        elif request.status_code == 200: # Download the whole file (again)
+            mode = 'wb'
+            total_size = int(request.headers['Content-Length']) if 'Content-Length' in request.headers else None
+        else: # if the request is not successful
+            raise GFED_RequestException \
+                (f"GFED_RequestException: request returned with status code = {request.status_code}", request.status_code)
+
+        with open(part_path, mode) as f:
+            for chunk in request.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+    return os.path.getsize(part_path), total_size
+
+def fetch_gfed_data_for_year(year:int, gfed_files_folder=".", retries=DOWNLOAD_RETRIES, timeout:float=60):
     """
     This function generates a "gfed_data.hdf5" file that should be a copy of the GFED
     data file in the GFED database that corresponds to the "year" sent as parameter.
     It does that by requesting the https server of the GFED database for the matching file.
+    The file is streamed by chunks into a partial file, interrupted downloads are resumed with HTTP range 
+    requests, and the file is moved into gfed_files_folder only once its size is verified and it opens as an HDF5 file.
 
     Parameters
     ----------
@@ -33,6 +98,10 @@ def fetch_gfed_data_for_year(year:int, gfed_files_folder="."):
         year of the HDF5 file fetched.
     gfed_files_folder : str
         path of the folder where to store fetched files from GFED4 remote site.
+    retries : int
+        number of times an interrupted download is resumed. Default is 5.
+    timeout : float
+        timeout in seconds of the connection and of each read. Default is 60.
     """
     # checking for year validity
     if year_not_available(year):
@@ -41,18 +110,85 @@ def fetch_gfed_data_for_year(year:int, gfed_files_folder="."):
 
 
     remote_file_url = make_remote_GFED_file_url(year)
+    path = os.path.join(gfed_files_folder, f"gfed_data_{year}.hdf5")
+    part_path = f"{path}.part"
+
+    with download_locks_lock:
+        lock = download_locks.setdefault(path, threading.Lock())
+
+    with lock:
+        # The file may have been downloaded by another thread in the meantime
+        if is_valid_gfed_file(path):
+            return
+
+        print('Getting remote file from: {}'.format(remote_file_url))
+        for attempt in range(retries + 1):
+            try:
+                size, total_size = download_part(remote_file_url, part_path, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == retries:
+                    raise
+                continue
+
+            if total_size == None or size == total_size: # Download complete
+                break
+            if size > total_size: # The partial file doesn't match the remote file, start again
+                os.remove(part_path)
+            if attempt == retries:
+                raise GFED_DownloadException \
+                    (f"GFED_DownloadException: incomplete download of {remote_file_url} ({size} of {total_size} bytes)")
+
+        # Verify the downloaded file before moving it into the folder
+        if not(is_valid_gfed_file(part_path)):
+            os.remove(part_path)
+            raise GFED_DownloadException \
+                (f"GFED_DownloadException: {remote_file_url} is not a valid HDF5 file")
+        os.replace(part_path, path)
+
+def open_gfed_file(year:int, gfed_files_folder=".", remote=False, block_size=HTTP_BLOCK_SIZE, cache_size=HTTP_CACHE_SIZE,
+                   session:requests.Session=None) -> h5py.File:
+    """
+    Opens the GFED data file of a year. If the file isn't available locally it's fetched from the GFED4 remote site,
+    or if remote is set to True, it's opened remotely and only the parts of the file that are read are fetched
+    with HTTP range requests.
 
-    print('Getting remote file from: {}'.format(remote_file_url))
-    request = requests.get(remote_file_url)
-    # checking for the request status
-    if request.status_code != 200: # if the request is not successful
-        raise GFED_RequestException \
-            (f"GFED_RequestException: request returned with status code = {request.status_code}", request.status_code)
+    Parameters
+    ----------
+    year : int
+        year of the HDF5 file opened.
+    gfed_files_folder : str
+        path of the folder where to store fetched files from GFED4 remote site.
+    remote : bool
+        if set to True, reads the remote file without downloading it. Default is False.
+    block_size : int
+        used with remote, size in bytes of the blocks fetched with each range request. Default is 256 KiB.
+    cache_size : int
+        used with remote, maximum size in bytes of the blocks kept in memory. Default is 256 MiB.
+    session : requests.Session
+        used with remote, session to send the range requests with, it's left open so it can be shared by 
+        the files of several years. Default is None (a session is opened for the file).
 
-    # writing fetched data to the local gfed_data.hdf5 file
-    path = os.path.join(gfed_files_folder, f"gfed_data_{year}.hdf5")
-    with open(path, "wb") as f:
-        f.write(request.content)
+    Returns
+    -------
+    out : h5py.File
+        the opened file.
+    """
+    file_path = os.path.join(gfed_files_folder, f"gfed_data_{year}.hdf5") # Path of the gfed data file for the year
+    try: # A local copy is always preferred
+        return h5py.File(file_path, 'r')
+    except OSError: # Missing, truncated or corrupted file
+        pass
+
+    if remote:
+        # checking for year validity
+        if year_not_available(year):
+            raise GFED_YearNotAvailableException \
+                (f"GFED_YearNotAvailableException: year {year} is not available")
+        remote_file = HTTPRangeFile(make_remote_GFED_file_url(year), session=session, block_size=block_size, cache_size=cache_size)
+        return h5py.File(remote_file, 'r')
+
+    fetch_gfed_data_for_year(year, gfed_files_folder=gfed_files_folder) # Fetch GFED data file for the year
+    return h5py.File(file_path, 'r')
 
 # the coordinate selector
 
@@ -66,27 +202,7 @@ def coordinates_selecter(lat_min:float, lat_max:float, lng_min:float, lng_max:fl
 
     and returns the corresponding coordinates (center of the activated cells) in the GFED grid as an np array
     """
-    #getting the x_min and x_max indexes
-    x_min = math.floor((lng_min+180)*4)
-    x_max = math.floor((lng_max+180)*4)
-    #getting the y_min and y_max indexes
-    y_min = math.floor((lat_min+90)*4)
-    y_max = math.floor((lat_max+90)*4)
-
-    #creating the np array
-    number_of_rows = (y_max - y_min + 1) * (x_max - x_min + 1)
-    ar = np.empty(shape=(number_of_rows, 2), dtype=np.float64)
-
-    #filling the np array
-    base = 0
-    step = x_max - x_min
-    for lat_index in range(y_min, y_max+1):
-        lat_coord  = - 90 + lat_index * 0.25 + 0.125
-        for row, lon_index in zip(range(base, base + step + 1), range(x_min, x_max+1)):
-                ar[row, 0] = lat_coord
-                ar[row, 1] = -180 + lon_index * 0.25 + 0.125
-        base = base + step + 1
-    return ar
+    return GFED_GRID.coordinates(lat_min, lat_max, lng_min, lng_max)
 
 
 #
@@ -109,25 +225,10 @@ def gfed_portioner(file_path: str, month: int, lat_min: float, lat_max: float, l
         Was Burnt: a boolean indicating whether that cell was burnt
         Burnt %: The percentage of that cell that burnt
     """
-    # getting the x_min and x_max indexes
-    x_min = math.floor((lng_min + 180) * 4)
-    x_max = math.floor((lng_max + 180) * 4)
-    # getting the y_min and y_max indexes
-    y_min = math.floor((lat_min + 90) * 4)
-    y_max = math.floor((lat_max + 90) * 4)
-
     with h5py.File(file_path, 'r') as file:
-        earth_map = np.array(file.get("burned_area/{}/burned_fraction".format(str(month))))
-
-    df = pd.DataFrame(
-        data=earth_map[719 - y_max:719 - y_min + 1, x_min:x_max + 1][::-1],
-        index=pd.Index(data=[-90 + i * 0.25 + 0.125 for i in range(y_min, y_max + 1)], name="latitude"),
-        columns=[-180 + i * 0.25 + 0.125 for i in range(x_min, x_max + 1)]
-    )
-
-    df = df.stack()
-    df.index.set_names(names="longitude", level=1, inplace=True)
-    df = df.reset_index(name="burnt")
+        # Only the region is read from the file
+        df = gfed_modular_portioner(file.get("burned_area/{}/burned_fraction".format(str(month))), "burnt", 
+                                    lat_min, lat_max, lng_min, lng_max)
     # df.insert(2, 'Was burnt', (df['Burnt %'] != 0).astype(int))
     # df.insert(0, 'y', ((90 - df['Latitude']) * 4).astype(int))
     # df.insert(1, 'x', ((df['Longitude'] + 180) * 4).astype(int))
@@ -178,7 +279,7 @@ def get_gfed_burned_area_fraction_for_range(start_date:date, end_date:date, lat_
         month_max = end_date.month if year == end_date.year else 12 # End with the end_date month if reached (the last year iteration)
 
         file_path = os.path.join(gfed_files_folder, f"gfed_data_{year}.hdf5") # Path of the gfed data file for the current year
-        if not(os.path.isfile(file_path)): # If the file doesn't exist locally
+        if not(is_valid_gfed_file(file_path)): # If the file doesn't exist locally (or is corrupted)
             fetch_gfed_data_for_year(year, gfed_files_folder=gfed_files_folder) # Fetch GFED data file for the year
 
         for month in range(month_min, month_max+1): # Iterate in months
@@ -213,11 +314,10 @@ def get_gfed_burned_area_fraction_for_range(start_date:date, end_date:date, lat_
 
 
 
-def gfed_modular_portioner(earth_map:np.ndarray, output_column_name:str, lat_min: float, lat_max: float, lng_min: float, lng_max: float) -> pd.DataFrame:
+def gfed_modular_portioner(earth_map:np.ndarray|h5py.Dataset, output_column_name:str, lat_min: float, lat_max: float, lng_min: float, lng_max: float) -> pd.DataFrame:
     """
     This function receives as input:
-        file_name: the path to the GFED file
-        # earth_map: a 720 * 1440 gfed earth map
+        earth_map: a 720 * 1440 gfed earth map, if it's an HDF5 dataset only the region is read from the file
         lng_min: longitude min
         lng_max: longitude max
         lat_min: latitude min
@@ -231,17 +331,12 @@ def gfed_modular_portioner(earth_map:np.ndarray, output_column_name:str, lat_min
         Was Burnt: a boolean indicating whether that cell was burnt
         Burnt %: The percentage of that cell that burnt
     """
-    # getting the x_min and x_max indexes
-    x_min = math.floor((lng_min + 180) * 4)
-    x_max = math.floor((lng_max + 180) * 4)
-    # getting the y_min and y_max indexes
-    y_min = math.floor((lat_min + 90) * 4)
-    y_max = math.floor((lat_max + 90) * 4)
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
 
     df = pd.DataFrame(
-        data=earth_map[719 - y_max:719 - y_min + 1, x_min:x_max + 1][::-1],
-        index=pd.Index(data=[-90 + i * 0.25 + 0.125 for i in range(y_min, y_max + 1)], name="latitude"),
-        columns=[-180 + i * 0.25 + 0.125 for i in range(x_min, x_max + 1)]
+        data=GFED_GRID.window(earth_map, lat_min, lat_max, lng_min, lng_max),
+        index=pd.Index(data=latitudes, name="latitude"),
+        columns=longitudes
     )
 
     df = df.stack()
@@ -261,73 +356,130 @@ def date_iterator(start_date:date, end_date:date):
         current_date = current_date + delta
 
 
-def get_gfed_emissions_data_for_range(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, gfed_files_folder=".", show_progress=False) ->pd.DataFrame:
-    
-    final_emissions_df = pd.DataFrame({
-        'latitude': [],
-        'longitude': [],
-        'date': [],
-        'fire_carbon_emission': []
-    })
-    first_time = True
+def get_gfed_emissions_window(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, gfed_files_folder=".", 
+                              show_progress=False, remote=False) -> tuple:
+    """
+    Gets daily carbon emissions of the window of a geographical range between a start date and an end date, as a 
+    (day x latitude x longitude) cube with latitudes in ascending order. Parameters are the ones of 
+    get_gfed_emissions_data_for_range.
+
+    Returns
+    -------
+    dates : numpy.ndarray
+        days (datetime64[D]) with emissions data, sorted.
+    window : numpy.ndarray | None
+        carbon emissions of each day of dates and cell of the window, None if there is no data.
+    """
+
+    # Daily fractions of emissions of each day read, stacked later into a (day x latitude x longitude) cube
+    daily_fractions = []
+    days = []
+    months = [] # (year, month) of each day read
+    # Total carbon emissions of the region for each (year, month), read once per month
+    carbon_by_month = {}
 
     # Create a range for the first loop
     rng1 = range(start_date.year, end_date.year+1)
     if show_progress:
         rng1 = tqdm(range(start_date.year, end_date.year+1), desc='Fetching Emissions Data')
 
-    for year in rng1:
+    # Remote files of all the years share a session, closed once every year is read
+    session = requests.Session() if remote else None
+    try:
+        for year in rng1:
        
-        file_path = os.path.join(gfed_files_folder, f"gfed_data_{year}.hdf5") # Path of the gfed data file for the current year
-        if not(os.path.isfile(file_path)): # If the file doesn't exist locally
-            fetch_gfed_data_for_year(year, gfed_files_folder=gfed_files_folder) # Fetch GFED data file for the year
-        
-        #preparing the local_start_date and local_end_date for the current year
-        if year == start_date.year:
-            local_start_date = start_date 
-        else:
-            local_start_date = date(year,1,1) # year - january - 1st
-
-        if year == end_date.year:
-            local_end_date = end_date
-        else:
-            local_end_date = date(year,12,31) # year  - december - 31st
+            #preparing the local_start_date and local_end_date for the current year
+            if year == start_date.year:
+                local_start_date = start_date 
+            else:
+                local_start_date = date(year,1,1) # year - january - 1st
+
+            if year == end_date.year:
+                local_end_date = end_date
+            else:
+                local_end_date = date(year,12,31) # year  - december - 31st
         
-        # Opening the file
-        file = h5py.File(file_path, 'r')
+            # Opening the file
+            with open_gfed_file(year, gfed_files_folder=gfed_files_folder, remote=remote, session=session) as file:
         
-        # Creating range of the second loop
-        rng2 = range((end_date - start_date).days + 1)
-        if show_progress:
-            rng2 = tqdm(range((end_date - start_date).days + 1), desc=f'Fetching for year {year}')
-
-        for nb_days in rng2:
-            local_date = local_start_date + timedelta(days=nb_days)
-            # Getting the daily fraction emissions
-            file_content = file.get("emissions/"+str(local_date.month).zfill(2)+"/daily_fraction/day_"+str(local_date.day))
-            earth_map = np.array(file_content)
-            if file_content != None and len(earth_map) > 0:
-                temp_emissions_df = gfed_modular_portioner(earth_map, "fire_carbon_emission", lat_min, lat_max, lng_min, lng_max) # Get data in the geographical range
-                
-                # Getting the total carbon emissions for the month
-                file_content = file.get("emissions/"+str(local_date.month).zfill(2)+"/C")
-                earth_map = np.array(file_content)
-                if file_content != None and len(earth_map) > 0:
-                    temp_carbon_df = gfed_modular_portioner(earth_map,"carbon", lat_min, lat_max, lng_min, lng_max)
-                    
-                    #mutliplying the daily fraction by the total emission to get the daily emission
-                    temp_emissions_df["fire_carbon_emission"] = temp_emissions_df["fire_carbon_emission"] * temp_carbon_df["carbon"]    
-                    
-                    #precising the date
-                    temp_emissions_df.insert(2, 'date', pd.to_datetime(local_date)) # Add the date column
+                # Creating range of the second loop
+                rng2 = range((local_end_date - local_start_date).days + 1)
+                if show_progress:
+                    rng2 = tqdm(range((local_end_date - local_start_date).days + 1), desc=f'Fetching for year {year}')
+
+                for nb_days in rng2:
+                    local_date = local_start_date + timedelta(days=nb_days)
+                    # Getting the daily fraction emissions (only the region is read from the file)
+                    file_content = file.get("emissions/"+str(local_date.month).zfill(2)+"/daily_fraction/day_"+str(local_date.day))
+                    if file_content != None and file_content.size > 0:
+                        daily_fraction = GFED_GRID.window(file_content, lat_min, lat_max, lng_min, lng_max) # Get data in the geographical range
                     
-                    #adding the temporary dataframe to the final datafram
-                    if first_time:
-                        final_emissions_df = temp_emissions_df
-                        first_time = False
-                    else:
-                        final_emissions_df = pd.concat([final_emissions_df, temp_emissions_df], ignore_index=True)
-
-        file.close()
+                        # Getting the total carbon emissions for the month
+                        if (year, local_date.month) not in carbon_by_month:
+                            file_content = file.get("emissions/"+str(local_date.month).zfill(2)+"/C")
+                            carbon_by_month[(year, local_date.month)] = None
+                            if file_content != None and file_content.size > 0:
+                                carbon_by_month[(year, local_date.month)] = GFED_GRID.window(file_content, lat_min, lat_max, lng_min, lng_max)
+
+                        if carbon_by_month[(year, local_date.month)] is not None:
+                            daily_fractions.append(daily_fraction)
+                            days.append(local_date)
+                            months.append((year, local_date.month))
+    finally:
+        if session != None:
+            session.close()
+
+    if len(days) == 0:
+        return np.array([], dtype='datetime64[D]'), None
+
+    # Mutliplying the daily fractions by the total emissions of their month to get the daily emissions
+    emissions = np.stack(daily_fractions)
+    months = np.array([year * 12 + month for year, month in months])
+    for (year, month), carbon in carbon_by_month.items():
+        if carbon is not None:
+            emissions[months == year * 12 + month] *= carbon # Broadcast over the days of the month
+
+    return np.array(days, dtype='datetime64[D]'), emissions
+
+def get_gfed_emissions_data_for_range(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, gfed_files_folder=".", show_progress=False, 
+                                      remote=False) ->pd.DataFrame:
+    """
+    Gets daily carbon emissions of each cell of a geographical range between a start date and an end date.
+
+    Parameters
+    ----------
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    lat_min : float
+        minimum bound of the latitude for the geographical range.
+    lat_max : float
+        maximum bound of the latitude for the geographical range.
+    lng_min : float
+        minimum bound of the longitude for the geographical range.
+    lng_max : float
+        maximum bound of the longitude for the geographical range.
+    gfed_files_folder : str
+        path of the folder where to store fetched files from GFED4 remote site.
+    show_progress : bool
+        if set to True shows a progress bar. Default is False.
+    remote : bool
+        if set to True, files that aren't available locally are read remotely with HTTP range requests instead 
+        of being downloaded, only the datasets of the time range are fetched. Default is False.
+    """
+    dates, emissions = get_gfed_emissions_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max, 
+                                                 gfed_files_folder=gfed_files_folder, show_progress=show_progress, remote=remote)
+    if emissions is None:
+        return pd.DataFrame({
+            'latitude': [],
+            'longitude': [],
+            'date': [],
+            'fire_carbon_emission': []
+        })
+
+    # Transform the (day x latitude x longitude) cube into a dataframe, rows are sorted by day, latitude then longitude
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+    final_emissions_df = cube_to_dataframe(emissions, dates, latitudes, longitudes, 'fire_carbon_emission')
     
-    return final_emissions_df
\ No newline at end of file
+    return final_emissions_df
@@ -0,0 +1,161 @@
+import math
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from functools import cached_property
+
+@dataclass(frozen=True)
+class GridSpec:
+    """
+    Regular latitude / longitude grid of earth maps stored with the northernmost row first, like the
+    720 * 1440 maps of GFED4 (0.25° cells).
+
+    Parameters
+    ----------
+    resolution : float
+        size of a cell in degrees. Default is 0.25.
+    lat_origin : float
+        latitude of the southern edge of the grid. Default is -90.
+    lng_origin : float
+        longitude of the western edge of the grid. Default is -180.
+    nb_rows : int
+        number of rows (latitudes) of the grid. Default is 720.
+    nb_cols : int
+        number of columns (longitudes) of the grid. Default is 1440.
+    """
+    resolution: float = 0.25
+    lat_origin: float = -90
+    lng_origin: float = -180
+    nb_rows: int = 720
+    nb_cols: int = 1440
+
+    @cached_property
+    def latitudes(self) -> np.ndarray:
+        """Latitudes of the centers of the cells of the grid, in ascending order."""
+        latitudes = self.lat_origin + np.arange(self.nb_rows) * self.resolution + self.resolution / 2
+        latitudes.flags.writeable = False
+        return latitudes
+
+    @cached_property
+    def longitudes(self) -> np.ndarray:
+        """Longitudes of the centers of the cells of the grid, in ascending order."""
+        longitudes = self.lng_origin + np.arange(self.nb_cols) * self.resolution + self.resolution / 2
+        longitudes.flags.writeable = False
+        return longitudes
+
+    def bbox_to_indexes(self, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> tuple:
+        """
+        Gets the indexes of the cells of a geographical range, latitude indexes are counted from the south.
+
+        Returns
+        -------
+        out : tuple
+            (y_min, y_max, x_min, x_max) included bounds of the latitude and longitude indexes.
+        """
+        y_min = math.floor((lat_min - self.lat_origin) / self.resolution)
+        y_max = math.floor((lat_max - self.lat_origin) / self.resolution)
+        x_min = math.floor((lng_min - self.lng_origin) / self.resolution)
+        x_max = math.floor((lng_max - self.lng_origin) / self.resolution)
+        return y_min, y_max, x_min, x_max
+
+    def window_slices(self, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> tuple:
+        """Gets the (rows, columns) slices of an earth map (northernmost row first) covering a geographical range."""
+        y_min, y_max, x_min, x_max = self.bbox_to_indexes(lat_min, lat_max, lng_min, lng_max)
+        return slice(self.nb_rows - 1 - y_max, self.nb_rows - y_min), slice(x_min, x_max + 1)
+
+    def window(self, earth_map, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> np.ndarray:
+        """
+        Gets the window of an earth map covering a geographical range, with latitudes in ascending order.
+        The earth map can have leading dimensions (ex: (bin, row, column)), and if it's an HDF dataset
+        only the window is read from the file.
+        """
+        rows, cols = self.window_slices(lat_min, lat_max, lng_min, lng_max)
+        return earth_map[..., rows, cols][..., ::-1, :]
+
+    def window_coordinates(self, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> tuple:
+        """Gets the (latitudes, longitudes) of the centers of the cells of a geographical range, in ascending order (read-only views)."""
+        y_min, y_max, x_min, x_max = self.bbox_to_indexes(lat_min, lat_max, lng_min, lng_max)
+        return self.latitudes[y_min:y_max + 1], self.longitudes[x_min:x_max + 1]
+
+    def coordinates(self, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> np.ndarray:
+        """Gets the (latitude, longitude) of the center of each cell of a geographical range, sorted by latitude then longitude."""
+        latitudes, longitudes = self.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+        return np.column_stack((np.repeat(latitudes, len(longitudes)), np.tile(longitudes, len(latitudes))))
+
+    def window_cell_indexes(self, latitudes:np.ndarray, longitudes:np.ndarray, lat_min:float, lat_max:float, lng_min:float, lng_max:float) -> np.ndarray:
+        """
+        Gets the indexes of the cells containing points in the window of a geographical range flattened by latitude then
+        longitude (ascending), -1 for points outside of the window.
+        """
+        y_min, y_max, x_min, x_max = self.bbox_to_indexes(lat_min, lat_max, lng_min, lng_max)
+        y = np.floor((np.asarray(latitudes) - self.lat_origin) / self.resolution).astype(np.int64) - y_min
+        x = np.floor((np.asarray(longitudes) - self.lng_origin) / self.resolution).astype(np.int64) - x_min
+        inside = (y >= 0) & (y <= y_max - y_min) & (x >= 0) & (x <= x_max - x_min)
+        return np.where(inside, y * (x_max - x_min + 1) + x, -1)
+
+# Grid of GFED4 and Fuoco earth maps
+GFED_GRID = GridSpec()
+
+def cube_to_dataframe(cube:np.ndarray, dates:np.ndarray, latitudes:np.ndarray, longitudes:np.ndarray, column_name:str) -> pd.DataFrame:
+    """
+    Transforms a (day x latitude x longitude) cube of a window into a dataframe with the columns latitude, longitude, date 
+    and column_name, rows are sorted by day, latitude then longitude.
+    """
+    nb_days, nb_lats, nb_lngs = cube.shape
+    return pd.DataFrame({
+        'latitude': np.tile(np.repeat(latitudes, nb_lngs), nb_days),
+        'longitude': np.tile(longitudes, nb_days * nb_lats),
+        'date': np.repeat(pd.to_datetime(dates).to_numpy(), nb_lats * nb_lngs),
+        column_name: cube.ravel()
+    })
+
+def join_window_cubes(left:pd.DataFrame, cubes:dict, lat_min:float, lat_max:float, lng_min:float, lng_max:float, grid:GridSpec=GFED_GRID, 
+                      time_name="date") -> pd.DataFrame:
+    """
+    Left joins (day x latitude x longitude) cubes of the window of a geographical range to a dataframe with latitude, longitude 
+    and date columns. The (day, cell) indexes of the rows of the dataframe in each cube are computed once, then values are 
+    gathered from the cubes directly.
+
+    Parameters
+    ----------
+    left : pandas.DataFrame
+        dataframe whose rows are kept, in the same order.
+    cubes : dict
+        for each column to join, a (dates, cube) tuple with the sorted days (datetime64[D]) of the cube and the cube of the 
+        window with latitudes in ascending order (as returned by GridSpec.window), or None if there is no data.
+    lat_min : float
+        minimum bound of the latitude for the geographical range.
+    lat_max : float
+        maximum bound of the latitude for the geographical range.
+    lng_min : float
+        minimum bound of the longitude for the geographical range.
+    lng_max : float
+        maximum bound of the longitude for the geographical range.
+    grid : GridSpec
+        grid of the cells. Default is GFED_GRID.
+    time_name : str
+        name of the date column. Default is "date".
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        the columns of left followed by the joined columns, NaN where a cube has no value for the cell and day.
+    """
+    cells = grid.window_cell_indexes(left['latitude'].to_numpy(), left['longitude'].to_numpy(), lat_min, lat_max, lng_min, lng_max)
+    days = left[time_name].to_numpy().astype('datetime64[D]')
+    columns = {column: left[column].to_numpy() for column in left.columns}
+
+    for column, (dates, cube) in cubes.items():
+        if cube is None or len(dates) == 0:
+            columns[column] = np.full(len(left), np.nan)
+            continue
+        # Index of the day of each row in the cube, rows of days without data are left missing
+        day_indexes = np.minimum(np.searchsorted(dates, days), len(dates) - 1)
+        inside = (cells >= 0) & (dates[day_indexes] == days)
+        values = cube.reshape(cube.shape[0], -1)
+        # Missing values need a floating type
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+        columns[column] = np.full(len(left), np.nan, dtype=dtype)
+        columns[column][inside] = values[day_indexes[inside], cells[inside]]
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,123 @@
+import io
+import threading
+import requests
+from collections import OrderedDict
+
+HTTP_BLOCK_SIZE = 2**18 # Size in bytes of the blocks fetched with each range request
+HTTP_CACHE_SIZE = 2**28 # Maximum size in bytes of the blocks kept in memory
+
+class HTTPRangeFile(io.RawIOBase):
+    """
+    Read-only file object over a remote file, reading only the requested bytes with HTTP range requests.
+    Bytes are fetched by blocks kept in a least recently used cache, so it can be opened by h5py to read
+    a few datasets of a remote HDF5 file without downloading it.
+
+    Parameters
+    ----------
+    url : str
+        url of the remote file, the server must support range requests.
+    session : requests.Session
+        session to send the requests with. Default is None (a new session is opened, and closed with the file).
+    block_size : int
+        size in bytes of the blocks fetched. Default is 256 KiB.
+    cache_size : int
+        maximum size in bytes of the blocks kept in memory. Default is 256 MiB.
+    timeout : float
+        timeout of each request in seconds. Default is 60.
+    """
+
+    def __init__(self, url:str, session:requests.Session=None, block_size=HTTP_BLOCK_SIZE, cache_size=HTTP_CACHE_SIZE, timeout:float=60):
+        super().__init__()
+        self.url = url
+        self.own_session = session == None
+        self.session = session if session != None else requests.Session()
+        self.block_size = block_size
+        self.max_blocks = max(1, cache_size // block_size)
+        self.timeout = timeout
+        self.position = 0
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        # Statistics of the requests sent
+        self.nb_requests = 0
+        self.bytes_fetched = 0
+
+        r = self.session.head(url, allow_redirects=True, timeout=timeout)
+        r.raise_for_status()
+        self.size = int(r.headers['Content-Length'])
+
+    def close(self):
+        """Closes the file and the session it opened, h5py doesn't close the file objects it's given."""
+        if not self.closed:
+            self.blocks.clear()
+            if self.own_session:
+                self.session.close()
+        super().close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset:int, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        return self.position
+
+    def fetch_blocks(self, first_block:int, last_block:int):
+        """Fetches blocks from first_block to last_block (included) with a single range request and caches them."""
+        start = first_block * self.block_size
+        end = min((last_block + 1) * self.block_size, self.size) - 1
+        r = self.session.get(self.url, headers={'Range': f'bytes={start}-{end}'}, timeout=self.timeout)
+        r.raise_for_status()
+        content = r.content
+        if r.status_code != 206: # The server sent the whole file
+            content = content[start:end + 1]
+        self.nb_requests += 1
+        self.bytes_fetched += len(content)
+
+        for block in range(first_block, last_block + 1):
+            offset = (block - first_block) * self.block_size
+            self.blocks[block] = content[offset:offset + self.block_size]
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        size = min(len(view), max(0, self.size - self.position))
+        if size == 0:
+            return 0
+
+        first_block = self.position // self.block_size
+        last_block = (self.position + size - 1) // self.block_size
+        with self.lock:
+            # Fetch each contiguous run of missing blocks with one request, cached blocks are not fetched again
+            missing = [block for block in range(first_block, last_block + 1) if block not in self.blocks]
+            run_start = 0
+            for i in range(1, len(missing) + 1):
+                if i == len(missing) or missing[i] != missing[i - 1] + 1:
+                    self.fetch_blocks(missing[run_start], missing[i - 1])
+                    run_start = i
+
+            written = 0
+            for block in range(first_block, last_block + 1):
+                self.blocks.move_to_end(block)
+                data = self.blocks[block]
+                offset = self.position + written - block * self.block_size
+                chunk = data[offset:offset + size - written]
+                view[written:written + len(chunk)] = chunk
+                written += len(chunk)
+
+            # Evict the least recently used blocks
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+
+        self.position += written
+        return written
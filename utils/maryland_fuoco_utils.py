@@ -1,23 +1,111 @@
 import pysftp
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
 import warnings
 from datetime import date, timedelta
 import os
 from pyhdf.SD import *
-import math
 import pandas as pd
 from tqdm import tqdm
+import concurrent.futures
+import multiprocessing
+import threading
+import queue
+import json
+import contextlib
+import numpy as np
+from utils.grid_utils import GFED_GRID, cube_to_dataframe
 
 HOST = "fuoco.geog.umd.edu"
 USER_NAME = "fire"
 PASSWORD = "burnt"
 PORT = 22
-
-def fetch_daily_files(start_date:date, end_date:date, daily_burned_area_folder=".", warnings_action="ignore", show_progress=False):
+FUOCO_MAX_CONNECTIONS = 4 # Maximum number of SFTP connections downloading files in parallel
+# Worker processes are spawned instead of forked, pools are created from the threads of the loading pipeline
+# and forking a multithreaded process can deadlock on locks held by other threads
+PROCESS_CONTEXT = multiprocessing.get_context('spawn')
+
+# Enumerate land classes (values to None, means that the class at that is not used)
+LAND_CLASSES = ['water', 'evergreen needleleaf forest', 'evergreen broadleaf forest', 'deciduous needleleaf forest', 
+                'deciduous broadleaf forest', 'mixed forests', 'closed shrubland', 'open shrubland', 'woody savannas',
+                'savannas', 'grasslands', None, 'croplands', 'urban and built-up', None, None, 'barren or sparsely vegetated',
+                'unclassified']
+
+# Layers of the daily files
+FUOCO_LAYERS = ('BurnedArea', 'TreeCoverDist', 'LandCoverDist')
+
+# Names of the daily files available in the server for each year, listed again when a day is missing
+remote_listings = {}
+remote_listings_lock = threading.Lock()
+
+# Locks preventing threads from updating the burned area cube of the same year at the same time, 
+# processes are kept apart by a lock file next to the cube
+cube_locks = {}
+cube_locks_lock = threading.Lock()
+
+def open_connection() -> pysftp.Connection:
+    """Opens an SFTP connection to the Fuoco server."""
+    # Get known host public keys
+    cnopts = pysftp.CnOpts(knownhosts='known_hosts')
+    # Set the keys to None (this alternative is a little bit risky in term of security)
+    # Do not use it for an untrusted source, it trusts the host without checking the keys
+    cnopts.hostkeys = None
+
+    return pysftp.Connection(host=HOST, username=USER_NAME, password=PASSWORD, port=PORT, cnopts=cnopts, log=False)
+
+def get_remote_folder(year:int) -> str:
+    """Gets the path of the folder of the daily files of a year in the Fuoco server."""
+    return f"data/GFED/GFED4/daily/{year}"
+
+def get_remote_file_name(d:date) -> str:
+    """Gets the name of the daily file of a day in the Fuoco server."""
+    day_in_year = (d - date(d.year, 1, 1)).days + 1 # Get the day number in the year from the complete date (year, month, day) 
+    return f"GFED4.0_DQ_{d.year}{str(day_in_year).zfill(3)}_BA.hdf"
+
+def list_remote_year(connection:pysftp.Connection, year:int, refresh=False) -> set:
+    """
+    Gets the names of the daily files of a year available in the Fuoco server. The listing of each year 
+    is kept in memory, and the folder is listed again if refresh is set to True (to see files published since).
+    """
+    with remote_listings_lock:
+        if year in remote_listings and not refresh:
+            return remote_listings[year]
+    # The folder is listed without holding the lock, so other connections aren't blocked by the request
+    try:
+        listing = set(connection.listdir(get_remote_folder(year)))
+    except IOError: # The folder of the year doesn't exist
+        listing = set()
+    with remote_listings_lock:
+        remote_listings[year] = listing
+    return listing
+
+def download_files(connection:pysftp.Connection, files:queue.Queue, progress:tqdm=None):
+    """
+    Downloads files from a queue of (remote path, local path) until it's empty. Each file is downloaded 
+    into a partial file then renamed, so a local path never holds an incomplete file.
+    """
+    while True:
+        try:
+            remote_path, local_path = files.get_nowait()
+        except queue.Empty:
+            return
+        part_path = f"{local_path}.part"
+        connection.get(remotepath=remote_path, localpath=part_path)
+        os.replace(part_path, local_path)
+        if progress != None:
+            progress.update()
+
+def fetch_daily_files(start_date:date, end_date:date, daily_burned_area_folder=".", warnings_action="ignore", show_progress=False,
+                      max_connections=FUOCO_MAX_CONNECTIONS):
     """
     This function generates a "daily_burned_area.hdf" file that should be a copy of the GFED4
     data files in the GFED4 database hosted on the Maryland University SFTP server (fuoco) that correspond
     to dates in the date range sent as parameter. It does that by requesting the SFTP server for 
-    the matching files.
+    the matching files. The listing of the folder of each year is kept to know which files exist, then files are
+    downloaded in parallel over a pool of SFTP connections.
 
     Parameters
     ----------
@@ -32,41 +120,222 @@ def fetch_daily_files(start_date:date, end_date:date, daily_burned_area_folder="
         the warnings should be displayed. 
     show_progress : bool
         if set to True shows a progress bar. Default is False.
+    max_connections : int
+        maximum number of SFTP connections downloading files in parallel. Default is 4.
     """
+    # Days of the range that are not already downloaded
+    missing_days = []
+    for nb_days in range((end_date - start_date).days + 1): # Iterate over days
+        d = start_date + timedelta(days=nb_days)
+        # Generate a local path for the data file
+        local_path = os.path.join(daily_burned_area_folder, f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf')
+        if not(os.path.isfile(local_path)): # Check if it's not already downloaded
+            missing_days.append((d, local_path))
+    if len(missing_days) == 0:
+        return
 
     with warnings.catch_warnings(action=warnings_action):
-        # Get known host public keys
-        cnopts = pysftp.CnOpts(knownhosts='known_hosts')
-        # Set the keys to None (this alternative is a little bit risky in term of security)
-        # Do not use it for an untrusted source, it trusts the host without checking the keys
-        cnopts.hostkeys = None
-        
         # Open an SFTP connection
-        connection = pysftp.Connection(host=HOST, username=USER_NAME, password=PASSWORD, port=PORT, cnopts=cnopts, log=False)
+        connections = [open_connection()]
+        try:
+            # Keep the days whose file exists in the server, a year is listed again (once) if a day is missing 
+            # from its listing in memory, in case its file was published since
+            files = queue.Queue()
+            with remote_listings_lock:
+                cached_years = set(remote_listings.keys())
+            listings = {}
+            for d, local_path in missing_days:
+                if d.year not in listings:
+                    listings[d.year] = list_remote_year(connections[0], d.year)
+                if get_remote_file_name(d) not in listings[d.year] and d.year in cached_years:
+                    cached_years.discard(d.year)
+                    listings[d.year] = list_remote_year(connections[0], d.year, refresh=True)
+                if get_remote_file_name(d) in listings[d.year]:
+                    files.put((f"{get_remote_folder(d.year)}/{get_remote_file_name(d)}", local_path))
+
+            progress = None
+            if show_progress:
+                progress = tqdm(total=files.qsize(), desc='Fetching Data Files From SFTP Server')
+
+            # Open other connections if there are enough files to download
+            nb_connections = max(1, min(max_connections, files.qsize()))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=nb_connections) as executor:
+                connections += list(executor.map(lambda i: open_connection(), range(nb_connections - 1)))
+                # Download files from the server
+                futures = [executor.submit(download_files, connection, files, progress) for connection in connections]
+                for future in futures:
+                    future.result()
+
+            if progress != None:
+                progress.close()
+        finally:
+            for connection in connections:
+                connection.close() # Close the connections
+
+def read_daily_layer(local_path:str, layer:str) -> np.ndarray:
+    """Reads a whole layer ('BurnedArea', 'TreeCoverDist' or 'LandCoverDist') of a daily HDF file."""
+    local_file = SD(local_path, SDC.READ) # Read the hdf file
+    database = local_file.select(layer) # Open the database of the layer
+    data = database.get() # get data from the database
+    # Close database and file
+    database.endaccess()
+    local_file.end()
+    return data
+
+@contextlib.contextmanager
+def file_lock(path:str):
+    """Holds an exclusive lock on a file, shared by all processes of the machine. Blocks until the lock is acquired."""
+    with open(path, 'a+') as f:
+        if fcntl != None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError: # Still locked after msvcrt retries
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl != None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
-        # Create a range for the loop
-        rng = range((end_date - start_date).days + 1)
-        if show_progress:
-            rng = tqdm(range((end_date - start_date).days + 1), desc='Fetching Data Files From SFTP Server')
-        
-        # Download files from the server
-        for nb_days in rng: # Iterate over days
-            d = start_date + timedelta(days=nb_days)
-            # Generate a local path for the data file
-            local_path = os.path.join(daily_burned_area_folder, f'daily_burned_area_{d.day}_{d.month}_{d.year}.hdf')
-            if not(os.path.isfile(local_path)): # Check if it's not already downloaded
-                # Get the remote path of the data file
-                day_in_year = (d - date(d.year, 1, 1)).days + 1 # Get the day number in the year from the complete date (year, month, day) 
-                remote_path = f"data/GFED/GFED4/daily/{d.year}/GFED4.0_DQ_{d.year}{str(day_in_year).zfill(3)}_BA.hdf"
-                
-                # Check if the remote path exists in the server
-                if connection.isfile(remote_path):
-                    connection.get(remotepath=remote_path, localpath=local_path) # Download the file in the generated local path
-        
-        connection.close() # Close the connection
+def update_burned_area_cube(year:int, daily_burned_area_folder=".", cube_folder=".", max_workers:int=None):
+    """
+    Packs the daily burned area files of a year available locally into a memory-mapped cube (day x 720 x 1440) 
+    stored in "burned_area_{year}.npy", with a metadata sidecar "burned_area_{year}.json" listing the days of the cube. 
+    The cube is created once then only the days that aren't in it yet are added. Updates are serialized between 
+    threads and processes by a lock file "burned_area_{year}.lock".
+
+    Parameters
+    ----------
+    year : int
+        year of the cube.
+    daily_burned_area_folder : str
+        path of the folder from where to get GFED4 Fuoco files.
+    cube_folder : str
+        path of the folder where to store cubes.
+    max_workers : int
+        number of processes reading daily files in parallel. Default is None (files are read one after another).
+
+    Returns
+    -------
+    cube : numpy.memmap
+        the read-only memory-mapped cube, the index of a day is its day number in the year - 1.
+    metadata : dict
+        metadata of the cube, 'days' are the indexes of the days in the cube.
+    """
+    cube_path = os.path.join(cube_folder, f"burned_area_{year}.npy")
+    metadata_path = os.path.join(cube_folder, f"burned_area_{year}.json")
+
+    with cube_locks_lock:
+        lock = cube_locks.setdefault(cube_path, threading.Lock())
+
+    with lock, file_lock(os.path.join(cube_folder, f"burned_area_{year}.lock")):
+        metadata = None
+        if os.path.isfile(cube_path) and os.path.isfile(metadata_path):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+        cube_days = set(metadata['days']) if metadata != None else set()
+
+        # Days available locally that aren't in the cube yet
+        nb_days_year = (date(year, 12, 31) - date(year, 1, 1)).days + 1
+        new_days = []
+        for day_index in range(nb_days_year):
+            d = date(year, 1, 1) + timedelta(days=day_index)
+            local_path = os.path.join(daily_burned_area_folder, f"daily_burned_area_{d.day}_{d.month}_{d.year}.hdf")
+            if day_index not in cube_days and os.path.isfile(local_path):
+                new_days.append((day_index, local_path))
+
+        if len(new_days) > 0:
+            if metadata == None:
+                # Create the cube in a partial file, days without files are left to 0
+                first_map = read_daily_layer(new_days[0][1], 'BurnedArea')
+                part_path = f"{cube_path}.part"
+                cube = np.lib.format.open_memmap(part_path, mode='w+', dtype=first_map.dtype, shape=(nb_days_year, *first_map.shape))
+                cube[new_days[0][0]] = first_map
+                days_to_read = new_days[1:]
+            else:
+                cube = np.lib.format.open_memmap(cube_path, mode='r+')
+                days_to_read = new_days
+
+            if max_workers != None and len(days_to_read) > 1:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=PROCESS_CONTEXT) as executor:
+                    maps = executor.map(read_daily_layer, [local_path for _, local_path in days_to_read], ['BurnedArea'] * len(days_to_read))
+                    for (day_index, _), earth_map in zip(days_to_read, maps):
+                        cube[day_index] = earth_map
+            else:
+                for day_index, local_path in days_to_read:
+                    cube[day_index] = read_daily_layer(local_path, 'BurnedArea')
+            cube.flush()
+            del cube
+
+            if metadata == None:
+                os.replace(part_path, cube_path)
+            # The metadata is written last, so days are listed only once they are in the cube
+            metadata = {'year': year, 'dtype': str(np.load(cube_path, mmap_mode='r').dtype), 
+                        'days': sorted(cube_days | set(day_index for day_index, _ in new_days))}
+            with open(f"{metadata_path}.part", 'w') as f:
+                json.dump(metadata, f)
+            os.replace(f"{metadata_path}.part", metadata_path)
+
+    if metadata == None:
+        return None, {'year': year, 'days': []}
+    return np.load(cube_path, mmap_mode='r'), metadata
+
+def get_burned_area_window_from_cubes(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, 
+                                      daily_burned_area_folder=".", cube_folder=".", max_workers:int=None) -> tuple:
+    """Gets the burned area window of a range in time and space from the memory-mapped cubes of the years of the range (see get_daily_burned_area_window)."""
+    windows = []
+    dates = []
+    for year in range(start_date.year, end_date.year + 1):
+        cube, metadata = update_burned_area_cube(year, daily_burned_area_folder, cube_folder, max_workers=max_workers)
+        # Indexes of the days of the range in the cube
+        first_day = (max(start_date, date(year, 1, 1)) - date(year, 1, 1)).days
+        last_day = (min(end_date, date(year, 12, 31)) - date(year, 1, 1)).days
+        days = np.array([day for day in metadata['days'] if first_day <= day <= last_day], dtype=np.int64)
+        if len(days) > 0:
+            # Only the pages of the window are read from the cube
+            windows.append(GFED_GRID.window(cube[first_day:last_day + 1], lat_min, lat_max, lng_min, lng_max)[days - first_day])
+            dates.append(np.datetime64(f"{year}-01-01") + days)
+
+    if len(windows) == 0:
+        return np.array([], dtype='datetime64[D]'), None
+    return np.concatenate(dates), np.concatenate(windows)
+
+def get_daily_burned_area_window(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, 
+                                 daily_burned_area_folder=".", show_progress=False, cube_folder:str=None, max_workers:int=None) -> tuple:
+    """
+    Gets the daily burned area of the window of a geographical range from Maryland University SFTP server (fuoco) open data, 
+    as a (day x latitude x longitude) cube with latitudes in ascending order. Parameters are the ones of get_daily_burned_area_data.
+
+    Returns
+    -------
+    dates : numpy.ndarray
+        days (datetime64[D]) with a daily file, sorted.
+    window : numpy.ndarray | None
+        burned area of each day of dates and cell of the window, None if there is no daily file.
+    """
+    # Fetch data file from server
+    fetch_daily_files(start_date, end_date, daily_burned_area_folder, show_progress=show_progress)
+
+    if cube_folder != None:
+        return get_burned_area_window_from_cubes(start_date, end_date, lat_min, lat_max, lng_min, lng_max, 
+                                                 daily_burned_area_folder=daily_burned_area_folder, cube_folder=cube_folder,
+                                                 max_workers=max_workers)
+
+    dates, cubes = read_daily_layers(start_date, end_date, lat_min, lat_max, lng_min, lng_max, layers=['BurnedArea'],
+                                     daily_burned_area_folder=daily_burned_area_folder, show_progress=show_progress,
+                                     max_workers=max_workers)
+    return np.array(dates, dtype='datetime64[D]'), cubes['BurnedArea']
 
 def get_daily_burned_area_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, daily_burned_area_folder=".",
-                               show_progress=False):
+                               show_progress=False, cube_folder:str=None, max_workers:int=None):
     """
     Gets data from Maryland University SFTP server (fuoco) open data of daily burned area for a specified range in time and space 
     (geographical space) then returns a dataframe containing data about burned area for each day and 
@@ -90,6 +359,11 @@ def get_daily_burned_area_data(start_date:date, end_date:date, lat_min:float, la
         path of the folder from where to get GFED4 Fuoco files.
     show_progress: bool
         if set to True shows a progress bar. Default is False.
+    cube_folder : str
+        if set, daily files are packed once into memory-mapped cubes of years stored in this folder, and data 
+        is read from the cubes instead of the daily files. Default is None.
+    max_workers : int
+        number of processes reading daily files in parallel. Default is None (files are read one after another).
 
     Returns
     -------
@@ -97,60 +371,236 @@ def get_daily_burned_area_data(start_date:date, end_date:date, lat_min:float, la
         the generated dataframe
     """
 
-    # Fetch data file from server
-    fetch_daily_files(start_date, end_date, daily_burned_area_folder, show_progress=show_progress)
+    dates, window = get_daily_burned_area_window(start_date, end_date, lat_min, lat_max, lng_min, lng_max, 
+                                                 daily_burned_area_folder=daily_burned_area_folder, show_progress=show_progress,
+                                                 cube_folder=cube_folder, max_workers=max_workers)
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+    return layer_to_dataframe('BurnedArea', window, dates, latitudes, longitudes)
+
+def get_tree_cover_labels(nb_bins:int) -> list:
+    """Gets the labels of the bins of the tree cover distribution (5% bins, the last one goes up to 100%)."""
+    labels = []
+    tree_cover_per = 0
+    for _ in range(nb_bins):
+        if tree_cover_per == 95:
+            labels.append(f'{tree_cover_per}% - 100%')
+        else:
+            labels.append(f'{tree_cover_per}% - {tree_cover_per+4}%')
+            tree_cover_per += 5
+    return labels
+
+def get_land_cover_labels(nb_bins:int) -> list:
+    """Gets the labels of the bins of the land cover distribution (None for bins of unused classes)."""
+    return [LAND_CLASSES[i] if i < len(LAND_CLASSES) else None for i in range(nb_bins)]
+
+def distribution_to_dataframe(cube:np.ndarray, dates:np.ndarray, latitudes:np.ndarray, longitudes:np.ndarray, labels:list, 
+                              label_column:str, wide=False) -> pd.DataFrame:
+    """
+    Transforms a (day x bin x latitude x longitude) cube of burned area by bin into a dataframe.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray
+        burned area of each day, bin and cell of the window.
+    dates : numpy.ndarray
+        dates of the days of the cube.
+    latitudes : numpy.ndarray
+        latitudes of the rows of the window.
+    longitudes : numpy.ndarray
+        longitudes of the columns of the window.
+    labels : list
+        label of each bin, bins labeled None have no class.
+    label_column : str
+        name of the column of labels in long form.
+    wide : bool
+        if set to True, returns a row by day and cell with a column of burned area by label. Otherwise returns a 
+        row by day, bin and cell with the columns latitude, longitude, date, burned_area and label_column (categorical). 
+        Default is False.
+    """
+    nb_days, nb_bins, nb_lats, nb_lngs = cube.shape
+    dates = pd.to_datetime(dates).to_numpy()
+
+    if wide:
+        # Bins without a class are left out
+        bins = [i for i in range(nb_bins) if labels[i] != None]
+        df = pd.DataFrame({
+            'latitude': np.tile(np.repeat(latitudes, nb_lngs), nb_days),
+            'longitude': np.tile(longitudes, nb_days * nb_lats),
+            'date': np.repeat(dates, nb_lats * nb_lngs)
+        })
+        values = pd.DataFrame(cube[:, bins].transpose(0, 2, 3, 1).reshape(-1, len(bins)), columns=[labels[i] for i in bins])
+        return pd.concat([df, values], axis=1)
+
+    # Rows are sorted by day, bin, latitude then longitude
+    categories = list(dict.fromkeys(label for label in labels if label != None))
+    codes = np.array([categories.index(label) if label != None else -1 for label in labels], dtype=np.int64)
+    return pd.DataFrame({
+        'latitude': np.tile(np.repeat(latitudes, nb_lngs), nb_days * nb_bins),
+        'longitude': np.tile(longitudes, nb_days * nb_bins * nb_lats),
+        'date': np.repeat(dates, nb_bins * nb_lats * nb_lngs),
+        'burned_area': cube.ravel(),
+        label_column: pd.Categorical.from_codes(np.tile(np.repeat(codes, nb_lats * nb_lngs), nb_days), categories=categories)
+    })
+
+def read_daily_file(local_path:str, layers:list, rows:slice, cols:slice) -> dict:
+    """Reads the window (rows, cols) of several layers of a daily file, with latitudes in ascending order."""
+    windows = {}
+    local_file = SD(local_path, SDC.READ) # Read the hdf file once for all layers
+    for layer in layers:
+        database = local_file.select(layer) # Open the database of the layer
+        rank = database.info()[1]
+        # Read the window of all bins at once
+        windows[layer] = database[(slice(None),) * (rank - 2) + (rows, cols)][..., ::-1, :]
+        database.endaccess()
+    local_file.end()
+    return windows
+
+def read_daily_layers(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, layers=FUOCO_LAYERS,
+                      daily_burned_area_folder=".", show_progress=False, max_workers:int=None) -> tuple:
+    """
+    Reads the window of a geographical range of several layers of the daily files of a time range, each daily file is
+    opened once for all layers. Files can be read by a pool of processes (the HDF4 bindings hold the GIL), windows are 
+    written into preallocated arrays by day.
+
+    Parameters
+    ----------
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    lat_min : float
+        minimum bound of the latitude for the geographical range.
+    lat_max : float
+        maximum bound of the latitude for the geographical range.
+    lng_min : float
+        minimum bound of the longitude for the geographical range.
+    lng_max : float
+        maximum bound of the longitude for the geographical range.
+    layers : list
+        layers to read among 'BurnedArea', 'TreeCoverDist' and 'LandCoverDist'. Default is all layers.
+    daily_burned_area_folder : str
+        path of the folder from where to get GFED4 Fuoco files.
+    show_progress : bool
+        if set to True shows a progress bar. Default is False.
+    max_workers : int
+        number of processes reading files in parallel. Default is None (files are read one after another).
 
-    # Getting the x_min and x_max indexes
-    x_min = math.floor((lng_min + 180) * 4)
-    x_max = math.floor((lng_max + 180) * 4)
-    # Getting the y_min and y_max indexes
-    y_min = math.floor((lat_min + 90) * 4)
-    y_max = math.floor((lat_max + 90) * 4)
-
-    df = pd.DataFrame({
-        'latitude': [],
-        'longitude': [],
-        'date': [],
-        'burned_area': []
-    }) # Final Dataframe to be returned
-
-    if show_progress:
-        print('Reading HDF Files ...')
-    for nb_days in range((end_date - start_date).days + 1):
+    Returns
+    -------
+    dates : list
+        dates of the days with a daily file.
+    cubes : dict
+        for each layer, the (day x latitude x longitude) or (day x bin x latitude x longitude) burned area of the days 
+        of dates, aligned on the same days. None if there is no daily file.
+    """
+    rows, cols = GFED_GRID.window_slices(lat_min, lat_max, lng_min, lng_max)
+
+    # Days with a daily file
+    dates = []
+    local_paths = []
+    for nb_days in range(0, (end_date - start_date).days + 1):
         d = start_date + timedelta(days=nb_days)
         # Get the local path to read data from
         local_path = os.path.join(daily_burned_area_folder, f"daily_burned_area_{d.day}_{d.month}_{d.year}.hdf")
-
         if os.path.isfile(local_path):
-            local_file = SD(local_path, SDC.READ) # Read the hdf file
-            database = local_file.select('BurnedArea') # Open the burned area database
-            earth_map = database.get() # get data from the database
-
-            # Transform data into a dataframe
-            temp_df = pd.DataFrame(
-                data=earth_map[719 - y_max:719 - y_min + 1, x_min:x_max + 1][::-1],
-                index=pd.Index(data=[-90 + i * 0.25 + 0.125 for i in range(y_min, y_max + 1)], name="latitude"),
-                columns=[-180 + i * 0.25 + 0.125 for i in range(x_min, x_max + 1)]
-            )
-
-            temp_df = temp_df.stack()
-            temp_df.index.set_names(names="longitude", level=1, inplace=True)
-            temp_df = temp_df.reset_index(name="burned_area")
-            temp_df.insert(2, 'date', pd.to_datetime(d))
-
-            # Concatenate dataframes into one
-            if df.empty:
-                df = temp_df
-            else:
-                df = pd.concat([df, temp_df], ignore_index=True)
+            dates.append(d)
+            local_paths.append(local_path)
+
+    cubes = {layer: None for layer in layers}
+    if len(dates) == 0:
+        return dates, cubes
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=PROCESS_CONTEXT) if max_workers != None else None
+    try:
+        nb_files = len(local_paths)
+        if executor != None:
+            results = executor.map(read_daily_file, local_paths, [layers] * nb_files, [rows] * nb_files, [cols] * nb_files,
+                                   chunksize=max(1, nb_files // (4 * max_workers)))
+        else:
+            results = map(read_daily_file, local_paths, [layers] * nb_files, [rows] * nb_files, [cols] * nb_files)
+        if show_progress:
+            print("Reading HDF Files ...")
+            results = tqdm(results, total=nb_files)
+
+        for day_index, windows in enumerate(results):
+            for layer in layers:
+                if cubes[layer] is None: # Preallocate the cube of the layer once the shape of its windows is known
+                    cubes[layer] = np.empty((nb_files, *windows[layer].shape), dtype=windows[layer].dtype)
+                cubes[layer][day_index] = windows[layer]
+    finally:
+        if executor != None:
+            executor.shutdown()
+
+    return dates, cubes
+
+def layer_to_dataframe(layer:str, cube:np.ndarray, dates:list, latitudes:np.ndarray, longitudes:np.ndarray, wide=False) -> pd.DataFrame:
+    """Transforms the cube of a layer read by read_daily_layers into the dataframe returned by the reader of the layer."""
+    if layer == 'BurnedArea':
+        if cube is None:
+            return pd.DataFrame({
+                'latitude': [],
+                'longitude': [],
+                'date': [],
+                'burned_area': []
+            })
+        return cube_to_dataframe(cube, dates, latitudes, longitudes, 'burned_area')
+
+    if cube is None:
+        return pd.DataFrame()
+    if layer == 'TreeCoverDist':
+        return distribution_to_dataframe(cube, dates, latitudes, longitudes, get_tree_cover_labels(cube.shape[1]), 
+                                         'tree_cover_fraction', wide=wide)
+    return distribution_to_dataframe(cube, dates, latitudes, longitudes, get_land_cover_labels(cube.shape[1]), 
+                                     'land_class', wide=wide)
+
+def get_fuoco_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, layers=FUOCO_LAYERS,
+                   daily_burned_area_folder=".", show_progress=False, wide=False, max_workers:int=None) -> dict:
+    """
+    Gets several layers of the Maryland University SFTP server (fuoco) open data of daily burned area for a specified range 
+    in time and space in a single pass: daily files are fetched once and each of them is opened once.
 
-            # Close database and file
-            database.endaccess()
-            local_file.end()
+    Parameters
+    ----------
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    lat_min : float
+        minimum bound of the latitude for the geographical range.
+    lat_max : float
+        maximum bound of the latitude for the geographical range.
+    lng_min : float
+        minimum bound of the longitude for the geographical range.
+    lng_max : float
+        maximum bound of the longitude for the geographical range.
+    layers : list
+        layers to get among 'BurnedArea', 'TreeCoverDist' and 'LandCoverDist'. Default is all layers.
+    daily_burned_area_folder : str
+        path of the folder from where to get GFED4 Fuoco files.
+    show_progress : bool
+        if set to True shows a progress bar. Default is False.
+    wide : bool
+        used with tree cover and land cover, if set to True returns a column of burned area for each bin. Default is False.
+    max_workers : int
+        number of processes reading daily files in parallel. Default is None (files are read one after another).
+
+    Returns
+    -------
+    out : dict
+        for each layer, the dataframe returned by its reader (get_daily_burned_area_data, get_tree_cover_data or 
+        get_land_cover_data), all dataframes have the same days.
+    """
+    # Fetch data file from server
+    fetch_daily_files(start_date, end_date, daily_burned_area_folder, show_progress=show_progress)
 
-    return df
+    dates, cubes = read_daily_layers(start_date, end_date, lat_min, lat_max, lng_min, lng_max, layers=layers,
+                                     daily_burned_area_folder=daily_burned_area_folder, show_progress=show_progress,
+                                     max_workers=max_workers)
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+    return {layer: layer_to_dataframe(layer, cubes[layer], dates, latitudes, longitudes, wide=wide) for layer in layers}
 
-def get_tree_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, daily_burned_area_folder="."):
+def get_tree_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, daily_burned_area_folder=".",
+                        wide=False):
     """
     Gets data from Maryland University SFTP server (fuoco) open data of daily burned area for a specified range in time and space 
     (geographical space) by tree cover fraction then returns a dataframe containing data about burned area for each day and 
@@ -172,6 +622,9 @@ def get_tree_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:f
         maximum bound of the longitude for the geographical range.
     gfed_files_folder : str
         path of the folder from where to get GFED4 Fuoco files.
+    wide : bool
+        if set to True, returns a row by day and position with a column of burned area for each tree cover bin. 
+        Default is False (a row by day, position and tree cover bin, with a categorical tree_cover_fraction column).
 
     Returns
     -------
@@ -181,60 +634,13 @@ def get_tree_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:f
     # Fetch data file from server
     fetch_daily_files(start_date, end_date, daily_burned_area_folder)
 
-    # Getting the x_min and x_max indexes
-    x_min = math.floor((lng_min + 180) * 4)
-    x_max = math.floor((lng_max + 180) * 4)
-    # Getting the y_min and y_max indexes
-    y_min = math.floor((lat_min + 90) * 4)
-    y_max = math.floor((lat_max + 90) * 4)
-
-    df = pd.DataFrame() # Final Dataframe to be returned
+    dates, cubes = read_daily_layers(start_date, end_date, lat_min, lat_max, lng_min, lng_max, layers=['TreeCoverDist'],
+                                     daily_burned_area_folder=daily_burned_area_folder, show_progress=True)
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+    return layer_to_dataframe('TreeCoverDist', cubes['TreeCoverDist'], dates, latitudes, longitudes, wide=wide)
 
-    print("Reading HDF Files ...")
-    for nb_days in tqdm(range(0, (end_date - start_date).days + 1)):
-        d = start_date + timedelta(days=nb_days)
-        # Get the local path to read data from
-        local_path = os.path.join(daily_burned_area_folder, f"daily_burned_area_{d.day}_{d.month}_{d.year}.hdf")
-
-        if os.path.isfile(local_path):
-            local_file = SD(local_path, SDC.READ) # Read the hdf file
-            database = local_file.select('TreeCoverDist') # Open the tree cover database
-            earth_map = database.get() # get data from the database
-
-            tree_cover_per = 0
-            for tree_cover_map in earth_map:
-                # Transform data into a dataframe
-                temp_df = pd.DataFrame(
-                    data=tree_cover_map[719 - y_max:719 - y_min + 1, x_min:x_max + 1][::-1],
-                    index=pd.Index(data=[-90 + i * 0.25 + 0.125 for i in range(y_min, y_max + 1)], name="latitude"),
-                    columns=[-180 + i * 0.25 + 0.125 for i in range(x_min, x_max + 1)]
-                )
-
-                temp_df = temp_df.stack()
-                temp_df.index.set_names(names="longitude", level=1, inplace=True)
-                temp_df = temp_df.reset_index(name="burned_area")
-                temp_df.insert(2, 'date', pd.to_datetime(d))
-
-                # Add a tree cover bin column
-                if tree_cover_per == 95:
-                    temp_df['tree_cover_fraction'] = f'{tree_cover_per}% - 100%'
-                else:
-                    temp_df['tree_cover_fraction'] = f'{tree_cover_per}% - {tree_cover_per+4}%'
-                    tree_cover_per += 5
-
-                # Concatenate dataframes into one
-                if df.empty:
-                    df = temp_df
-                else:
-                    df = pd.concat([df, temp_df], ignore_index=True)
-
-            # Close database and file
-            database.endaccess()
-            local_file.end()
-
-    return df
-
-def get_land_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, daily_burned_area_folder="."):
+def get_land_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, daily_burned_area_folder=".",
+                        wide=False):
     """
     Gets data from Maryland University SFTP server (fuoco) open data of daily burned area for a specified range in time and space 
     (geographical space) by land cover classes then returns a dataframe containing data about burned area for each day and 
@@ -256,69 +662,19 @@ def get_land_cover_data(start_date:date, end_date:date, lat_min:float, lat_max:f
         maximum bound of the longitude for the geographical range.
     gfed_files_folder : str
         path of the folder from where to get GFED4 Fuoco files.
+    wide : bool
+        if set to True, returns a row by day and position with a column of burned area for each land class. 
+        Default is False (a row by day, position and land cover bin, with a categorical land_class column).
 
     Returns
     -------
     out : pandas.DataFrame
         the generated dataframe
     """
-    # Enumerate land classes (values to None, means that the class at that is not used)
-    LAND_CLASSES = ['water', 'evergreen needleleaf forest', 'evergreen broadleaf forest', 'deciduous needleleaf forest', 
-                    'deciduous broadleaf forest', 'mixed forests', 'closed shrubland', 'open shrubland', 'woody savannas',
-                    'savannas', 'grasslands', None, 'croplands', 'urban and built-up', None, None, 'barren or sparsely vegetated',
-                    'unclassified']
     # Fetch data file from server
     fetch_daily_files(start_date, end_date, daily_burned_area_folder)
 
-    # Getting the x_min and x_max indexes
-    x_min = math.floor((lng_min + 180) * 4)
-    x_max = math.floor((lng_max + 180) * 4)
-    # Getting the y_min and y_max indexes
-    y_min = math.floor((lat_min + 90) * 4)
-    y_max = math.floor((lat_max + 90) * 4)
-
-    df = pd.DataFrame() # Final Dataframe to be returned
-
-    print("Reading HDF Files ...")
-    for nb_days in tqdm(range(0, (end_date - start_date).days + 1)):
-        d = start_date + timedelta(days=nb_days)
-        # Get the local path to read data from
-        local_path = os.path.join(daily_burned_area_folder, f"daily_burned_area_{d.day}_{d.month}_{d.year}.hdf")
-
-        if os.path.isfile(local_path):
-            local_file = SD(local_path, SDC.READ) # Read the hdf file
-            database = local_file.select('LandCoverDist') # Open the land cover database
-            earth_map = database.get() # get data from the database
-
-            land_class_index = 0
-            for land_cover_map in earth_map:
-                # Transform data into a dataframe
-                temp_df = pd.DataFrame(
-                    data=land_cover_map[719 - y_max:719 - y_min + 1, x_min:x_max + 1][::-1],
-                    index=pd.Index(data=[-90 + i * 0.25 + 0.125 for i in range(y_min, y_max + 1)], name="latitude"),
-                    columns=[-180 + i * 0.25 + 0.125 for i in range(x_min, x_max + 1)]
-                )
-
-                temp_df = temp_df.stack()
-                temp_df.index.set_names(names="longitude", level=1, inplace=True)
-                temp_df = temp_df.reset_index(name="burned_area")
-                temp_df.insert(2, 'date', pd.to_datetime(d))
-
-                # Add a land cover column
-                if land_class_index < len(LAND_CLASSES):
-                    temp_df['land_class'] = LAND_CLASSES[land_class_index]
-                    land_class_index += 1
-                else:
-                    temp_df['land_class'] = None
-
-                # Concatenate dataframes into one
-                if df.empty:
-                    df = temp_df
-                else:
-                    df = pd.concat([df, temp_df], ignore_index=True)
-
-            # Close database and file
-            database.endaccess()
-            local_file.end()
-
-    return df
\ No newline at end of file
+    dates, cubes = read_daily_layers(start_date, end_date, lat_min, lat_max, lng_min, lng_max, layers=['LandCoverDist'],
+                                     daily_burned_area_folder=daily_burned_area_folder, show_progress=True)
+    latitudes, longitudes = GFED_GRID.window_coordinates(lat_min, lat_max, lng_min, lng_max)
+    return layer_to_dataframe('LandCoverDist', cubes['LandCoverDist'], dates, latitudes, longitudes, wide=wide)
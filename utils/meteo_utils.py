@@ -0,0 +1,49 @@
+from .custom_exceptions import MeteoProviderNotAvailableException
+import pandas as pd
+from datetime import date
+from utils import power_nasa_utils, open_meteo_utils
+
+# Available meteo providers, each one returns a dataframe with the columns date, latitude, longitude, 
+# temperature, precipitation, air_humidity and wind_speed for the center of each cell of the range
+METEO_PROVIDERS = {
+    'power': power_nasa_utils.get_data,
+    'open_meteo': open_meteo_utils.get_data
+}
+
+def get_meteo_data(provider:str, start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, 
+                   show_progress=False, **kwargs) -> pd.DataFrame:
+    """
+    Gets meteorological data within a specific geographical span and between a start date and end date 
+    from a specific meteo provider.
+
+    Parameters
+    ----------
+    provider : str
+        name of the meteo provider, one of the keys of METEO_PROVIDERS ('power' or 'open_meteo').
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    lat_min : float
+        minimum latitude of the geographical range.
+    lat_max : float
+        maximum latitude of the geographical range.
+    lng_min : float
+        minimum longitude of the geographical range.
+    lng_max : float
+        maximum longitude of the geographical range.
+    show_progress : bool
+        if set to True shows a progress bar. Default is False.
+    kwargs : dict
+        options specific to the provider (max_workers, timeout, retries, ...).
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        the generated dataframe
+    """
+    if provider not in METEO_PROVIDERS:
+        raise MeteoProviderNotAvailableException \
+            (f"MeteoProviderNotAvailableException: provider {provider} is not available")
+
+    return METEO_PROVIDERS[provider](start_date, end_date, lat_min, lat_max, lng_min, lng_max, show_progress=show_progress, **kwargs)
@@ -1,93 +1,148 @@
 import numpy as np
 import pandas as pd
 import requests
-from gfed_utils import coordinates_selecter
+import concurrent.futures
+from tqdm import tqdm
+from datetime import date
+from utils.gfed_utils import coordinates_selecter
+from utils.power_nasa_utils import make_session
 
-def get_data(lat_min:float, lat_max:float, lon_min:float, lon_max:float, start_date:str, end_date:str)->pd.DataFrame:
+OPEN_METEO_URL = 'https://archive-api.open-meteo.com/v1/archive'
+OPEN_METEO_MAX_URL_LENGTH = 2000 # Maximum length of the coordinates in the URL of a request
+DAILY_VARIABLES = 'temperature_2m_max,precipitation_sum,wind_speed_10m_max'
+HOURLY_VARIABLES = 'relative_humidity_2m'
+
+def split_coordinates_in_batches(coordinates_array:np.ndarray, max_url_length=OPEN_METEO_MAX_URL_LENGTH) -> list:
     """
-    This function returns the dataSet of the needed meteorogical data within a specific geographical span and between a start date and end date 
+    Splits coordinates into batches that can be requested at once without exceeding a URL length.
 
-    Parameters:
-    -----------
-    lat_min: float
-        latitude min
-    lat_max: float
-        latitude max
-    lon_min: float
-        longitude min
-    lon_max: float
-        longitude max
-    start_date: str
-        start date in the format 'YYYY-MM-DD'
-    end_date: str
-        end date in the format 'YYYY-MM-DD'
+    Parameters
+    ----------
+    coordinates_array : numpy.ndarray
+        (latitude, longitude) of the center of each cell, as returned by coordinates_selecter.
+    max_url_length : int
+        maximum length of the latitudes and longitudes in the URL of a request. Default is 2000.
+
+    Returns
+    -------
+    out : list
+        list of arrays of coordinates.
     """
-    #getting the coordinates
-    coordinates = coordinates_selecter(lat_min, lat_max, lon_min, lon_max)
-    #getting the data using open meteo api
-    lat = ''
-    long = ''
+    # Length of each coordinate in the URL (with its URL-encoded separators)
+    lengths = np.array([len(str(c[0])) + len(str(c[1])) + 6 for c in coordinates_array])
+    batches = []
+    start, length = 0, 0
+    for i in range(len(lengths)):
+        if length + lengths[i] > max_url_length and i > start:
+            batches.append(coordinates_array[start:i])
+            start, length = i, 0
+        length += lengths[i]
+    if start < len(lengths):
+        batches.append(coordinates_array[start:])
+    return batches
 
-    for i in range(len(coordinates)):
-        lat += str(coordinates[i][0]) + ','
-        long += str(coordinates[i][1]) + ','
-    
+def get_batch_weather(coordinates_array:np.ndarray, start_date:date, end_date:date, session:requests.Session=None, timeout:float=None) -> list:
+    """
+    Fetch daily meteorological data and hourly air humidity for a batch of geographical points in a time range.
+
+    Parameters
+    ----------
+    coordinates_array : numpy.ndarray
+        (latitude, longitude) of each point.
+    start_date: date
+        start date of the time range.
+    end_date: date
+        end date of the time range.
+    session: requests.Session
+        session to send the request with. Default is None (a new connection is opened).
+    timeout: float
+        timeout of the request in seconds. Default is None (no timeout).
+
+    Returns
+    -------
+    out : list
+        the response of each point, in the same order as coordinates_array.
+    """
     payload = {
         'wind_speed_unit': 'ms',
-        'latitude': lat,
-        'longitude': long,
-        'start_date': start_date, 
-        'end_date': end_date,
-        'daily': 'temperature_2m_max,precipitation_sum,wind_speed_10m_max'
+        'latitude': ','.join(str(c[0]) for c in coordinates_array),
+        'longitude': ','.join(str(c[1]) for c in coordinates_array),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'daily': DAILY_VARIABLES,
+        'hourly': HOURLY_VARIABLES
     }
+    r = (session if session != None else requests).get(OPEN_METEO_URL, params=payload, timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    # A single point is not returned in a list
+    return data if isinstance(data, list) else [data]
 
-    r = requests.get('https://archive-api.open-meteo.com/v1/archive', params=payload)
+def batch_to_dataframe(coordinates_array:np.ndarray, data:list) -> pd.DataFrame:
+    """
+    Transforms meteorological data of a batch of points into a dataframe with the columns date, latitude,
+    longitude, temperature, precipitation, air_humidity and wind_speed. The air humidity of a day is the
+    mean of its hourly values.
+    """
+    nb_days = len(data[0]['daily']['time'])
+    daily = {v: np.array([res['daily'][v] for res in data], dtype=np.float64) for v in DAILY_VARIABLES.split(',')}
+    # Hourly humidity of all points reshaped to (point, day, hour) then averaged by day
+    hourly_humidity = np.array([res['hourly'][HOURLY_VARIABLES] for res in data], dtype=np.float64)
+    air_humidity = hourly_humidity.reshape(len(data), nb_days, 24).mean(axis=2)
 
-    if r.status_code != 200:
-        print(r.json())
-        return None
-    
-    data = r.json()
+    return pd.DataFrame({
+        'date': np.tile(pd.to_datetime(data[0]['daily']['time']).to_numpy(), len(data)),
+        'latitude': np.repeat(coordinates_array[:, 0], nb_days),
+        'longitude': np.repeat(coordinates_array[:, 1], nb_days),
+        'temperature': daily['temperature_2m_max'].ravel(),
+        'precipitation': daily['precipitation_sum'].ravel(),
+        'air_humidity': air_humidity.ravel(),
+        'wind_speed': daily['wind_speed_10m_max'].ravel()
+    })
 
-    meteo_data = {
-        'time': [],
-        'latitude': [],
-        'longitude': [],
-        'T': [],
-        'P': [],
-        'H': [],
-        'U': []
-    }
+def get_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, show_progress=False,
+             max_workers=1, timeout:float=60, retries=3, max_url_length=OPEN_METEO_MAX_URL_LENGTH)->pd.DataFrame:
+    """
+    This function returns the dataSet of the needed meteorogical data within a specific geographical span and between a start date and end date
+    from the Open-Meteo archive API.
 
-    for i in range (len(data)):
-        res = data[i]
-        for j in range (len(res['daily']['time'])):
-            meteo_data['time'].append(res['daily']['time'][j])
-            meteo_data['latitude'].append(res['latitude'])
-            meteo_data['longitude'].append(res['longitude'])
-            meteo_data['T'].append(res['daily']['temperature_2m_max'][j])
-            meteo_data['P'].append(res['daily']['precipitation_sum'][j])
-            meteo_data['U'].append(res['daily']['wind_speed_10m_max'][j])
-    
-    #get humidity data
-    payload.pop('wind_speed_unit')
-    payload.update({'daily': 'relative_humidity_2m'})
-    payload['hourly'] = payload.pop('daily')
-    r = requests.get('https://archive-api.open-meteo.com/v1/archive', params=payload)
+    Parameters:
+    -----------
+    start_date: date
+        start date of the time range.
+    end_date: date
+        end date of the time range.
+    lat_min: float
+        minimum latitude of the geographical range.
+    lat_max: float
+        maximum latitude of the geographical range.
+    lng_min: float
+        minimum longitude of the geographical range.
+    lng_max: float
+        maximum longitude of the geographical range.
+    show_progress: bool
+        if set to True shows a progress bar. Default is False.
+    max_workers: int
+        maximum number of batches fetched concurrently over a shared pool of connections. Default is 1.
+    timeout: float
+        timeout of each request in seconds. Default is 60.
+    retries: int
+        maximum number of retries of each request, with an exponential backoff. Default is 3.
+    max_url_length: int
+        maximum length of the coordinates in the URL of a request, cells are fetched by batches under it.
+        Default is 2000.
+    """
+    coordinates_array = coordinates_selecter(lat_min=lat_min, lat_max=lat_max, lng_max=lng_max, lng_min=lng_min)
+    batches = split_coordinates_in_batches(coordinates_array, max_url_length)
 
-    if r.status_code != 200:
-        print('Error: ', r.status_code)
-        print(r.json())
-        return None
-    
-    data = r.json()
+    with make_session(pool_size=max_workers, retries=retries) as session, \
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Batches are fetched concurrently but kept in the same order as they were selected
+        responses = executor.map(lambda batch: get_batch_weather(batch, start_date, end_date, session=session, timeout=timeout), batches)
+        if show_progress:
+            responses = tqdm(responses, total=len(batches), desc='Fetching Meteo Data')
+        dfs = [batch_to_dataframe(batch, data) for batch, data in zip(batches, responses)]
 
-    for i in range (len(data)):
-        res = data[i]
-        for j in range (int(len(res['hourly']['time'])/24)):
-            humidity = res['hourly']['relative_humidity_2m'][j*24:(j+1)*24]
-            meteo_data['H'].append(np.mean(humidity))
-    
-    df = pd.DataFrame(meteo_data)
+    df = pd.concat(dfs, ignore_index=True)
 
     return df
@@ -1,10 +1,57 @@
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import concurrent.futures
+import threading
+import numpy as np
+import os
+import math
+from typing import Literal
 from tqdm import tqdm
 from datetime import date
 from utils.gfed_utils import coordinates_selecter
 
-def get_point_weather(latitude:float, longitude:float, start_date:str, end_date:str):
+POWER_URL = 'https://power.larc.nasa.gov/api/temporal/daily/point'
+POWER_REGIONAL_URL = 'https://power.larc.nasa.gov/api/temporal/daily/regional'
+REGIONAL_MIN_SIZE = 2 # Minimum size in degrees of each side of a regional request
+REGIONAL_MAX_SIZE = 10 # Maximum size in degrees of each side of a regional request
+REGIONAL_MAX_PARAMETERS = 1 # Maximum number of parameters of a regional request
+REGIONAL_PADDING = 0.5 # Margin in degrees around cells, so that their nearest points of the POWER grid (0.5° x 0.625°) are fetched
+PARAMETERS = 'T2M,WS10M,RH2M,PRECIPITATIONCAL' # Parameters fetched for each point
+POWER_CACHE_MAX_SIZE = 2**30 # Default maximum size in bytes of the local cache of points
+POWER_FILL_VALUE = -999 # Value of days that are not published yet by POWER
+# Column of the generated dataframe for each parameter
+PARAMETERS_COLUMNS = {'T2M': 'temperature', 'PRECIPITATIONCAL': 'precipitation', 'RH2M': 'air_humidity', 'WS10M': 'wind_speed'}
+
+def make_session(pool_size=10, retries=3, backoff_factor=0.5) -> requests.Session:
+    """
+    Creates an HTTP session keeping alive a pool of connections to the POWER API, which retries 
+    failed requests with an exponential backoff.
+
+    Parameters
+    ----------
+    pool_size : int
+        maximum number of connections kept alive. Default is 10.
+    retries : int
+        maximum number of retries of a request. Default is 3.
+    backoff_factor : float
+        factor of the exponential backoff in seconds between retries. Default is 0.5.
+
+    Returns
+    -------
+    out : requests.Session
+        the created session.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504], 
+                  allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_point_weather(latitude:float, longitude:float, start_date:str, end_date:str, session:requests.Session=None, timeout:float=None):
     """
     Fetch meteorological data for a specific geoggraphical point in a time range.
     
@@ -18,6 +65,10 @@ def get_point_weather(latitude:float, longitude:float, start_date:str, end_date:
         start date of the time range in format %Y%M%D.
     end_date: str
         end date of the time range in format %Y%M%D.
+    session: requests.Session
+        session to send the request with. Default is None (a new connection is opened).
+    timeout: float
+        timeout of the request in seconds. Default is None (no timeout).
     """
     payload = {
         'time-standard': 'UTC',
@@ -26,39 +77,348 @@ def get_point_weather(latitude:float, longitude:float, start_date:str, end_date:
         'start': start_date,
         'end': end_date,
         'community': 'AG',
-        'parameters': 'T2M,WS10M,RH2M,PRECIPITATIONCAL',
+        'parameters': PARAMETERS,
         'format': 'JSON'
     }
-    r = requests.get('https://power.larc.nasa.gov/api/temporal/daily/point', params=payload)
+    r = (session if session != None else requests).get(POWER_URL, params=payload, timeout=timeout)
+    r.raise_for_status()
     data = r.json()
     return data
     
-def fill_point_in_dict(point:dict, meteo_data:dict):
+def get_regional_weather(lat_min:float, lat_max:float, lng_min:float, lng_max:float, start_date:str, end_date:str, 
+                         parameters:str, session:requests.Session=None, timeout:float=None):
     """
-    Fill the meteo_data dict with meteorological data from a fetched geographical point.
-    
+    Fetch meteorological data for all points of the POWER grid within a geographical range in a time range.
+
+    Parameters
+    ----------
+    lat_min: float
+        minimum latitude of the geographical range.
+    lat_max: float
+        maximum latitude of the geographical range.
+    lng_min: float
+        minimum longitude of the geographical range.
+    lng_max: float
+        maximum longitude of the geographical range.
+    start_date: str
+        start date of the time range in format %Y%M%D.
+    end_date: str
+        end date of the time range in format %Y%M%D.
+    parameters: str
+        parameters to fetch separated by commas (at most REGIONAL_MAX_PARAMETERS).
+    session: requests.Session
+        session to send the request with. Default is None (a new connection is opened).
+    timeout: float
+        timeout of the request in seconds. Default is None (no timeout).
+
+    Returns
+    -------
+    out : dict
+        a GeoJSON feature collection, each feature is in the same format as a point response.
+    """
+    payload = {
+        'time-standard': 'UTC',
+        'latitude-min': lat_min,
+        'latitude-max': lat_max,
+        'longitude-min': lng_min,
+        'longitude-max': lng_max,
+        'start': start_date,
+        'end': end_date,
+        'community': 'AG',
+        'parameters': parameters,
+        'format': 'JSON'
+    }
+    r = (session if session != None else requests).get(POWER_REGIONAL_URL, params=payload, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+def split_regional_range(value_min:float, value_max:float, limit_min:float, limit_max:float) -> list:
+    """
+    Splits a range of latitudes or longitudes into spans accepted by regional requests: spans are at most 
+    REGIONAL_MAX_SIZE degrees, and are enlarged to REGIONAL_MIN_SIZE degrees (within limits) if smaller.
+    """
+    nb_spans = max(1, math.ceil((value_max - value_min) / REGIONAL_MAX_SIZE))
+    step = (value_max - value_min) / nb_spans
+    spans = []
+    for i in range(nb_spans):
+        span_min, span_max = value_min + i * step, value_min + (i + 1) * step
+        if span_max - span_min < REGIONAL_MIN_SIZE:
+            center = (span_min + span_max) / 2
+            span_min = min(max(center - REGIONAL_MIN_SIZE / 2, limit_min), limit_max - REGIONAL_MIN_SIZE)
+            span_max = span_min + REGIONAL_MIN_SIZE
+        spans.append((span_min, span_max))
+    return spans
+
+def get_regional_points(coordinates_array:np.ndarray, start_date:date, end_date:date, session:requests.Session=None, 
+                        timeout:float=None, executor:concurrent.futures.Executor=None, show_progress=False) -> list:
+    """
+    Fetch meteorological data for many cells with as few regional requests as possible, then maps 
+    each cell to its nearest point of the POWER grid.
+
+    Parameters
+    ----------
+    coordinates_array : numpy.ndarray
+        (latitude, longitude) of the center of each cell, as returned by coordinates_selecter.
+    start_date: date
+        start date of the time range.
+    end_date: date
+        end date of the time range.
+    session: requests.Session
+        session to send requests with. Default is None.
+    timeout: float
+        timeout of each request in seconds. Default is None.
+    executor: concurrent.futures.Executor
+        executor to send requests concurrently with. Default is None (requests are sent one after another).
+    show_progress: bool
+        if set to True shows a progress bar. Default is False.
+
+    Returns
+    -------
+    out : list
+        list of (coordinates, dates, values) tuples of each cell, in the same order as coordinates_array.
+    """
+    # Bounding box of the cells (with a margin), split into regional requests for each group of parameters
+    lat_spans = split_regional_range(max(coordinates_array[:, 0].min() - REGIONAL_PADDING, -90), 
+                                     min(coordinates_array[:, 0].max() + REGIONAL_PADDING, 90), -90, 90)
+    lng_spans = split_regional_range(max(coordinates_array[:, 1].min() - REGIONAL_PADDING, -180), 
+                                     min(coordinates_array[:, 1].max() + REGIONAL_PADDING, 180), -180, 180)
+    parameters = PARAMETERS.split(',')
+    parameters_groups = [','.join(parameters[i:i + REGIONAL_MAX_PARAMETERS]) for i in range(0, len(parameters), REGIONAL_MAX_PARAMETERS)]
+    regional_requests = [(lat_span, lng_span, group) for lat_span in lat_spans for lng_span in lng_spans for group in parameters_groups]
+
+    def fetch_region(regional_request):
+        (lat_min, lat_max), (lng_min, lng_max), group = regional_request
+        return group, get_regional_weather(lat_min, lat_max, lng_min, lng_max, start_date.strftime('%Y%m%d'), 
+                                           end_date.strftime('%Y%m%d'), group, session=session, timeout=timeout)
+
+    responses = executor.map(fetch_region, regional_requests) if executor != None else map(fetch_region, regional_requests)
+    if show_progress:
+        responses = tqdm(responses, total=len(regional_requests), desc='Fetching Meteo Data')
+
+    # Gather parameters of each point of the POWER grid
+    grid_points = {}
+    for group, response in responses:
+        for feature in response['features']:
+            coordinates, dates, values = point_to_arrays(feature, parameters=group)
+            grid_points.setdefault((coordinates[0], coordinates[1]), (dates, {}))[1].update(values)
+
+    # Map each cell to its nearest point of the grid
+    grid_coordinates = np.array(list(grid_points.keys())) # (longitude, latitude) of each point
+    grid_values = list(grid_points.values())
+    distances = (coordinates_array[:, 0:1] - grid_coordinates[:, 1])**2 + (coordinates_array[:, 1:2] - grid_coordinates[:, 0])**2
+    nearest_points = [grid_values[j] for j in np.argmin(distances, axis=1)]
+
+    return [(np.array([c[1], c[0]]), dates, values) for c, (dates, values) in zip(coordinates_array, nearest_points)]
+
+def get_cache_path(cache_folder:str, latitude:float, longitude:float, parameters=PARAMETERS) -> str:
+    """Gets the path of the cache file of a geographical point for a set of parameters."""
+    return os.path.join(cache_folder, f"power_{latitude}_{longitude}_{parameters.replace(',', '_')}.npz")
+
+def read_cached_point(path:str):
+    """
+    Reads the cache file of a geographical point.
+
+    Parameters
+    ----------
+    path : str
+        path of the cache file.
+
+    Returns
+    -------
+    coordinates : numpy.ndarray | None
+        coordinates of the point as returned by the API, None if the point is not cached.
+    dates : numpy.ndarray
+        cached days (datetime64[D]), sorted.
+    values : dict
+        array of cached values for each parameter, aligned with dates.
+    """
+    try:
+        with np.load(path) as cached:
+            values = {k: cached[k] for k in cached.files if k not in ('coordinates', 'dates')}
+            coordinates, dates = cached['coordinates'], cached['dates']
+        os.utime(path) # Mark the file as recently used
+        return coordinates, dates, values
+    except FileNotFoundError: # Not cached (or evicted)
+        return None, np.array([], dtype='datetime64[D]'), {}
+
+def drop_fill_values(dates:np.ndarray, values:dict):
+    """Removes the days with a fill value (not published yet) for any parameter, so that they are fetched again later."""
+    valid = np.ones(dates.shape[0], dtype=bool)
+    for v in values.values():
+        valid &= v != POWER_FILL_VALUE
+    return dates[valid], {p: v[valid] for p, v in values.items()}
+
+def write_cached_point(path:str, coordinates:np.ndarray, dates:np.ndarray, values:dict):
+    """Writes the cache file of a geographical point, the file is replaced atomically."""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.savez_compressed(f, coordinates=coordinates, dates=dates, **values)
+    os.replace(temp_path, path)
+
+def evict_cache(cache_folder:str, max_cache_size:int):
+    """
+    Deletes least recently used cache files until the total size of the cache is under a limit.
+
+    Parameters
+    ----------
+    cache_folder : str
+        path of the folder of the cache.
+    max_cache_size : int
+        maximum size of the cache in bytes.
+    """
+    files = []
+    for entry in os.scandir(cache_folder):
+        if entry.name.startswith('power_') and entry.name.endswith('.npz'):
+            try:
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError: # Evicted by another thread
+                pass
+
+    total_size = sum(f[1] for f in files)
+    for _, size, path in sorted(files):
+        if total_size <= max_cache_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+def get_missing_ranges(start_date:date, end_date:date, dates:np.ndarray) -> list:
+    """
+    Gets the contiguous ranges of days of a time range that are not in an array of days.
+
     Parameters
     ----------
-    point : dict
-        meteorological data of a specific geographical point.
-    meteo_data : dict
-        dict to fill with the point data.
+    start_date : date
+        start date of the time range.
+    end_date : date
+        end date of the time range.
+    dates : numpy.ndarray
+        available days (datetime64[D]).
+
+    Returns
+    -------
+    out : list
+        list of (start date, end date) tuples of the missing ranges.
+    """
+    days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    missing = days[~np.isin(days, dates)]
+    if missing.shape[0] == 0:
+        return []
+    # Split missing days where they are not consecutive
+    breaks = np.nonzero(np.diff(missing) != np.timedelta64(1, 'D'))[0]
+    starts = np.concatenate((missing[:1], missing[breaks + 1]))
+    ends = np.concatenate((missing[breaks], missing[-1:]))
+    return [(s.astype(date), e.astype(date)) for s, e in zip(starts, ends)]
+
+def point_to_arrays(point:dict, parameters=PARAMETERS):
+    """
+    Transforms meteorological data of a fetched geographical point into arrays.
+
+    Returns
+    -------
+    coordinates : numpy.ndarray
+        coordinates of the point as returned by the API.
+    dates : numpy.ndarray
+        days of the data (datetime64[D]).
+    values : dict
+        array of values for each parameter, aligned with dates.
     """
     res = point['properties']['parameter']
+    keys = list(res[parameters.split(',')[0]].keys())
+    # Parse all days at once, parameters share the same days in the same order
+    dates = pd.to_datetime(keys, format='%Y%m%d').to_numpy().astype('datetime64[D]')
+    values = {p: np.fromiter(res[p].values(), dtype=np.float64, count=len(keys)) for p in parameters.split(',')}
+    return np.array(point['geometry']['coordinates'], dtype=np.float64), dates, values
+
+def get_point_weather_cached(latitude:float, longitude:float, start_date:date, end_date:date, cache_folder:str, 
+                             session:requests.Session=None, timeout:float=None):
+    """
+    Fetch meteorological data for a specific geographical point in a time range, using a local cache of 
+    fetched days. Only the days that are not cached are requested, then added to the cache. Days with fill 
+    values (not published yet) are returned but not cached.
+
+    Parameters
+    ----------
+    latitude : float
+        latitude of the geographical point.
+    longitude : float
+        longitude of the geographical point.
+    start_date: date
+        start date of the time range.
+    end_date: date
+        end date of the time range.
+    cache_folder: str
+        path of the folder where to store cached points.
+    session: requests.Session
+        session to send requests with. Default is None.
+    timeout: float
+        timeout of each request in seconds. Default is None.
+
+    Returns
+    -------
+    coordinates : numpy.ndarray
+        coordinates of the point as returned by the API.
+    dates : numpy.ndarray
+        days of the time range (datetime64[D]).
+    values : dict
+        array of values for each parameter, aligned with dates.
+    """
+    path = get_cache_path(cache_folder, latitude, longitude)
+    coordinates, dates, values = read_cached_point(path)
+    # Fill values cached by older versions are fetched again
+    dates, values = drop_fill_values(dates, values)
+
+    missing_ranges = get_missing_ranges(start_date, end_date, dates)
+    for missing_start, missing_end in missing_ranges:
+        point = get_point_weather(latitude, longitude, missing_start.strftime('%Y%m%d'), missing_end.strftime('%Y%m%d'), 
+                                  session=session, timeout=timeout)
+        coordinates, new_dates, new_values = point_to_arrays(point)
+        dates = np.concatenate((dates, new_dates))
+        values = {p: np.concatenate((values.get(p, np.array([])), new_values[p])) for p in new_values.keys()}
+
+    if len(missing_ranges) > 0:
+        # Keep cached days sorted and unique
+        dates, unique_index = np.unique(dates, return_index=True)
+        values = {p: v[unique_index] for p, v in values.items()}
+        write_cached_point(path, coordinates, *drop_fill_values(dates, values))
+
+    # Select the requested days
+    in_range = (dates >= np.datetime64(start_date, 'D')) & (dates <= np.datetime64(end_date, 'D'))
+    return coordinates, dates[in_range], {p: v[in_range] for p, v in values.items()}
+
+def points_to_dataframe(points:list) -> pd.DataFrame:
+    """
+    Concatenates meteorological data of many geographical points into one dataframe.
     
-    # append the time 
-    for elem in list(res['T2M'].keys()):
-        meteo_data['date'].append(elem)
+    Parameters
+    ----------
+    points : list
+        list of (coordinates, dates, values) tuples of each point, as returned by point_to_arrays.
 
-    for j in range (len(res['T2M'])):
-        meteo_data['longitude'].append(point['geometry']['coordinates'][0])
-        meteo_data['latitude'].append(point['geometry']['coordinates'][1])
-        meteo_data['temperature'].append(res['T2M'][meteo_data['date'][j]])
-        meteo_data['precipitation'].append(res['PRECIPITATIONCAL'][meteo_data['date'][j]])
-        meteo_data['wind_speed'].append(res['WS10M'][meteo_data['date'][j]])
-        meteo_data['air_humidity'].append(res['RH2M'][meteo_data['date'][j]])
+    Returns
+    -------
+    out : pandas.DataFrame
+        a dataframe with the columns date, latitude, longitude, temperature, precipitation, air_humidity 
+        and wind_speed.
+    """
+    nb_days = [p[1].shape[0] for p in points]
+    meteo_data = {
+        'date': np.concatenate([p[1] for p in points] + [np.array([], dtype='datetime64[D]')]).astype('datetime64[ns]'),
+        'latitude': np.repeat(np.array([p[0][1] for p in points], dtype=np.float64), nb_days),
+        'longitude': np.repeat(np.array([p[0][0] for p in points], dtype=np.float64), nb_days)
+    }
+    for parameter, column in PARAMETERS_COLUMNS.items():
+        meteo_data[column] = np.concatenate([p[2][parameter] for p in points] + [np.array([])])
+    # Keep the columns order of the dataset
+    columns = ['date', 'latitude', 'longitude', 'temperature', 'precipitation', 'air_humidity', 'wind_speed']
+    return pd.DataFrame({c: meteo_data[c] for c in columns})
 
-def get_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, show_progress=False)->pd.DataFrame:
+def get_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_min:float, lng_max:float, show_progress=False,
+             max_workers=1, timeout:float=60, retries=3, cache_folder:str=None, max_cache_size=POWER_CACHE_MAX_SIZE, 
+             mode:Literal['point', 'regional']='point')->pd.DataFrame:
     """
     This function returns the dataSet of the needed meteorogical data within a specific geographical span and between a start date and end date 
 
@@ -78,34 +438,53 @@ def get_data(start_date:date, end_date:date, lat_min:float, lat_max:float, lng_m
         maximum longitude of the geographical range.
     show_progress: bool
         if set to True shows a progress bar. Default is False.
+    max_workers: int
+        maximum number of points fetched concurrently over a shared pool of connections. Default is 1.
+    timeout: float
+        timeout of each request in seconds. Default is 60.
+    retries: int
+        maximum number of retries of each request, with an exponential backoff. Default is 3.
+    cache_folder: str
+        path of the folder where to cache fetched points, only days missing from the cache are fetched. 
+        Default is None (no cache).
+    max_cache_size: int
+        maximum size of the cache in bytes. Default is 1 GiB.
+    mode: str
+        'point' fetches each cell with its own request, 'regional' covers all cells with as few regional 
+        requests as possible and maps each cell to its nearest point of the POWER grid (the cache is not 
+        used). Default is 'point'.
     """
 
-    # Transform the dates into the required format
-    start_date = f"{start_date.year}{start_date.month}{start_date.day}"
-    end_date = f"{end_date.year}{end_date.month}{end_date.day}"    
-        
-    meteo_data = {
-        'date': [],
-        'latitude': [],
-        'longitude': [],
-        'temperature': [],
-        'precipitation': [],
-        'air_humidity': [],
-        'wind_speed': []
-    }
+    if cache_folder != None:
+        os.makedirs(cache_folder, exist_ok=True)
 
     coordinates_array = coordinates_selecter(lat_min=lat_min, lat_max=lat_max, lng_max=lng_max, lng_min=lng_min)
 
-    # Create a range for the loop
-    rng = range(len(coordinates_array))
-    if show_progress:
-        rng = tqdm(range(len(coordinates_array)), desc='Fetching Meteo Data')
+    with make_session(pool_size=max_workers, retries=retries) as session, \
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if mode == 'regional':
+            points = get_regional_points(coordinates_array, start_date, end_date, session=session, timeout=timeout, 
+                                         executor=executor, show_progress=show_progress)
+            return points_to_dataframe(points)
+
+        def fetch_point(coordinates):
+            if cache_folder != None:
+                return get_point_weather_cached(coordinates[0], coordinates[1], start_date, end_date, cache_folder, 
+                                                session=session, timeout=timeout)
+            return point_to_arrays(get_point_weather(coordinates[0], coordinates[1], start_date.strftime('%Y%m%d'), 
+                                                     end_date.strftime('%Y%m%d'), session=session, timeout=timeout))
+
+        # Points are fetched concurrently but kept in the same order as they were selected
+        points = executor.map(fetch_point, coordinates_array)
+        if show_progress:
+            points = tqdm(points, total=len(coordinates_array), desc='Fetching Meteo Data')
+        points = list(points)
 
-    for i in rng:
-        data = get_point_weather(coordinates_array[i][0], coordinates_array[i][1], start_date, end_date)
-        fill_point_in_dict(data, meteo_data)
+    # Evict least recently used points once all points are cached
+    if cache_folder != None:
+        evict_cache(cache_folder, max_cache_size)
 
-    df = pd.DataFrame(meteo_data)
-    df['date'] = pd.to_datetime(df['date'])
+    # Concatenate arrays of all points once
+    df = points_to_dataframe(points)
 
     return df
\ No newline at end of file